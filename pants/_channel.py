@@ -32,6 +32,7 @@ import sys
 import time
 
 from pants.engine import Engine
+from pants.util.mmsg import recvmmsg, sendmmsg
 from pants.util.sendfile import sendfile
 
 dns = None
@@ -75,6 +76,18 @@ if socket.has_ipv6:
 SUPPORTED_FAMILIES = tuple(SUPPORTED_FAMILIES)
 SUPPORTED_TYPES = (socket.SOCK_STREAM, socket.SOCK_DGRAM)
 
+# TCP options used by servers and streams to save round trips. Older
+# versions of the socket module don't define them, so fall back to the
+# values from the Linux headers. They are None where unsupported.
+if sys.platform.startswith("linux"):
+    TCP_DEFER_ACCEPT = getattr(socket, "TCP_DEFER_ACCEPT", 9)
+    TCP_FASTOPEN = getattr(socket, "TCP_FASTOPEN", 23)
+    TCP_FASTOPEN_CONNECT = getattr(socket, "TCP_FASTOPEN_CONNECT", 30)
+else:
+    TCP_DEFER_ACCEPT = None
+    TCP_FASTOPEN = None
+    TCP_FASTOPEN_CONNECT = None
+
 if sys.platform == "win32":
     FAMILY_ERROR = (10047, "WSAEAFNOSUPPORT")
     NAME_ERROR = (11001, "WSAHOST_NOT_FOUND")
@@ -366,7 +379,10 @@ class _Channel(object):
         if sock_type(sock) not in SUPPORTED_TYPES:
             raise ValueError("Unsupported socket type.")
 
-        sock.setblocking(False)
+        # Sockets that are already non-blocking, such as those a server
+        # has prepared for an SSL handshake, don't need another fcntl().
+        if sock.gettimeout() != 0.0:
+            sock.setblocking(False)
         self._socket = sock
 
     def _socket_connect(self, addr):
@@ -430,6 +446,32 @@ class _Channel(object):
 
         self._socket.listen(backlog)
 
+    def _socket_set_tcp_option(self, option, value):
+        """
+        Set a TCP-level option on the socket, if the platform supports
+        it.
+
+        Returns True if the option was set, False otherwise.
+
+        =========  ============
+        Argument   Description
+        =========  ============
+        option     The option to set, or None if it is unsupported.
+        value      The value to set the option to.
+        =========  ============
+        """
+        if option is None:
+            return False
+
+        try:
+            self._socket.setsockopt(socket.IPPROTO_TCP, option, value)
+        except socket.error as err:
+            log.debug("Unable to set TCP option %d on %r: %s" %
+                      (option, self, err))
+            return False
+
+        return True
+
     def _socket_close(self):
         """
         Close the socket.
@@ -522,7 +564,10 @@ class _Channel(object):
         try:
             return self._socket.send(data)
         except Exception as err:
-            if err.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+            # EINPROGRESS is raised by a TCP Fast Open socket that has
+            # no cookie for the server yet and has sent a plain SYN.
+            if err.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK,
+                    errno.EINPROGRESS):
                 self._start_waiting_for_write_event()
                 return 0
             elif err.args[0] == errno.EPIPE:
@@ -557,6 +602,53 @@ class _Channel(object):
             else:
                 raise
 
+    def _socket_recvmmsg(self, buffers):
+        """
+        Receive a batch of datagrams from the socket.
+
+        Returns a list of ``(data, address)`` 2-tuples, which is empty if
+        no data was received.
+
+        =========  ============
+        Argument   Description
+        =========  ============
+        buffers    The :class:`~pants.util.mmsg.MMsgBuffers` to use.
+        =========  ============
+        """
+        try:
+            return recvmmsg(self._socket.fileno(), buffers)
+        except socket.error as err:
+            if err.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK,
+                    errno.ECONNRESET):
+                return []
+            else:
+                raise
+
+    def _socket_sendmmsg(self, buffers, packets):
+        """
+        Send a batch of datagrams to remote sockets.
+
+        Returns the number of datagrams that were sent.
+
+        =========  ============
+        Argument   Description
+        =========  ============
+        buffers    The :class:`~pants.util.mmsg.MMsgBuffers` to use.
+        packets    A sequence of ``(data, address)`` 2-tuples.
+        =========  ============
+        """
+        try:
+            return sendmmsg(self._socket.fileno(), buffers, packets)
+        except socket.error as err:
+            if err.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                self._start_waiting_for_write_event()
+                return 0
+            elif err.args[0] == errno.EPIPE:
+                self.close(flush=False)
+                return 0
+            else:
+                raise
+
     def _socket_sendfile(self, sfile, offset, nbytes, fallback=False):
         """
         Send data from a file to a remote socket.
@@ -812,8 +904,9 @@ class _Channel(object):
             log.warning("Received events for closed %r." % self)
             return
 
+        # Reading may have been paused, in which case it stays that way.
         previous_events = self._events
-        self._events = Engine.BASE_EVENTS
+        self._events = Engine.BASE_EVENTS & (previous_events | ~Engine.READ)
 
         if events & Engine.READ:
             self._handle_read_event()
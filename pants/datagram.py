@@ -23,11 +23,21 @@ Low-level implementations of packet-oriented channels.
 # Imports
 ###############################################################################
 
+import errno
 import re
 import socket
 import struct
+import sys
+
+import ctypes
+
+from collections import deque
+from itertools import islice
 
 from pants._channel import _Channel
+from pants.util.mmsg import (CONTROL_SIZE, GRO_BUFFER_SIZE, HAS_MMSG,
+                              HAS_UDP_OFFLOAD, MMsgBuffers, SOL_UDP,
+                              UDP_GRO, UDP_MAX_SEGMENTS, UDP_SEGMENT)
 
 
 ###############################################################################
@@ -37,6 +47,31 @@ from pants._channel import _Channel
 RegexType = type(re.compile(""))
 Struct = struct.Struct
 
+# The most data a single UDP datagram can carry over IPv4.
+UDP_MAX_PAYLOAD = 65507
+
+# Errors that mean the kernel or device can't segment a send.
+GSO_ERRORS = (errno.EINVAL, errno.EIO, errno.ENOPROTOOPT, errno.EOPNOTSUPP)
+
+# Socket options for sharing a port between sockets. Older versions of
+# the socket module don't define them, so fall back to the values from
+# the Linux headers.
+if sys.platform.startswith("linux"):
+    SO_REUSEPORT = getattr(socket, "SO_REUSEPORT", 15)
+    SO_ATTACH_REUSEPORT_CBPF = 51
+else:
+    SO_REUSEPORT = getattr(socket, "SO_REUSEPORT", None)
+    SO_ATTACH_REUSEPORT_CBPF = None
+
+# Classic BPF, for steering datagrams within a SO_REUSEPORT group.
+BPF_LD_W_ABS = 0x20
+BPF_ALU_MOD_K = 0x94
+BPF_RET_A = 0x16
+SKF_AD_CPU = 0xfffff000 + 36
+
+_sock_filter = struct.Struct("@HBBI")
+_sock_fprog = struct.Struct("@HP")
+
 ###############################################################################
 # Logging
 ###############################################################################
@@ -58,6 +93,9 @@ class Datagram(_Channel):
     ==================  ============
     family              *Optional.* A supported socket family. By default, is :const:`socket.AF_INET`.
     socket              *Optional.* A pre-existing socket to wrap.
+    batch_size          *Optional.* If greater than 1 and the platform supports it, move up to this many datagrams per system call using ``recvmmsg()`` and ``sendmmsg()``. Defaults to 0, meaning one datagram per call.
+    packet_mode         *Optional.* If True, each datagram is passed straight to :meth:`on_read` as ``on_read(data, address)``. Nothing is buffered, :attr:`read_delimiter` is ignored and :attr:`remote_address` is not set. Defaults to False.
+    gro                 *Optional.* If True and the platform supports it, enable UDP generic receive offload. The kernel delivers runs of datagrams from one sender as a single buffer, which is split back into the original datagrams before they are read. Defaults to False.
     ==================  ============
     """
     def __init__(self, **kwargs):
@@ -79,7 +117,31 @@ class Datagram(_Channel):
         self.regex_search = True
         self._recv_buffer = {}
         self._recv_buffer_size_limit = 2 ** 16  # 64kb
-        self._send_buffer = []
+        self._send_buffer = deque()
+        self.packet_mode = kwargs.get("packet_mode", False)
+
+        # Batched I/O
+        self.batch_size = kwargs.get("batch_size", 0)
+        if HAS_MMSG and self.batch_size > 1:
+            self._mmsg_recv = MMsgBuffers(self.batch_size, self._recv_amount)
+            self._mmsg_send = MMsgBuffers(self.batch_size)
+        else:
+            self._mmsg_recv = None
+            self._mmsg_send = None
+
+        # Segmentation offload. _gso_size tracks the socket's UDP_SEGMENT
+        # value, and is None where segmentation isn't available.
+        self._gso_size = 0 if HAS_UDP_OFFLOAD else None
+        self.gro = False
+        if kwargs.get("gro", False) and HAS_MMSG:
+            try:
+                self._socket.setsockopt(SOL_UDP, UDP_GRO, 1)
+            except socket.error as err:
+                log.debug("Unable to enable UDP_GRO on %r: %s" % (self, err))
+            else:
+                self.gro = True
+                self._mmsg_recv = MMsgBuffers(max(self.batch_size, 1),
+                                              GRO_BUFFER_SIZE, CONTROL_SIZE)
 
         # Channel state
         self.listening = False
@@ -87,18 +149,92 @@ class Datagram(_Channel):
 
     ##### Control Methods #####################################################
 
-    def listen(self, addr):
+    @classmethod
+    def listen_group(cls, addr, count, engines=None, steering=None,
+                     **kwargs):
         """
-        Begin listening for packets sent to the channel.
-
-        Returns the channel.
+        Create a group of channels listening for packets on the same
+        address, with ``SO_REUSEPORT``. The kernel spreads incoming
+        datagrams across the group, so the load can be shared between
+        several engines.
+
+        Returns a list of the new channels, in the order they were bound.
+
+        To share a port between worker processes instead, call
+        :meth:`listen` with ``reuse_port=True`` in each worker.
+
+        By default, the kernel picks a channel by hashing each
+        datagram's addresses and ports. If ``steering`` is ``"cpu"``,
+        datagrams are instead sent to the channel whose index matches
+        the CPU that received them, modulo ``count``, which works well
+        with one engine per CPU and receive queues pinned to CPUs.
+        ``steering`` may also be a custom classic BPF program, given as
+        a list of ``(code, jt, jf, k)`` tuples, that returns an index
+        into the group. If the program can't be attached, a warning is
+        logged and the kernel's hashing is used.
 
         ==========  ============
         Arguments   Description
         ==========  ============
         addr        The local address to listen for packets on.
+        count       The number of channels to create.
+        engines     *Optional.* A list of engines. The channels are
+                    added to them in turn. By default, every channel is
+                    added to the global engine.
+        steering    *Optional.* ``"cpu"`` or a classic BPF program.
+        kwargs      Passed on to each channel's constructor.
         ==========  ============
         """
+        if SO_REUSEPORT is None:
+            raise RuntimeError("SO_REUSEPORT is not supported on this "
+                "platform.")
+
+        channels = []
+        try:
+            for i in xrange(count):
+                if engines:
+                    kwargs["engine"] = engines[i % len(engines)]
+                channel = cls(**kwargs).listen(addr, reuse_port=True)
+                channels.append(channel)
+
+                # Later channels must share the first one's port.
+                addr = channel.local_address
+
+        except Exception:
+            for channel in channels:
+                channel.close(flush=False)
+            raise
+
+        if steering is not None and channels:
+            if steering == "cpu":
+                steering = [
+                    (BPF_LD_W_ABS, 0, 0, SKF_AD_CPU),
+                    (BPF_ALU_MOD_K, 0, 0, count),
+                    (BPF_RET_A, 0, 0, 0),
+                    ]
+
+            if not channels[0]._attach_steering(steering):
+                log.warning("Unable to attach a steering program to %r." %
+                    channels[0])
+
+        return channels
+
+    def listen(self, addr, reuse_port=False):
+        """
+        Begin listening for packets sent to the channel.
+
+        Returns the channel.
+
+        ===========  ============
+        Arguments    Description
+        ===========  ============
+        addr         The local address to listen for packets on.
+        reuse_port   *Optional.* If True, set ``SO_REUSEPORT`` so that
+                     other sockets, possibly in other processes, can
+                     listen on the same address and share its datagrams.
+                     Defaults to False.
+        ===========  ============
+        """
         if self.listening:
             raise RuntimeError("listen() called on listening %r." % self)
 
@@ -111,6 +247,12 @@ class Datagram(_Channel):
         except AttributeError:
             pass
 
+        if reuse_port:
+            if SO_REUSEPORT is None:
+                raise RuntimeError("SO_REUSEPORT is not supported on this "
+                    "platform.")
+            self._socket.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
+
         try:
             self._socket_bind(addr)
         except socket.error:
@@ -132,7 +274,7 @@ class Datagram(_Channel):
 
         self.read_delimiter = None
         self._recv_buffer = {}
-        self._send_buffer = []
+        self._send_buffer = deque()
 
         self.listening = False
         self._closing = False
@@ -186,6 +328,61 @@ class Datagram(_Channel):
         else:
             self._start_waiting_for_write_event()
 
+    def write_segments(self, segments, address=None, flush=False):
+        """
+        Write a sequence of datagrams to a single remote address.
+
+        Where the platform supports UDP generic segmentation offload,
+        the datagrams are passed to the kernel up to 64 at a time with
+        ``UDP_SEGMENT``, one system call per group. For that to happen,
+        every datagram but the last must be the same size, and the last
+        may not be larger. Otherwise, or if the kernel refuses, the
+        datagrams are written one at a time as if by :meth:`write`.
+
+        ==========  ============
+        Arguments   Description
+        ==========  ============
+        segments    A list of strings, one per datagram.
+        address     The remote address to write the data to.
+        flush       If True, flush the internal write buffer.
+        ==========  ============
+        """
+        if self._closed or self._closing:
+            log.warning("Attempted to write to closed %r." % self)
+            return
+
+        if address is None:
+            address = self.remote_address
+            if address is None:
+                log.warning("Attempted to write to %r with no remote "
+                    "address." % self)
+                return
+
+        if not segments:
+            return
+
+        size = len(segments[0])
+        per_send = min(UDP_MAX_SEGMENTS, UDP_MAX_PAYLOAD // max(size, 1))
+
+        if (self._gso_size is None or len(segments) < 2 or per_send < 2 or
+                len(segments[-1]) > size or
+                any(len(segment) != size for segment in segments[:-1])):
+            self._send_buffer.extend((segment, address)
+                                     for segment in segments)
+
+        else:
+            for i in xrange(0, len(segments), per_send):
+                group = segments[i:i + per_send]
+                if len(group) == 1:
+                    self._send_buffer.append((group[0], address))
+                else:
+                    self._send_buffer.append(("".join(group), address, size))
+
+        if flush:
+            self._process_send_buffer()
+        else:
+            self._start_waiting_for_write_event()
+
     def flush(self):
         """
         Attempt to immediately write any internally buffered data to the
@@ -209,6 +406,49 @@ class Datagram(_Channel):
         else:
             self.local_address = None
 
+    def _attach_steering(self, program):
+        """
+        Attach a classic BPF program to the socket's ``SO_REUSEPORT``
+        group, to choose which socket receives each datagram.
+
+        Returns False if the program couldn't be attached.
+        """
+        if SO_ATTACH_REUSEPORT_CBPF is None:
+            return False
+
+        code = ctypes.create_string_buffer(
+            "".join(_sock_filter.pack(*op) for op in program))
+        fprog = _sock_fprog.pack(len(program), ctypes.addressof(code))
+
+        try:
+            self._socket.setsockopt(socket.SOL_SOCKET,
+                                    SO_ATTACH_REUSEPORT_CBPF, fprog)
+        except socket.error as err:
+            log.debug("Unable to attach steering to %r: %s" % (self, err))
+            return False
+
+        return True
+
+    def _set_gso_size(self, size):
+        """
+        Set the socket's ``UDP_SEGMENT`` option, if it isn't set already.
+
+        Returns False if the option couldn't be set, in which case
+        segmentation offload is disabled for the channel.
+        """
+        if size == self._gso_size:
+            return True
+
+        try:
+            self._socket.setsockopt(SOL_UDP, UDP_SEGMENT, size)
+        except socket.error as err:
+            log.debug("Unable to set UDP_SEGMENT on %r: %s" % (self, err))
+            self._gso_size = None
+            return False
+
+        self._gso_size = size
+        return True
+
     ##### Internal Event Handler Methods ######################################
 
     def _handle_read_event(self):
@@ -223,6 +463,10 @@ class Datagram(_Channel):
             log.warning("Received read event for non-listening %r." % self)
             return
 
+        if self._mmsg_recv is not None:
+            self._handle_batched_read_event()
+            return
+
         while True:
             try:
                 data, addr = self._socket_recvfrom()
@@ -234,18 +478,61 @@ class Datagram(_Channel):
             if not data:
                 break
 
-            self._recv_buffer[addr] = self._recv_buffer.get(addr, '') + data
+            if self.packet_mode:
+                self._safely_call(self.on_read, data, addr)
+                if self._closed:
+                    return
 
-            if len(self._recv_buffer[addr]) > self._recv_buffer_size_limit:
-                e = DatagramBufferOverflow(
-                        "Buffer length exceeded upper limit on %r." % self,
-                        addr
-                    )
-                self._safely_call(self.on_overflow_error, e)
+            elif not self._buffer_packet(data, addr):
                 return
 
         self._process_recv_buffer()
 
+    def _handle_batched_read_event(self):
+        """
+        Handle a read event raised on the channel, receiving datagrams
+        in batches with ``recvmmsg()``.
+        """
+        while True:
+            try:
+                packets = self._socket_recvmmsg(self._mmsg_recv)
+            except socket.error:
+                log.exception("Exception raised by recvmmsg() on %r." % self)
+                self.close(flush=False)
+                return
+
+            for data, addr in packets:
+                if self.packet_mode:
+                    self._safely_call(self.on_read, data, addr)
+                    if self._closed:
+                        return
+
+                elif not self._buffer_packet(data, addr):
+                    return
+
+            if len(packets) < self._mmsg_recv.count:
+                break
+
+        self._process_recv_buffer()
+
+    def _buffer_packet(self, data, addr):
+        """
+        Add a received datagram to the receive buffer for its sender.
+
+        Returns False if the buffer overflowed.
+        """
+        self._recv_buffer[addr] = self._recv_buffer.get(addr, '') + data
+
+        if len(self._recv_buffer[addr]) > self._recv_buffer_size_limit:
+            e = DatagramBufferOverflow(
+                    "Buffer length exceeded upper limit on %r." % self,
+                    addr
+                )
+            self._safely_call(self.on_overflow_error, e)
+            return False
+
+        return True
+
     def _handle_write_event(self):
         """
         Handle a write event raised on the channel.
@@ -347,20 +634,30 @@ class Datagram(_Channel):
         :meth:`~pants.datagram.Datagram.on_write` when sending has
         finished.
         """
-        while self._send_buffer:
-            data, addr = self._send_buffer.pop(0)
+        if self._mmsg_send is not None:
+            self._process_batched_send_buffer()
+        else:
+            while self._send_buffer:
+                if len(self._send_buffer[0]) == 3:
+                    if not self._send_segments(*self._send_buffer.popleft()):
+                        break
+                    continue
 
-            while data:
-                bytes_sent = self._socket_sendto(data, addr)
-                self.listening = True
-                self._update_addr()
-                if bytes_sent == 0:
-                    break
-                data = data[bytes_sent:]
+                data, addr = self._send_buffer.popleft()
+                if self._gso_size and len(data) > self._gso_size:
+                    self._set_gso_size(0)
 
-            if data:
-                self._send_buffer.insert(0, (data, addr))
-                break
+                while data:
+                    bytes_sent = self._socket_sendto(data, addr)
+                    self.listening = True
+                    self._update_addr()
+                    if bytes_sent == 0:
+                        break
+                    data = data[bytes_sent:]
+
+                if data:
+                    self._send_buffer.appendleft((data, addr))
+                    break
 
         if not self._send_buffer:
             self._safely_call(self.on_write)
@@ -368,6 +665,89 @@ class Datagram(_Channel):
             if self._closing:
                 self.close(flush=False)
 
+    def _process_batched_send_buffer(self):
+        """
+        Pass outgoing data to
+        :meth:`~pants._channel._Channel._socket_sendmmsg` in batches of
+        up to :attr:`batch_size` datagrams.
+        """
+        buf = self._send_buffer
+        count = self._mmsg_send.count
+
+        while buf:
+            if len(buf[0]) == 3:
+                if not self._send_segments(*buf.popleft()):
+                    break
+                continue
+
+            packets = []
+            for entry in islice(buf, count):
+                if len(entry) == 3:
+                    break
+                packets.append(entry)
+
+            if self._gso_size:
+                self._set_gso_size(0)
+
+            try:
+                sent = self._socket_sendmmsg(self._mmsg_send, packets)
+            except ValueError:
+                # The first address isn't numeric. Send that datagram
+                # the slow way.
+                data, addr = packets[0]
+                if self._socket_sendto(data, addr) == 0:
+                    break
+                packets = packets[:1]
+                sent = 1
+
+            if not self.listening:
+                self.listening = True
+                self._update_addr()
+
+            for i in xrange(sent):
+                buf.popleft()
+
+            # A short batch stops at an address that isn't numeric, or
+            # where the socket filled up. Carry on; the next call sends
+            # that datagram the slow way or finds the socket full and
+            # waits for a write event.
+            if sent == 0:
+                break
+
+    def _send_segments(self, data, addr, size):
+        """
+        Send a buffer of datagrams of the given size to a remote socket
+        with a single call, using UDP generic segmentation offload.
+
+        If the kernel can't segment the buffer, the individual datagrams
+        are put back at the front of the send buffer instead. Returns
+        False if the socket can't accept more data for now.
+        """
+        if self._gso_size is not None and self._set_gso_size(size):
+            try:
+                bytes_sent = self._socket_sendto(data, addr)
+            except socket.error as err:
+                if err.args[0] not in GSO_ERRORS:
+                    raise
+
+                log.debug("Disabling UDP_SEGMENT on %r: %s" % (self, err))
+                self._set_gso_size(0)
+                self._gso_size = None
+
+            else:
+                if bytes_sent == 0:
+                    self._send_buffer.appendleft((data, addr, size))
+                    return False
+
+                if not self.listening:
+                    self.listening = True
+                    self._update_addr()
+                return True
+
+        self._send_buffer.extendleft(reversed(
+            [(data[i:i + size], addr) for i in xrange(0, len(data), size)]))
+        return True
+
 
 ###############################################################################
 # DatagramBufferOverflow Exception
@@ -20,6 +20,7 @@
 # Imports
 ###############################################################################
 
+from pants.http.accesslog import AccessLog, Histogram
 from pants.http.client import *
 from pants.http.server import *
 from pants.http.websocket import WebSocket, EntireMessage
@@ -0,0 +1,333 @@
+###############################################################################
+#
+# Copyright 2012 Pants Developers (see AUTHORS.txt)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+"""
+An access log for :class:`~pants.http.server.HTTPServer`, which writes a
+JSON line for each finished request and keeps latency histograms for
+every route and status code.
+
+Example Usage::
+
+    from pants.http import HTTPServer
+    from pants.http.accesslog import AccessLog
+
+    log = AccessLog('access.log', route_samples={'health': 0.01})
+    HTTPServer(app, access_log=log).listen(8080)
+
+Lines are collected in memory and handed to a writer thread every
+``flush_interval`` seconds, or sooner once ``buffer_size`` bytes are
+waiting, so the engine never waits for the disk. If the writer falls
+behind by more than ``queue_size`` batches, further batches are dropped
+and counted in :attr:`AccessLog.dropped` rather than held in memory.
+"""
+
+###############################################################################
+# Imports
+###############################################################################
+
+import json
+import Queue
+import random
+import threading
+
+from bisect import bisect_left
+
+from pants.engine import Engine
+from pants.http.utils import log
+
+
+###############################################################################
+# Constants
+###############################################################################
+
+# The upper bounds, in seconds, of the buckets of a latency histogram. The
+# last bucket holds everything slower.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+
+###############################################################################
+# Histogram Class
+###############################################################################
+
+class Histogram(object):
+    """
+    A histogram of observed values, counted in fixed buckets.
+
+    =========  ================  ============
+    Argument   Default           Description
+    =========  ================  ============
+    bounds     LATENCY_BUCKETS   *Optional.* The sorted upper bounds of the buckets. Values above the last bound are counted in an extra bucket.
+    =========  ================  ============
+    """
+    __slots__ = ('bounds', 'counts', 'count', 'total')
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def __repr__(self):
+        return '<Histogram count=%d mean=%.6f>' % (self.count, self.mean)
+
+    def add(self, value):
+        """
+        Count a value in its bucket.
+        """
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    @property
+    def mean(self):
+        """
+        The mean of the values that have been added, or 0 if there are none.
+        """
+        if not self.count:
+            return 0.0
+        return self.total / self.count
+
+    def quantile(self, q):
+        """
+        Return the upper bound of the bucket holding the given quantile, from
+        0 to 1, of the values added, or None if it lies in the last bucket.
+        Returns 0 if no values have been added.
+        """
+        if not self.count:
+            return 0.0
+
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+
+    def to_dict(self):
+        """
+        Return the histogram as a dictionary that can be serialized as JSON.
+        """
+        return {
+            'bounds': list(self.bounds),
+            'counts': list(self.counts),
+            'count': self.count,
+            'total': self.total,
+            }
+
+
+###############################################################################
+# AccessLog Class
+###############################################################################
+
+class AccessLog(object):
+    """
+    Record every request finished by an :class:`~pants.http.server.HTTPServer`
+    it's given to as ``access_log``.
+
+    Each request is counted in :attr:`by_route`, a dictionary of latency
+    :class:`Histogram` instances keyed by the request's ``route_name``,
+    which an :class:`~pants.web.application.Application` sets, or None.
+    It's also counted in :attr:`by_status`, keyed by the response's status
+    code. Times to the first byte of the response are counted in
+    :attr:`first_byte`, and the size of the responses in :attr:`bytes_sent`.
+
+    A sampled share of requests is also written to ``output`` as JSON lines.
+    Responses with a status of 500 or more are always written.
+
+    ==============  ========  ============
+    Argument        Default   Description
+    ==============  ========  ============
+    output          None      *Optional.* The path of a file to append lines to, or a file object to write them to. If None, no lines are written, but requests are still counted.
+    sample          1.0       *Optional.* The share of requests, from 0 to 1, that lines are written for.
+    route_samples   None      *Optional.* A dictionary of shares to use instead of ``sample`` for requests to the given routes, for endpoints with too many requests to log each one.
+    flush_interval  1.0       *Optional.* The number of seconds lines are collected for before being written.
+    buffer_size     65536     *Optional.* The number of bytes of lines after which they're written without waiting for ``flush_interval``.
+    queue_size      64        *Optional.* The number of batches of lines that may be waiting for the writer thread before more are dropped.
+    engine          None      *Optional.* The :class:`~pants.engine.Engine` to schedule writes with. Defaults to the global engine.
+    ==============  ========  ============
+    """
+    def __init__(self, output=None, sample=1.0, route_samples=None,
+                 flush_interval=1.0, buffer_size=65536, queue_size=64,
+                 engine=None):
+        self.engine = engine or Engine.instance()
+        self.sample = sample
+        self.route_samples = route_samples or {}
+        self.flush_interval = flush_interval
+        self.buffer_size = buffer_size
+
+        # Metrics
+        self.requests = 0
+        self.bytes_sent = 0
+        self.by_route = {}
+        self.by_status = {}
+        self.first_byte = Histogram()
+        self.dropped = 0
+
+        # Output
+        if isinstance(output, basestring):
+            self._file = open(output, 'ab')
+            self._owns_file = True
+        else:
+            self._file = output
+            self._owns_file = False
+
+        self._lines = []
+        self._buffered = 0
+        self._timer = None
+        self._queue = Queue.Queue(queue_size)
+        self._thread = None
+
+    def __repr__(self):
+        return '<AccessLog requests=%d>' % self.requests
+
+    ##### Recording ###########################################################
+
+    def record(self, request):
+        """
+        Count a request that has just been finished, and write a line for it
+        if it's sampled. This is called by the server.
+        """
+        duration = request.time
+        status = request._status
+        route = getattr(request, 'route_name', None)
+
+        self.requests += 1
+        self.bytes_sent += request._bytes_sent
+
+        histogram = self.by_route.get(route)
+        if histogram is None:
+            histogram = self.by_route[route] = Histogram()
+        histogram.add(duration)
+
+        histogram = self.by_status.get(status)
+        if histogram is None:
+            histogram = self.by_status[status] = Histogram()
+        histogram.add(duration)
+
+        first_byte = None
+        if request._first_byte is not None:
+            first_byte = request._first_byte - request._start
+            self.first_byte.add(first_byte)
+
+        if self._file is None:
+            return
+
+        if status < 500:
+            sample = self.route_samples.get(route, self.sample)
+            if sample < 1 and random.random() >= sample:
+                return
+
+        line = json.dumps({
+            'time': request._start,
+            'remote_ip': request.remote_ip,
+            'method': request.method,
+            'url': request.url,
+            'protocol': request.protocol,
+            'status': status,
+            'bytes': request._bytes_sent,
+            'duration': duration,
+            'first_byte': first_byte,
+            'route': route,
+            }) + '\n'
+
+        self._lines.append(line)
+        self._buffered += len(line)
+
+        if self._buffered >= self.buffer_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = self.engine.defer(self.flush_interval,
+                                            self._timed_flush)
+
+    def stats(self):
+        """
+        Return the counts and histograms as a dictionary that can be
+        serialized as JSON, for a metrics endpoint.
+        """
+        return {
+            'requests': self.requests,
+            'bytes_sent': self.bytes_sent,
+            'dropped': self.dropped,
+            'first_byte': self.first_byte.to_dict(),
+            'by_route': dict((str(route), histogram.to_dict()) for
+                             route, histogram in self.by_route.iteritems()),
+            'by_status': dict((str(status), histogram.to_dict()) for
+                              status, histogram in self.by_status.iteritems()),
+            }
+
+    ##### Writing #############################################################
+
+    def flush(self):
+        """
+        Pass the lines collected so far to the writer thread.
+        """
+        if self._timer is not None:
+            self._timer()
+            self._timer = None
+
+        if not self._lines:
+            return
+
+        lines = self._lines
+        self._lines = []
+        self._buffered = 0
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._write_lines)
+            self._thread.daemon = True
+            self._thread.start()
+
+        try:
+            self._queue.put_nowait(''.join(lines))
+        except Queue.Full:
+            self.dropped += len(lines)
+
+    def close(self):
+        """
+        Write any lines that have been collected, wait for the writer thread
+        to finish, and close the file if the access log opened it.
+        """
+        self.flush()
+
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+        if self._owns_file and self._file is not None:
+            self._file.close()
+        self._file = None
+
+    def _timed_flush(self):
+        self._timer = None
+        self.flush()
+
+    def _write_lines(self):
+        """
+        Write batches of lines to the file, on the writer thread.
+        """
+        while True:
+            data = self._queue.get()
+            if data is None:
+                return
+
+            try:
+                self._file.write(data)
+                self._file.flush()
+            except (IOError, OSError):
+                log.exception('Error writing to the access log.')
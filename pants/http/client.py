@@ -220,13 +220,14 @@ import urlparse
 import zlib
 
 from datetime import datetime
+from time import time
 
 from pants.stream import Stream
 from pants.engine import Engine
 
 from pants.http.auth import BasicAuth
-from pants.http.utils import CRLF, date, DOUBLE_CRLF, encode_multipart, log, \
-    read_headers, USER_AGENT
+from pants.http.utils import BadRequest, CRLF, date, DOUBLE_CRLF, \
+    encode_multipart, log, read_headers, USER_AGENT
 
 try:
     from backports.ssl_match_hostname import match_hostname, CertificateError
@@ -255,6 +256,11 @@ __all__ = (
 CHUNK_SIZE = 2 ** 16
 MAX_MEMORY_SIZE = 2 ** 20
 
+# Requests with these methods are safe to send again if a reused connection
+# closes before the response begins.
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'TRACE', 'PUT',
+                                'DELETE'))
+
 
 ###############################################################################
 # Exceptions
@@ -355,75 +361,87 @@ def _port(parts):
         return None
 
 
+###############################################################################
+# Connection Pool Keys
+###############################################################################
+
+def _pool_key(request):
+    """
+    Return the key of the connections a request can be sent on: whether
+    they're secure, the host and port they connect to, and, for secure
+    connections, how they were verified and the SSL options they use.
+    """
+    is_secure = request.url.scheme == 'https'
+    port = _port(request.url) or (443 if is_secure else 80)
+    if not is_secure:
+        return (False, _hostname(request.url), port, None)
+
+    session = request.session
+    options = tuple(sorted((session.ssl_options or {}).iteritems()))
+    return (True, _hostname(request.url), port, (session.verify_ssl, options))
+
+
 ###############################################################################
 # _HTTPStream Class
 ###############################################################################
 
 class _HTTPStream(Stream):
     """
-    The _HTTPStream is a basic Pants client with an extra function for
-    determining if it can connect to a given host without being destroyed and
-    recreated. This is useful when dealing with proxies.
+    The _HTTPStream is a basic Pants client belonging to the connection pool
+    of an HTTPClient. It passes its events along to the client, along with
+    itself, so that the client can work with many connections at once.
 
-    It also automatically connects to the provided HTTPClient.
+    ``key`` is the pool key of the host the stream connects to, and
+    ``request`` is the request it's handling, or None while it's idle.
     """
 
-    _host = None
-
-    def __init__(self, client, *args, **kwargs):
+    def __init__(self, client, key, *args, **kwargs):
         Stream.__init__(self, *args, **kwargs)
         self.client = client
+        self.key = key
+        self.request = None
+
+        # Whether the stream has connected, and whether it has been taken
+        # from the idle connections.
+        self.established = False
+        self.reused = False
+        self.idle_since = None
 
         # This should be true when connected to certain proxies.
         self.need_full_url = False
 
-    def can_fetch(self, host, is_secure):
-        """
-        Returns True if this stream can connect to the provided host (a string
-        of ``"host:port"``) with HTTP (or HTTPS if is_secure is True), or
-        False otherwise.
-        """
-        if not self.connected:
-            return True
-        if self.ssl_enabled != is_secure:
-            return False
-
-        if isinstance(self._host, basestring):
-            if self._host != host:
-                return False
-        else:
-            host, port = host.split(':')
-            port = int(port)
-            if host != self._host or port != self.remote_address[-1]:
-                return False
-
-        return True
-
-    def connect(self, addr):
-        if isinstance(addr, basestring):
-            self._host = addr
-        else:
-            self._host = "%s:%d" % (addr[0], addr[-1])
+        self._reader = None
+        self._reading_forever = False
+        self._idle_timer = None
 
-        if self.connected:
-            self._safely_call(self.on_connect)
-        else:
-            Stream.connect(self, addr)
+    def on_read(self, data):
+        if self.request is None:
+            # Nothing should arrive on an idle connection.
+            self.client._close(self)
+            return
+        self._reader(self, data)
 
     def on_connect(self):
-        self.client._on_connect()
+        self.established = True
+        self.client._on_connect(self)
 
     def on_close(self):
-        self.client._on_close()
+        self.client._on_close(self)
 
     def on_connect_error(self, err):
-        self.client._on_connect_error(err)
+        self.client._do_error(self, err)
 
     def on_read_error(self, err):
-        self.client._do_error(err)
+        self.client._do_error(self, err)
 
     def on_overflow_error(self, err):
-        self.client._do_error(err)
+        self.client._do_error(self, err)
+
+    def on_ssl_handshake_error(self, err):
+        self.client._do_error(self, err)
+
+    def on_ssl_error(self, err):
+        self.client._do_error(self, err)
 
 
 ###############################################################################
@@ -469,6 +487,26 @@ class HTTPClient(object):
 
         Engine.instance().start()
 
+    Requests are sent concurrently, over a pool of connections kept per
+    host, port, and set of SSL options. A connection is kept open once its
+    response is complete, if the server allows it, and reused for the next
+    request to the same host. Requests beyond the limits below wait, in
+    order, for a connection to become free, so responses to different
+    requests may arrive in a different order than they were made. Set
+    ``max_connections_per_host`` to 1 to send requests to each host one at
+    a time.
+
+    The following keyword arguments configure the pool, and aren't passed
+    to the default session.
+
+    =========================  ========  ============
+    Argument                   Default   Description
+    =========================  ========  ============
+    engine                     None      *Optional.* The :class:`~pants.engine.Engine` to use. Defaults to the global engine.
+    max_connections            ``10``    *Optional.* The maximum number of connections open at once, to all hosts. When it's reached, the connection that has been idle longest is closed to make room for a request to another host.
+    max_connections_per_host   ``4``     *Optional.* The maximum number of connections open at once to a single host.
+    idle_timeout               ``15``    *Optional.* The time, in seconds, to keep an idle connection open for reuse.
+    =========================  ========  ============
     """
 
     def __init__(self, *args, **kwargs):
@@ -480,15 +518,24 @@ class HTTPClient(object):
         else:
             self.engine = Engine.instance()
 
+        # Connection Pool Settings
+        self.max_connections = kwargs.pop("max_connections", 10)
+        self.max_connections_per_host = kwargs.pop("max_connections_per_host",
+                                                   4)
+        self.idle_timeout = kwargs.pop("idle_timeout", 15)
+
         # Internal State
-        self._stream = None
-        self._processing = None
+        self._processing = False
+        self._process_again = False
         self._requests = []
         self._sessions = []
-        self._ssl_options = None
-        self._reading_forever = False
-        self._want_close = False
-        self._no_process = False
+
+        # The connection pool. Open connections and idle connections are
+        # both kept in lists by pool key, with idle ones in the order they
+        # became idle.
+        self._connections = {}
+        self._idle = {}
+        self._total = 0
 
         # Create the first Session
         ses = Session(self, *args, **kwargs)
@@ -583,6 +630,21 @@ class HTTPClient(object):
         return Session(self, *args, **kwargs)
 
 
+    ##### Connection Management ###############################################
+
+    def close(self):
+        """
+        Close every connection in the pool, and discard any requests that
+        haven't been completed. No callbacks are called for the discarded
+        requests.
+        """
+        del self._requests[:]
+        for streams in self._connections.values():
+            for stream in list(streams):
+                self._finish(stream)
+                self._close(stream)
+
+
     ##### Request Making ######################################################
 
     def request(self, *args, **kwargs):
@@ -657,22 +719,41 @@ class HTTPClient(object):
 
 
     def _process(self):
-        """ Send the first request on the stack. """
-        if not self._requests:
-            # Stop processing and close any connection since we've not got any
-            # requests left.
-            if self._stream:
-                self._want_close = True
-                self._no_process = True
-                self._stream.close(False)
-                self._stream = None
-            self._processing = False
+        """
+        Send as many queued requests as the connection limits allow, each on
+        an idle connection to its host if there is one, or on a new one.
+        Requests that can't be sent yet stay queued, in order.
+        """
+        if self._processing:
+            self._process_again = True
             return
+
         self._processing = True
+        try:
+            index = 0
+            while index < len(self._requests):
+                # If we're at the limit with nothing idle, nothing can be sent.
+                if self._total >= self.max_connections and not self._idle:
+                    break
+
+                stream = self._acquire(_pool_key(self._requests[index]))
+                if stream is None:
+                    index += 1
+                    continue
 
-        # Get the request.
-        request = self._requests[0]
+                request = self._requests.pop(index)
+                self._send(stream, request)
 
+                # Sending may have changed the queue, so start over.
+                if self._process_again:
+                    self._process_again = False
+                    index = 0
+        finally:
+            self._processing = False
+
+
+    def _send(self, stream, request):
+        """ Send a request on a connection from the pool. """
         # Make sure it has a response.
         if not request.response:
             HTTPResponse(request)
@@ -681,108 +762,184 @@ class HTTPClient(object):
         if request.auth and not isinstance(request.auth, (list,tuple)):
             request = request.auth(request)
 
-        # Now, determine what we should be connected to.
-        port = _port(request.url)
-        is_secure = request.url.scheme == 'https'
-        if not port:
-            port = 443 if is_secure else 80
-        host = '%s:%d' % (_hostname(request.url), port)
-
-        # If we have a stream, and it's not connected to that host, kill it
-        # to make a new one.
-        if self._stream:
-            if not self._stream.connected:
-                self._stream = None
-            elif self._ssl_options != request.session.ssl_options or \
-                    not self._stream.can_fetch(host, is_secure):
-                log.debug("Closing unusable stream for %r." % self)
-                self._want_close = True
-                self._no_process = False
-                self._stream.close(False)
-                return
-
         # Set the timeout timer and log.
         log.debug("Sending HTTP request %r." % request)
-        self._reset_timer()
+        stream.request = request
+        self._reset_timer(stream)
 
-        # Create a stream.
-        if not self._stream:
-            self._stream = _HTTPStream(self, engine=self.engine)
+        # If the stream is already connected, send the request right away.
+        if stream.established:
+            self._on_connect(stream)
+            return
 
-        # If we're secure, and the stream isn't, secure it.
-        if is_secure and not self._stream.ssl_enabled:
-            self._ssl_options = request.session.ssl_options
-            self._stream.startSSL(self._ssl_options or {})
+        # If we're secure, secure the stream.
+        is_secure, host, port = stream.key[:3]
+        if is_secure:
+            stream.startSSL(request.session.ssl_options or {})
 
         # Connect the stream to await further orders.
-        self._stream.connect((_hostname(request.url), port))
+        stream.connect((host, port))
 
 
-    def _timed_out(self, request):
+    def _timed_out(self, stream, request):
         """ Called when a request times out. """
-        if not request in self._requests:
+        request._timeout_timer = None
+        if stream.request is not request:
             return
 
         log.debug("HTTP request %r timed out." % request)
 
-        self._requests.remove(request)
-        request.session.on_error(request.response, RequestTimedOut())
-
-        # Now, close the connection, and keep processing.
-        if self._stream:
-            self._want_close = True
-            self._no_process = True
-            self._stream.close(False)
-            self._stream = None
+        # Close the connection, report the error, and keep processing.
+        self._finish(stream)
+        self._close(stream)
+        self._safely_call(request.session.on_error, request.response,
+                          RequestTimedOut())
         self._process()
 
 
-    def _reset_timer(self):
-        if not self._requests:
-            return
-        request = self._requests[0]
+    def _reset_timer(self, stream):
+        request = stream.request
 
         # Clear the existing timer.
         if request._timeout_timer:
             request._timeout_timer()
 
         request._timeout_timer = self.engine.defer(request.timeout,
-                                                   self._timed_out, request)
+                                                   self._timed_out, stream,
+                                                   request)
+
+
+    def _finish(self, stream):
+        """
+        Take the current request off of a stream and clear its timeout.
+        Returns the request, or None if the stream was idle.
+        """
+        request = stream.request
+        stream.request = None
+        if request and request._timeout_timer:
+            request._timeout_timer()
+            request._timeout_timer = None
+        return request
+
+
+    ##### Connection Pool #####################################################
+
+    def _acquire(self, key):
+        """
+        Return an idle connection for the given pool key, or a new one if the
+        limits allow it, or None if the request has to wait.
+        """
+        idle = self._idle.get(key)
+        if idle:
+            stream = idle.pop()
+            if not idle:
+                del self._idle[key]
+            stream._idle_timer()
+            stream._idle_timer = None
+            stream.reused = True
+            return stream
+
+        if len(self._connections.get(key, ())) >= \
+                self.max_connections_per_host:
+            return None
+
+        # Make room by closing the connection that's been idle longest.
+        if self._total >= self.max_connections:
+            oldest = None
+            for idle in self._idle.itervalues():
+                if oldest is None or idle[0].idle_since < oldest.idle_since:
+                    oldest = idle[0]
+            if oldest is None:
+                return None
+            self._close(oldest)
+
+        stream = _HTTPStream(self, key, engine=self.engine)
+        self._connections.setdefault(key, []).append(stream)
+        self._total += 1
+        return stream
+
+
+    def _release(self, stream):
+        """ Keep a connection whose response is complete for reuse. """
+        stream.read_delimiter = DOUBLE_CRLF
+        stream.idle_since = time()
+        self._idle.setdefault(stream.key, []).append(stream)
+        stream._idle_timer = self.engine.defer(self.idle_timeout,
+                                               self._idle_timed_out, stream)
+
+
+    def _idle_timed_out(self, stream):
+        """ Close a connection that has been idle for too long. """
+        stream._idle_timer = None
+        self._close(stream)
+
+
+    def _remove(self, stream):
+        """
+        Remove a connection from the pool. Returns False if it was already
+        removed.
+        """
+        streams = self._connections.get(stream.key)
+        if not streams or not stream in streams:
+            return False
+
+        streams.remove(stream)
+        if not streams:
+            del self._connections[stream.key]
+        self._total -= 1
+
+        idle = self._idle.get(stream.key)
+        if idle and stream in idle:
+            idle.remove(stream)
+            if not idle:
+                del self._idle[stream.key]
+
+        if stream._idle_timer:
+            stream._idle_timer()
+            stream._idle_timer = None
+
+        return True
+
+
+    def _close(self, stream):
+        """ Remove a connection from the pool and close it. """
+        if self._remove(stream):
+            stream.close(False)
 
 
     ##### Stream I/O Handlers #################################################
 
-    def _on_connect(self):
+    def _on_connect(self, stream):
         """ The Stream connected, so send the request. """
-        if not self._requests:
+        request = stream.request
+        if request is None:
             return
-        request = self._requests[0]
-        self._reset_timer()
+        self._reset_timer(stream)
 
         # Check our security.
         if request.url.scheme == 'https' and request.session.verify_ssl:
             # We care!
-            cert = self._stream._socket.getpeercert()
+            cert = stream._socket.getpeercert()
             try:
                 match_hostname(cert, _hostname(request.url))
             except CertificateError as err:
                 if not self._safely_call(request.session.on_ssl_error,
                         request.response, cert, err):
-                    self._do_error(err)
+                    self._do_error(stream, err)
                     return
 
         # Write the request.
-        if self._stream.need_full_url:
+        if stream.need_full_url:
             path = "%s://%s%s" % (request.url.scheme, request.url.netloc,
                                   request.path)
         else:
             path = request.path
 
-        self._stream.write("%s %s HTTP/1.1%s" % (request.method, path, CRLF))
+        stream.write("%s %s HTTP/1.1%s" % (request.method, path, CRLF))
 
         # Headers
         for key, val in request.headers.iteritems():
-            self._stream.write("%s: %s%s" % (key, val, CRLF))
+            stream.write("%s: %s%s" % (key, val, CRLF))
 
         # Cookies
         cookies = _get_cookies(request)
@@ -794,126 +951,90 @@ class HTTPClient(object):
                         endswith(morsel['domain'].lower()) or \
                         morsel['secure'] and request.url.scheme != 'https':
                     continue
-                self._stream.write(morsel.output(None, 'Cookie:') + CRLF)
+                stream.write(morsel.output(None, 'Cookie:') + CRLF)
 
         # And now, the body.
-        self._stream.write(CRLF)
+        stream.write(CRLF)
         if request.body:
             for item in request.body:
                 if isinstance(item, basestring):
-                    self._stream.write(item)
+                    stream.write(item)
                 else:
-                    self._stream.write_file(item)
+                    stream.write_file(item)
 
         # Now, we wait for a response.
-        self._stream.on_read = self._read_headers
-        self._stream.read_delimiter = DOUBLE_CRLF
+        stream._reader = self._read_headers
+        stream.read_delimiter = DOUBLE_CRLF
 
 
-    def _on_connect_error(self, err):
-        """ The Stream had an exception. Pass it along. """
-        if not self._requests:
-            return
-
-        # Pop off the request that had an error, and clear its timeout.
-        request = self._requests.pop(0)
-        if request._timeout_timer:
-            request._timeout_timer()
-
-        # Do the error method.
-        self._safely_call(request.session.on_error, request.response, err)
-
-        # Kill the stream.
-        if self._stream:
-            self._want_close = True
-            self._no_process = True
-            self._stream.close(False)
-            self._stream = None
-
-        # Keep processing, if needed.
-        self._process()
-
-
-    def _on_close(self):
+    def _on_close(self, stream):
         """
         If we weren't expecting the stream to close, it's an error, otherwise,
         just process our requests.
         """
+        if not self._remove(stream):
+            # We closed it ourselves.
+            return
 
         # Are we reading forever?
-        if self._reading_forever:
-            self._reading_forever = False
-            # Right, clean up then.
-            if self._requests:
-                # Get the request.
-                request = self._requests[0]
-                response = request.response
-
-                # Clean out the decoder.
-                if response._decoder:
-                    response._receive(response._decoder.flush())
-                    response._receive(response._decoder.unused_data)
-                    response._decoder = None
-
-                # Now, go to _on_response.
-                self._want_close = False
-                self._no_process = False
-                self._on_response()
-                return
+        if stream._reading_forever:
+            stream._reading_forever = False
+            response = stream.request.response
 
-        elif not self._want_close:
-            # If it's not an expected close, check for an active request and
-            # error it.
-            self._want_close = False
-            if self._requests:
-                request = self._requests[0]
-                self._no_process = False
-                self._do_error(RequestClosed("The server closed the "
-                                             "connection."))
-                return
+            # Clean out the decoder.
+            if response._decoder:
+                response._receive(response._decoder.flush())
+                response._receive(response._decoder.unused_data)
+                response._decoder = None
 
-        # Keep processing, if needed.
-        self._stream = None
-        if self._no_process:
-            self._no_process = False
-        else:
+            # Now, go to _on_response.
+            self._on_response(stream)
+            return
+
+        # If the stream never connected, the connection error follows.
+        request = stream.request
+        if request is None or not stream.established:
+            return
+
+        # If the server closed a connection we reused before replying, it
+        # most likely timed it out just as we sent the request. Safe requests
+        # are tried again on another connection.
+        if stream.reused and request.response.status_code is None and \
+                request.method in IDEMPOTENT_METHODS:
+            log.debug("Retrying HTTP request %r." % request)
+            self._finish(stream)
+            self._requests.insert(0, request)
             self._process()
+            return
+
+        self._do_error(stream, RequestClosed("The server closed the "
+                                             "connection."))
 
 
-    def _do_error(self, err):
+    def _do_error(self, stream, err):
         """
         There was some kind of exception. Close the stream, report it, and then
         keep processing.
         """
-        self._want_close = True
-        self._no_process = True
-        self._stream.close(False)
-        self._stream = None
-        if not self._requests:
-            return
-
-        # Pop off the request that had an error, and clear its timeout.
-        request = self._requests.pop(0)
-        if request._timeout_timer:
-            request._timeout_timer()
+        request = self._finish(stream)
+        self._close(stream)
 
-        self._safely_call(request.session.on_error, request.response, err)
+        if request:
+            self._safely_call(request.session.on_error, request.response, err)
 
         # Keep processing, if needed.
         self._process()
 
 
-    def _read_headers(self, data):
+    def _read_headers(self, stream, data):
         """
         Read the headers of an HTTP response from the socket into the current
         HTTPResponse object, and prepare to read the body. Or, if necessary,
         follow a redirect.
         """
-        if not self._requests:
-            return
-        request = self._requests[0]
+        request = stream.request
         response = request.response
-        self._reset_timer()
+        self._reset_timer(stream)
 
         ind = data.find(CRLF)
         if ind == -1:
@@ -926,15 +1047,19 @@ class HTTPClient(object):
             http_version, status, status_text = initial_line.split(' ', 2)
             status = int(status)
             if not http_version.startswith('HTTP/'):
-                self._do_error(MalformedResponse("Invalid HTTP protocol "
-                                                 "version %r." % http_version))
+                self._do_error(stream, MalformedResponse(
+                    "Invalid HTTP protocol version %r." % http_version))
                 return
         except ValueError:
-            self._do_error(MalformedResponse("Invalid status line."))
+            self._do_error(stream, MalformedResponse("Invalid status line."))
             return
 
         # Parse the headers.
-        headers = read_headers(data) if data else {}
+        try:
+            headers = read_headers(data) if data else {}
+        except BadRequest as err:
+            self._do_error(stream, MalformedResponse(err.message))
+            return
 
         # Store what we've got so far on the response.
         response.http_version = http_version
@@ -963,7 +1088,7 @@ class HTTPClient(object):
         # Are we dealing with a HEAD request?
         if request.method == 'HEAD':
             # Just be done.
-            self._on_response()
+            self._on_response(stream)
             return
 
         # Do the on_headers callback.
@@ -971,10 +1096,9 @@ class HTTPClient(object):
                                              response)
         if continue_request is False:
             # Abort the connection now.
-            self._requests.pop(0)
-            self._want_close = True
-            self._no_process = False
-            self._stream.close(False)
+            self._finish(stream)
+            self._close(stream)
+            self._process()
             return
 
         # Is there a Content-Length header?
@@ -984,70 +1108,65 @@ class HTTPClient(object):
 
             # If there's no length, immediately we've got a response.
             if not response.remaining:
-                self._on_response()
+                self._on_response(stream)
                 return
 
-            self._stream.on_read = self._read_body
-            self._stream.read_delimiter = min(CHUNK_SIZE, response.remaining)
+            stream._reader = self._read_body
+            stream.read_delimiter = min(CHUNK_SIZE, response.remaining)
 
         # What about Transfer-Encoding?
         elif 'Transfer-Encoding' in headers:
             if headers['Transfer-Encoding'] != 'chunked':
-                self._do_error(MalformedResponse(
+                self._do_error(stream, MalformedResponse(
                                 "Unable to handle Transfer-Encoding %r." %
                                 headers['Transfer-Encoding']))
                 return
 
             response.length = 0
-            self._stream.on_read = self._read_chunk_head
-            self._stream.read_delimiter = CRLF
+            stream._reader = self._read_chunk_head
+            stream.read_delimiter = CRLF
 
         # Is this not a persistent connection? If so, read the whole body.
         elif not response._keep_alive:
             response.length = 0
             response.remaining = 0
-            self._reading_forever = True
-            self._stream.on_read = self._read_forever
+            stream._reading_forever = True
+            stream._reader = self._read_forever
 
             # We have to have a read_delimiter of None, otherwise our data
             # gets deleted when the connection is closed.
-            self._stream.read_delimiter = None
+            stream.read_delimiter = None
 
         # There must not be a body, so go ahead and be done.
         else:
             # We've got a response.
-            self._on_response()
+            self._on_response(stream)
             return
 
         # Do we have any Content-Encoding?
         if 'Content-Encoding' in headers:
             encoding = headers['Content-Encoding']
             if not encoding in CONTENT_ENCODING:
-                self._do_error(MalformedResponse(
+                self._do_error(stream, MalformedResponse(
                            "Unable to handle Content-Encoding %r." % encoding))
                 return
             response._decoder = CONTENT_ENCODING[encoding]()
 
 
-    def _on_response(self):
+    def _on_response(self, stream):
         """
         A response has been completed. Send it on through.
         """
-        if not self._requests:
+        request = self._finish(stream)
+        if request is None:
             return
-        request = self._requests.pop(0)
         response = request.response
 
-        # Do we have Connection: close?
-        if not response._keep_alive:
-            self._want_close = True
-            self._no_process = True
-            self._stream.close(False)
-            self._stream = None
-
-        # Clear the existing timer.
-        if request._timeout_timer:
-            request._timeout_timer()
+        # Keep the connection for another request, unless we can't.
+        if response._keep_alive and request.keep_alive:
+            self._release(stream)
+        else:
+            self._close(stream)
 
         # Check for a status code handler.
         handler = getattr(response, 'handle_%d' % response.status_code, None)
@@ -1063,15 +1182,13 @@ class HTTPClient(object):
 
     ##### Length-Based Responses ##############################################
 
-    def _read_forever(self, data):
+    def _read_forever(self, stream, data):
         """
         Read until the connection closes.
         """
-        if not self._requests:
-            return
-        request = self._requests[0]
+        request = stream.request
         response = request.response
-        self._reset_timer()
+        self._reset_timer(stream)
 
         # Make note of how many bytes we've received.
         response.length += len(data)
@@ -1088,20 +1205,18 @@ class HTTPClient(object):
                           response.length, 0)
 
 
-    def _read_body(self, data):
+    def _read_body(self, stream, data):
         """
         Add the data we received to the response body, doing any necessary
         decompression and character set nonsense.
         """
-        if not self._requests:
-            return
-        request = self._requests[0]
+        request = stream.request
         response = request.response
-        self._reset_timer()
+        self._reset_timer(stream)
 
         # Make note of how many bytes we've received.
         response.remaining -= len(data)
-        self._stream.read_delimiter = min(CHUNK_SIZE, response.remaining)
+        stream.read_delimiter = min(CHUNK_SIZE, response.remaining)
         finished = not response.remaining and not response.remaining is False
 
         # Decode the received data.
@@ -1121,18 +1236,16 @@ class HTTPClient(object):
 
         # Do a finished?
         if finished:
-            self._on_response()
+            self._on_response(stream)
 
 
     ##### Chunked Responses ###################################################
 
-    def _read_additional_headers(self, data):
+    def _read_additional_headers(self, stream, data):
         """ Read additional headers for the response. """
-        if not self._requests:
-            return
-        request = self._requests[0]
+        request = stream.request
         response = request.response
-        self._reset_timer()
+        self._reset_timer(stream)
 
         # Build the additional headers data.
         if data:
@@ -1156,16 +1269,14 @@ class HTTPClient(object):
                     response.headers[key].append(val)
 
         # Finally, we can handle it.
-        self._on_response()
+        self._on_response(stream)
 
 
-    def _read_chunk_head(self, data):
+    def _read_chunk_head(self, stream, data):
         """ Read a chunk header. """
-        if not self._requests:
-            return
-        request = self._requests[0]
+        request = stream.request
         response = request.response
-        self._reset_timer()
+        self._reset_timer(stream)
 
         # Chop off any chunk extension data. We don't care about it.
         if ';' in data:
@@ -1182,31 +1293,29 @@ class HTTPClient(object):
                 response._receive(response._decoder.unused_data)
                 response._decoder = None
 
-            self._stream.on_read = self._read_additional_headers
+            stream._reader = self._read_additional_headers
             response._additional_headers = ''
-            self._stream.read_delimiter = CRLF
+            stream.read_delimiter = CRLF
 
         else:
             # Read the new chunk.
             length += 2
-            self._stream.on_read = self._read_chunk_body
+            stream._reader = self._read_chunk_body
             response.remaining = length
-            self._stream.read_delimiter = min(CHUNK_SIZE, length)
+            stream.read_delimiter = min(CHUNK_SIZE, length)
 
 
-    def _read_chunk_body(self, data):
+    def _read_chunk_body(self, stream, data):
         """ Read a chunk body. """
-        if not self._requests:
-            return
-        request = self._requests[0]
+        request = stream.request
         response = request.response
-        self._reset_timer()
+        self._reset_timer(stream)
 
         # Make note of how many bytes we've received.
         bytes = len(data)
         response.remaining -= bytes
         response.length += bytes
-        self._stream.read_delimiter = min(CHUNK_SIZE, response.remaining)
+        stream.read_delimiter = min(CHUNK_SIZE, response.remaining)
 
         # Pass the data through our decoder.
         data = data[:-2]
@@ -1222,8 +1331,8 @@ class HTTPClient(object):
 
         # If we're finished with this chunk, read a new header.
         if not response.remaining:
-            self._stream.on_read = self._read_chunk_head
-            self._stream.read_delimiter = CRLF
+            stream._reader = self._read_chunk_head
+            stream.read_delimiter = CRLF
 
 
 ###############################################################################
@@ -1508,8 +1617,7 @@ class Session(object):
 
         # Now, send it back to the client.
         self.client._requests.append(request)
-        if not self.client._processing:
-            self.client._process()
+        self.client._process()
 
         # Not sure what you'll do with this, but there you have it.
         return request
@@ -0,0 +1,609 @@
+###############################################################################
+#
+# Copyright 2011-2012 Pants Developers (see AUTHORS.txt)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+"""
+``pants.http.hpack`` implements HPACK, the header compression format used by
+HTTP/2, as described by `RFC 7541 <http://tools.ietf.org/html/rfc7541>`_.
+
+An :class:`Encoder` and a :class:`Decoder` each keep a dynamic table of
+recently used headers, so one of each is needed for every direction of an
+HTTP/2 connection, and header blocks must be decoded in the order they were
+encoded.
+"""
+
+###############################################################################
+# Imports
+###############################################################################
+
+from collections import deque
+
+
+###############################################################################
+# Constants
+###############################################################################
+
+# The static table, from Appendix A. Index 1 is the first entry.
+STATIC_TABLE = (
+    (':authority', ''),
+    (':method', 'GET'),
+    (':method', 'POST'),
+    (':path', '/'),
+    (':path', '/index.html'),
+    (':scheme', 'http'),
+    (':scheme', 'https'),
+    (':status', '200'),
+    (':status', '204'),
+    (':status', '206'),
+    (':status', '304'),
+    (':status', '400'),
+    (':status', '404'),
+    (':status', '500'),
+    ('accept-charset', ''),
+    ('accept-encoding', 'gzip, deflate'),
+    ('accept-language', ''),
+    ('accept-ranges', ''),
+    ('accept', ''),
+    ('access-control-allow-origin', ''),
+    ('age', ''),
+    ('allow', ''),
+    ('authorization', ''),
+    ('cache-control', ''),
+    ('content-disposition', ''),
+    ('content-encoding', ''),
+    ('content-language', ''),
+    ('content-length', ''),
+    ('content-location', ''),
+    ('content-range', ''),
+    ('content-type', ''),
+    ('cookie', ''),
+    ('date', ''),
+    ('etag', ''),
+    ('expect', ''),
+    ('expires', ''),
+    ('from', ''),
+    ('host', ''),
+    ('if-match', ''),
+    ('if-modified-since', ''),
+    ('if-none-match', ''),
+    ('if-range', ''),
+    ('if-unmodified-since', ''),
+    ('last-modified', ''),
+    ('link', ''),
+    ('location', ''),
+    ('max-forwards', ''),
+    ('proxy-authenticate', ''),
+    ('proxy-authorization', ''),
+    ('range', ''),
+    ('referer', ''),
+    ('refresh', ''),
+    ('retry-after', ''),
+    ('server', ''),
+    ('set-cookie', ''),
+    ('strict-transport-security', ''),
+    ('transfer-encoding', ''),
+    ('user-agent', ''),
+    ('vary', ''),
+    ('via', ''),
+    ('www-authenticate', ''),
+    )
+
+STATIC_LENGTH = len(STATIC_TABLE)
+
+# The Huffman code for each octet, and for EOS (256), as (code, bit length),
+# from Appendix B.
+HUFFMAN_CODES = (
+    (0x1ff8, 13), (0x7fffd8, 23), (0xfffffe2, 28), (0xfffffe3, 28),
+    (0xfffffe4, 28), (0xfffffe5, 28), (0xfffffe6, 28), (0xfffffe7, 28),
+    (0xfffffe8, 28), (0xffffea, 24), (0x3ffffffc, 30), (0xfffffe9, 28),
+    (0xfffffea, 28), (0x3ffffffd, 30), (0xfffffeb, 28), (0xfffffec, 28),
+    (0xfffffed, 28), (0xfffffee, 28), (0xfffffef, 28), (0xffffff0, 28),
+    (0xffffff1, 28), (0xffffff2, 28), (0x3ffffffe, 30), (0xffffff3, 28),
+    (0xffffff4, 28), (0xffffff5, 28), (0xffffff6, 28), (0xffffff7, 28),
+    (0xffffff8, 28), (0xffffff9, 28), (0xffffffa, 28), (0xffffffb, 28),
+    (0x14, 6), (0x3f8, 10), (0x3f9, 10), (0xffa, 12), (0x1ff9, 13), (0x15, 6),
+    (0xf8, 8), (0x7fa, 11), (0x3fa, 10), (0x3fb, 10), (0xf9, 8), (0x7fb, 11),
+    (0xfa, 8), (0x16, 6), (0x17, 6), (0x18, 6), (0x0, 5), (0x1, 5), (0x2, 5),
+    (0x19, 6), (0x1a, 6), (0x1b, 6), (0x1c, 6), (0x1d, 6), (0x1e, 6),
+    (0x1f, 6), (0x5c, 7), (0xfb, 8), (0x7ffc, 15), (0x20, 6), (0xffb, 12),
+    (0x3fc, 10), (0x1ffa, 13), (0x21, 6), (0x5d, 7), (0x5e, 7), (0x5f, 7),
+    (0x60, 7), (0x61, 7), (0x62, 7), (0x63, 7), (0x64, 7), (0x65, 7),
+    (0x66, 7), (0x67, 7), (0x68, 7), (0x69, 7), (0x6a, 7), (0x6b, 7),
+    (0x6c, 7), (0x6d, 7), (0x6e, 7), (0x6f, 7), (0x70, 7), (0x71, 7),
+    (0x72, 7), (0xfc, 8), (0x73, 7), (0xfd, 8), (0x1ffb, 13), (0x7fff0, 19),
+    (0x1ffc, 13), (0x3ffc, 14), (0x22, 6), (0x7ffd, 15), (0x3, 5), (0x23, 6),
+    (0x4, 5), (0x24, 6), (0x5, 5), (0x25, 6), (0x26, 6), (0x27, 6), (0x6, 5),
+    (0x74, 7), (0x75, 7), (0x28, 6), (0x29, 6), (0x2a, 6), (0x7, 5), (0x2b, 6),
+    (0x76, 7), (0x2c, 6), (0x8, 5), (0x9, 5), (0x2d, 6), (0x77, 7), (0x78, 7),
+    (0x79, 7), (0x7a, 7), (0x7b, 7), (0x7ffe, 15), (0x7fc, 11), (0x3ffd, 14),
+    (0x1ffd, 13), (0xffffffc, 28), (0xfffe6, 20), (0x3fffd2, 22),
+    (0xfffe7, 20), (0xfffe8, 20), (0x3fffd3, 22), (0x3fffd4, 22),
+    (0x3fffd5, 22), (0x7fffd9, 23), (0x3fffd6, 22), (0x7fffda, 23),
+    (0x7fffdb, 23), (0x7fffdc, 23), (0x7fffdd, 23), (0x7fffde, 23),
+    (0xffffeb, 24), (0x7fffdf, 23), (0xffffec, 24), (0xffffed, 24),
+    (0x3fffd7, 22), (0x7fffe0, 23), (0xffffee, 24), (0x7fffe1, 23),
+    (0x7fffe2, 23), (0x7fffe3, 23), (0x7fffe4, 23), (0x1fffdc, 21),
+    (0x3fffd8, 22), (0x7fffe5, 23), (0x3fffd9, 22), (0x7fffe6, 23),
+    (0x7fffe7, 23), (0xffffef, 24), (0x3fffda, 22), (0x1fffdd, 21),
+    (0xfffe9, 20), (0x3fffdb, 22), (0x3fffdc, 22), (0x7fffe8, 23),
+    (0x7fffe9, 23), (0x1fffde, 21), (0x7fffea, 23), (0x3fffdd, 22),
+    (0x3fffde, 22), (0xfffff0, 24), (0x1fffdf, 21), (0x3fffdf, 22),
+    (0x7fffeb, 23), (0x7fffec, 23), (0x1fffe0, 21), (0x1fffe1, 21),
+    (0x3fffe0, 22), (0x1fffe2, 21), (0x7fffed, 23), (0x3fffe1, 22),
+    (0x7fffee, 23), (0x7fffef, 23), (0xfffea, 20), (0x3fffe2, 22),
+    (0x3fffe3, 22), (0x3fffe4, 22), (0x7ffff0, 23), (0x3fffe5, 22),
+    (0x3fffe6, 22), (0x7ffff1, 23), (0x3ffffe0, 26), (0x3ffffe1, 26),
+    (0xfffeb, 20), (0x7fff1, 19), (0x3fffe7, 22), (0x7ffff2, 23),
+    (0x3fffe8, 22), (0x1ffffec, 25), (0x3ffffe2, 26), (0x3ffffe3, 26),
+    (0x3ffffe4, 26), (0x7ffffde, 27), (0x7ffffdf, 27), (0x3ffffe5, 26),
+    (0xfffff1, 24), (0x1ffffed, 25), (0x7fff2, 19), (0x1fffe3, 21),
+    (0x3ffffe6, 26), (0x7ffffe0, 27), (0x7ffffe1, 27), (0x3ffffe7, 26),
+    (0x7ffffe2, 27), (0xfffff2, 24), (0x1fffe4, 21), (0x1fffe5, 21),
+    (0x3ffffe8, 26), (0x3ffffe9, 26), (0xffffffd, 28), (0x7ffffe3, 27),
+    (0x7ffffe4, 27), (0x7ffffe5, 27), (0xfffec, 20), (0xfffff3, 24),
+    (0xfffed, 20), (0x1fffe6, 21), (0x3fffe9, 22), (0x1fffe7, 21),
+    (0x1fffe8, 21), (0x7ffff3, 23), (0x3fffea, 22), (0x3fffeb, 22),
+    (0x1ffffee, 25), (0x1ffffef, 25), (0xfffff4, 24), (0xfffff5, 24),
+    (0x3ffffea, 26), (0x7ffff4, 23), (0x3ffffeb, 26), (0x7ffffe6, 27),
+    (0x3ffffec, 26), (0x3ffffed, 26), (0x7ffffe7, 27), (0x7ffffe8, 27),
+    (0x7ffffe9, 27), (0x7ffffea, 27), (0x7ffffeb, 27), (0xffffffe, 28),
+    (0x7ffffec, 27), (0x7ffffed, 27), (0x7ffffee, 27), (0x7ffffef, 27),
+    (0x7fffff0, 27), (0x3ffffee, 26), (0x3fffffff, 30),
+    )
+
+# The overhead, in octets, that each dynamic table entry is counted as having.
+ENTRY_OVERHEAD = 32
+
+DEFAULT_TABLE_SIZE = 4096
+
+# Headers with values that change too often to be worth indexing, and ones
+# that intermediaries mustn't index either.
+UNINDEXED_HEADERS = frozenset(('content-length', 'etag', 'last-modified',
+                               'age', 'expires', 'location'))
+SENSITIVE_HEADERS = frozenset(('authorization', 'cookie', 'set-cookie',
+                               'proxy-authorization'))
+
+
+###############################################################################
+# Exceptions
+###############################################################################
+
+class HPACKError(Exception):
+    """
+    Raised when a header block can't be decoded.
+    """
+    pass
+
+
+###############################################################################
+# Huffman Coding
+###############################################################################
+
+def _build_huffman_decoder():
+    """
+    Build a table for decoding Huffman coded strings four bits at a time.
+
+    Each state is a node of the code tree. For each state and nibble, the
+    table holds the next state and the octet that was completed, if any.
+    As no code is shorter than five bits, a nibble completes one octet at
+    most. A state may end a string if the path to it is made only of one
+    bits and is shorter than eight bits, as padding must be.
+    """
+    children = [[None, None]]
+    symbols = {}
+    for symbol, (code, length) in enumerate(HUFFMAN_CODES):
+        node = 0
+        for i in xrange(length - 1, 0, -1):
+            bit = (code >> i) & 1
+            child = children[node][bit]
+            if child is None:
+                child = len(children)
+                children.append([None, None])
+                children[node][bit] = child
+            node = child
+        symbols[node, code & 1] = symbol
+
+    accepting = [False] * len(children)
+    node = 0
+    for depth in xrange(8):
+        accepting[node] = True
+        node = children[node][1]
+
+    states = []
+    emits = []
+    for state in xrange(len(children)):
+        for nibble in xrange(16):
+            node = state
+            emit = -1
+            for shift in (3, 2, 1, 0):
+                bit = (nibble >> shift) & 1
+                if (node, bit) in symbols:
+                    emit = symbols[node, bit]
+                    node = 0
+                else:
+                    node = children[node][bit]
+            states.append(node)
+            emits.append(emit)
+
+    return states, emits, accepting
+
+_HUFFMAN_STATES, _HUFFMAN_EMITS, _HUFFMAN_ACCEPTING = _build_huffman_decoder()
+
+
+def huffman_encode(data):
+    """
+    Huffman code a string.
+    """
+    codes = HUFFMAN_CODES
+    out = bytearray()
+    bits = 0
+    count = 0
+    for char in bytearray(data):
+        code, length = codes[char]
+        bits = (bits << length) | code
+        count += length
+        while count >= 8:
+            count -= 8
+            out.append((bits >> count) & 0xFF)
+        bits &= (1 << count) - 1
+
+    if count:
+        # Pad with the most significant bits of EOS, which are all ones.
+        out.append(((bits << (8 - count)) | ((1 << (8 - count)) - 1)) & 0xFF)
+
+    return str(out)
+
+
+def huffman_length(data):
+    """
+    The length, in octets, of a string once it has been Huffman coded.
+    """
+    codes = HUFFMAN_CODES
+    return (sum(codes[char][1] for char in bytearray(data)) + 7) // 8
+
+
+def huffman_decode(data):
+    """
+    Decode a Huffman coded string. Raises :class:`HPACKError` if the string
+    isn't valid.
+    """
+    states = _HUFFMAN_STATES
+    emits = _HUFFMAN_EMITS
+    out = bytearray()
+    state = 0
+    for byte in bytearray(data):
+        index = state * 16 + (byte >> 4)
+        emit = emits[index]
+        if emit != -1:
+            if emit == 256:
+                raise HPACKError('EOS in Huffman coded string.')
+            out.append(emit)
+        state = states[index]
+
+        index = state * 16 + (byte & 0xF)
+        emit = emits[index]
+        if emit != -1:
+            if emit == 256:
+                raise HPACKError('EOS in Huffman coded string.')
+            out.append(emit)
+        state = states[index]
+
+    if not _HUFFMAN_ACCEPTING[state]:
+        raise HPACKError('Invalid padding in Huffman coded string.')
+
+    return str(out)
+
+
+###############################################################################
+# Primitive Types
+###############################################################################
+
+def encode_integer(value, prefix, flags=0):
+    """
+    Encode an integer with an N-bit prefix, setting the given flags in the
+    bits of the first octet that precede the prefix.
+    """
+    limit = (1 << prefix) - 1
+    if value < limit:
+        return chr(flags | value)
+
+    out = bytearray((flags | limit,))
+    value -= limit
+    while value >= 128:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return str(out)
+
+
+def decode_integer(data, pos, prefix):
+    """
+    Decode an integer with an N-bit prefix, starting at the given position
+    in a bytearray. Returns the integer and the position after it.
+    """
+    limit = (1 << prefix) - 1
+    value = data[pos] & limit
+    pos += 1
+    if value < limit:
+        return value, pos
+
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise HPACKError('Truncated integer.')
+        byte = data[pos]
+        pos += 1
+        value += (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+        if shift > 28:
+            raise HPACKError('Integer too large.')
+
+
+def encode_string(value):
+    """
+    Encode a string literal, Huffman coding it if that makes it shorter.
+    """
+    length = huffman_length(value)
+    if length < len(value):
+        return encode_integer(length, 7, 0x80) + huffman_encode(value)
+    return encode_integer(len(value), 7) + value
+
+
+def decode_string(data, pos):
+    """
+    Decode a string literal starting at the given position in a bytearray.
+    Returns the string and the position after it.
+    """
+    if pos >= len(data):
+        raise HPACKError('Truncated string.')
+    huffman = data[pos] & 0x80
+    length, pos = decode_integer(data, pos, 7)
+    end = pos + length
+    if end > len(data):
+        raise HPACKError('Truncated string.')
+
+    value = str(data[pos:end])
+    if huffman:
+        value = huffman_decode(value)
+    return value, end
+
+
+###############################################################################
+# Encoder Class
+###############################################################################
+
+class Encoder(object):
+    """
+    Encodes lists of headers into header blocks.
+
+    Header names must be lower-case. Headers are added to the dynamic table
+    so they can be sent by index next time, except for those with values
+    that rarely repeat, and those that are sensitive, such as cookies, which
+    are marked so that they won't be indexed.
+    """
+    __slots__ = ('max_size', '_size', '_entries', '_inserted', '_fields',
+                 '_names', '_size_update')
+
+    def __init__(self):
+        self.max_size = DEFAULT_TABLE_SIZE
+        self._size = 0
+        self._entries = deque()
+        self._inserted = 0
+        self._fields = {}
+        self._names = {}
+        self._size_update = None
+
+    def resize(self, size):
+        """
+        Change the size of the dynamic table, when the peer changes the
+        limit with its ``SETTINGS_HEADER_TABLE_SIZE`` setting. The change is
+        signalled at the start of the next header block.
+        """
+        if size == self.max_size:
+            return
+        if self._size_update is None or size < self._size_update:
+            self._size_update = size
+        self.max_size = size
+        self._evict(0)
+
+    def encode(self, headers):
+        """
+        Encode a list of ``(name, value)`` tuples as a header block.
+        """
+        out = []
+        append = out.append
+
+        if self._size_update is not None:
+            if self._size_update < self.max_size:
+                append(encode_integer(self._size_update, 5, 0x20))
+            append(encode_integer(self.max_size, 5, 0x20))
+            self._size_update = None
+
+        fields = self._fields
+        names = self._names
+        for name, value in headers:
+            value = str(value)
+
+            index = _STATIC_FIELDS.get((name, value))
+            if index is None:
+                seq = fields.get((name, value))
+                if seq is not None:
+                    index = STATIC_LENGTH + self._inserted - seq + 1
+            if index is not None:
+                append(encode_integer(index, 7, 0x80))
+                continue
+
+            index = _STATIC_NAMES.get(name)
+            if index is None:
+                seq = names.get(name)
+                if seq is not None:
+                    index = STATIC_LENGTH + self._inserted - seq + 1
+
+            if name in SENSITIVE_HEADERS:
+                prefix, flags = 4, 0x10
+            elif name in UNINDEXED_HEADERS:
+                prefix, flags = 4, 0
+            else:
+                prefix, flags = 6, 0x40
+
+            if index is None:
+                append(chr(flags))
+                append(encode_string(name))
+            else:
+                append(encode_integer(index, prefix, flags))
+            append(encode_string(value))
+
+            if flags == 0x40:
+                self._add(name, value)
+
+        return ''.join(out)
+
+    def _add(self, name, value):
+        size = len(name) + len(value) + ENTRY_OVERHEAD
+        self._evict(size)
+        if size > self.max_size:
+            return
+
+        self._inserted += 1
+        self._entries.appendleft((name, value, self._inserted))
+        self._fields[name, value] = self._inserted
+        self._names[name] = self._inserted
+        self._size += size
+
+    def _evict(self, size):
+        entries = self._entries
+        while entries and self._size + size > self.max_size:
+            name, value, seq = entries.pop()
+            self._size -= len(name) + len(value) + ENTRY_OVERHEAD
+            if self._fields.get((name, value)) == seq:
+                del self._fields[name, value]
+            if self._names.get(name) == seq:
+                del self._names[name]
+
+
+###############################################################################
+# Decoder Class
+###############################################################################
+
+class Decoder(object):
+    """
+    Decodes header blocks into lists of ``(name, value)`` tuples.
+
+    ================  ========  ============
+    Argument          Default   Description
+    ================  ========  ============
+    max_size          4096      *Optional.* The largest dynamic table the peer may use, as advertised with ``SETTINGS_HEADER_TABLE_SIZE``.
+    max_header_list   65536     *Optional.* The largest list of headers that will be decoded, counting each header as a dynamic table entry would be. Larger lists raise :class:`HPACKError`.
+    ================  ========  ============
+    """
+    __slots__ = ('max_size', 'max_header_list', '_table_size', '_size',
+                 '_entries')
+
+    def __init__(self, max_size=DEFAULT_TABLE_SIZE, max_header_list=65536):
+        self.max_size = max_size
+        self.max_header_list = max_header_list
+        self._table_size = max_size
+        self._size = 0
+        self._entries = deque()
+
+    def decode(self, data):
+        """
+        Decode a complete header block. Raises :class:`HPACKError` if the
+        block is invalid.
+        """
+        data = bytearray(data)
+        end = len(data)
+        pos = 0
+        headers = []
+        total = 0
+
+        while pos < end:
+            byte = data[pos]
+
+            if byte & 0x80:
+                # Indexed Header Field
+                index, pos = decode_integer(data, pos, 7)
+                name, value = self._lookup(index)
+
+            elif byte & 0xE0 == 0x20:
+                # Dynamic Table Size Update
+                if headers:
+                    raise HPACKError('Table size update after a header.')
+                size, pos = decode_integer(data, pos, 5)
+                if size > self.max_size:
+                    raise HPACKError('Table size update too large.')
+                self._table_size = size
+                self._evict(0)
+                continue
+
+            else:
+                # Literal Header Fields, either with incremental indexing or
+                # without indexing.
+                indexing = byte & 0x40
+                index, pos = decode_integer(data, pos, 6 if indexing else 4)
+
+                if index:
+                    name = self._lookup(index)[0]
+                else:
+                    name, pos = decode_string(data, pos)
+                value, pos = decode_string(data, pos)
+
+                if indexing:
+                    self._add(name, value)
+
+            total += len(name) + len(value) + ENTRY_OVERHEAD
+            if total > self.max_header_list:
+                raise HPACKError('Header list too large.')
+            headers.append((name, value))
+
+        return headers
+
+    def _lookup(self, index):
+        if 0 < index <= STATIC_LENGTH:
+            return STATIC_TABLE[index - 1]
+
+        entries = self._entries
+        offset = index - STATIC_LENGTH - 1
+        if 0 <= offset < len(entries):
+            return entries[offset]
+        raise HPACKError('Invalid header index %d.' % index)
+
+    def _add(self, name, value):
+        size = len(name) + len(value) + ENTRY_OVERHEAD
+        self._evict(size)
+        if size <= self._table_size:
+            self._entries.appendleft((name, value))
+            self._size += size
+
+    def _evict(self, size):
+        entries = self._entries
+        while entries and self._size + size > self._table_size:
+            name, value = entries.pop()
+            self._size -= len(name) + len(value) + ENTRY_OVERHEAD
+
+
+###############################################################################
+# Static Table Lookups
+###############################################################################
+
+_STATIC_FIELDS = {}
+_STATIC_NAMES = {}
+for _index, _field in enumerate(STATIC_TABLE):
+    _STATIC_FIELDS.setdefault(_field, _index + 1)
+    _STATIC_NAMES.setdefault(_field[0], _index + 1)
+del _index, _field
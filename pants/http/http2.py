@@ -0,0 +1,1438 @@
+###############################################################################
+#
+# Copyright 2011-2012 Pants Developers (see AUTHORS.txt)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+"""
+``pants.http.http2`` implements `HTTP/2 <http://tools.ietf.org/html/rfc7540>`_
+for :class:`~pants.http.server.HTTPServer`.
+
+A server created with ``http2=True`` speaks HTTP/2 to the clients that ask
+for it: on TLS connections by negotiating ``h2`` with ALPN, and on plain
+connections by sending the HTTP/2 connection preface in place of a request,
+which is known as "prior knowledge". The
+:class:`~pants.http.server.HTTPConnection` hands itself over to an
+:class:`HTTP2Connection`, which passes each stream to the server's request
+handler as an ordinary :class:`~pants.http.server.HTTPRequest`, so request
+handlers and :class:`~pants.web.application.Application` routes work
+unchanged.
+
+Responses are written with the usual HTTPRequest methods. The status line
+and headers they produce are sent as a HEADERS frame, without the headers
+that only apply to HTTP/1 connections, such as ``Connection`` and
+``Transfer-Encoding``, and chunked bodies are sent without their chunk
+framing. Response bodies are sent as the client's flow control windows
+allow, with the streams that have data to send sharing the connection in
+proportion to the priorities the client gave them.
+
+Upgrading HTTP/1.1 connections with ``Upgrade: h2c`` and server push aren't
+supported, and WebSockets can't be used over HTTP/2.
+"""
+
+###############################################################################
+# Imports
+###############################################################################
+
+import os
+import struct
+
+from collections import deque
+
+from pants.http.hpack import DEFAULT_TABLE_SIZE, Decoder, Encoder, HPACKError
+from pants.http.utils import _add_header, BadRequest, CRLF, DOUBLE_CRLF, \
+    HTTPHeaders, log
+
+###############################################################################
+# Constants
+###############################################################################
+
+# Sent by the client at the start of every HTTP/2 connection.
+PREFACE = 'PRI * HTTP/2.0\r\n\r\nSM\r\n\r\n'
+
+# Frame Types
+DATA = 0x0
+HEADERS = 0x1
+PRIORITY = 0x2
+RST_STREAM = 0x3
+SETTINGS = 0x4
+PUSH_PROMISE = 0x5
+PING = 0x6
+GOAWAY = 0x7
+WINDOW_UPDATE = 0x8
+CONTINUATION = 0x9
+
+# Frame Flags
+FLAG_END_STREAM = 0x1
+FLAG_ACK = 0x1
+FLAG_END_HEADERS = 0x4
+FLAG_PADDED = 0x8
+FLAG_PRIORITY = 0x20
+
+# Settings
+SETTINGS_HEADER_TABLE_SIZE = 0x1
+SETTINGS_ENABLE_PUSH = 0x2
+SETTINGS_MAX_CONCURRENT_STREAMS = 0x3
+SETTINGS_INITIAL_WINDOW_SIZE = 0x4
+SETTINGS_MAX_FRAME_SIZE = 0x5
+SETTINGS_MAX_HEADER_LIST_SIZE = 0x6
+
+# Error Codes
+NO_ERROR = 0x0
+PROTOCOL_ERROR = 0x1
+INTERNAL_ERROR = 0x2
+FLOW_CONTROL_ERROR = 0x3
+STREAM_CLOSED = 0x5
+FRAME_SIZE_ERROR = 0x6
+REFUSED_STREAM = 0x7
+CANCEL = 0x8
+COMPRESSION_ERROR = 0x9
+ENHANCE_YOUR_CALM = 0xb
+
+DEFAULT_WINDOW_SIZE = 65535
+DEFAULT_MAX_FRAME_SIZE = 16384
+MAX_FRAME_SIZE = 16777215
+MAX_WINDOW_SIZE = 0x7fffffff
+DEFAULT_WEIGHT = 16
+
+# Received data is acknowledged with a WINDOW_UPDATE once this much of a
+# window has been used, rather than frame by frame.
+WINDOW_UPDATE_THRESHOLD = DEFAULT_WINDOW_SIZE // 2
+
+# How much response data is written to the connection at once. More is
+# written whenever the connection's send buffer empties.
+WRITE_SIZE = 65536
+
+# Headers that only apply to a single HTTP/1 connection. They aren't allowed
+# in HTTP/2 requests, and are left out of HTTP/2 responses.
+CONNECTION_HEADERS = frozenset(('connection', 'keep-alive', 'proxy-connection',
+                                'transfer-encoding', 'upgrade'))
+
+_FRAME_HEADER = struct.Struct('!IBI')
+_PRIORITY = struct.Struct('!IB')
+_SETTING = struct.Struct('!HI')
+_GOAWAY = struct.Struct('!II')
+_UINT32 = struct.Struct('!I')
+
+###############################################################################
+# Exceptions
+###############################################################################
+
+class _ConnectionError(Exception):
+    """
+    An error that ends the whole connection.
+    """
+    def __init__(self, code, message):
+        Exception.__init__(self, message)
+        self.code = code
+
+class _StreamError(Exception):
+    """
+    An error that only ends a single stream.
+    """
+    def __init__(self, stream_id, code, message):
+        Exception.__init__(self, message)
+        self.stream_id = stream_id
+        self.code = code
+
+###############################################################################
+# Private Helper Functions
+###############################################################################
+
+def _frame(type, flags, stream_id, payload=''):
+    """
+    Return a frame with the given type, flags and payload.
+    """
+    return _FRAME_HEADER.pack(len(payload) << 8 | type, flags,
+                              stream_id) + payload
+
+def _unpad(flags, payload):
+    """
+    Remove the padding from a DATA or HEADERS frame's payload.
+    """
+    if not flags & FLAG_PADDED:
+        return payload
+
+    if not payload or ord(payload[0]) >= len(payload):
+        raise _ConnectionError(PROTOCOL_ERROR, 'Invalid padding.')
+
+    return payload[1:len(payload) - ord(payload[0])]
+
+###############################################################################
+# HTTP2Connection Class
+###############################################################################
+
+class HTTP2Connection(object):
+    """
+    The HTTP/2 protocol, running on an
+    :class:`~pants.http.server.HTTPConnection`. The connection's ``on_read``
+    handler is replaced, and the connection passes its write, close and
+    timeout events on.
+
+    Each stream is received as an instance of ``request_class``, which
+    writes its response to a stand-in for the connection that turns it into
+    HTTP/2 frames.
+
+    ==============  ============
+    Argument        Description
+    ==============  ============
+    connection      The :class:`~pants.http.server.HTTPConnection` to use.
+    request_class   The class of the requests to create, usually :class:`~pants.http.server.HTTPRequest`.
+    preface         *Optional.* The part of the connection preface that hasn't been read from the connection yet.
+    ==============  ============
+    """
+    def __init__(self, connection, request_class, preface=PREFACE):
+        server = connection.server
+        self.connection = connection
+        self.server = server
+        self._request_class = request_class
+        self._preface = preface
+        self._buffer = ''
+
+        # Streams
+        self._streams = {}
+        self._last_stream_id = 0
+        self._stream_count = 0
+        self._header_block = None
+        self._closing = False
+        self._idle_since = connection.engine.latest_poll_time
+
+        # Header Compression
+        self._decoder = Decoder(DEFAULT_TABLE_SIZE, server.max_header_size)
+        self._encoder = Encoder()
+
+        # Flow Control
+        self._initial_window = DEFAULT_WINDOW_SIZE
+        self._max_frame_size = DEFAULT_MAX_FRAME_SIZE
+        self._send_window = DEFAULT_WINDOW_SIZE
+        self._recv_window = DEFAULT_WINDOW_SIZE
+        self._recv_unacked = 0
+
+        # Priority. Every stream is a node in a tree with the connection, 0,
+        # at its root. Each node's children share its bandwidth by weight,
+        # with every child having a virtual time that advances by the amount
+        # sent for it divided by its weight. The ready child with the lowest
+        # virtual time goes next.
+        self._parents = {}
+        self._children = {0: []}
+        self._weights = {}
+        self._vtime = {}
+        self._clock = {0: 0}
+
+        # Output
+        self._ready = set()
+        self._control = []
+        self._reading = False
+        self._flushing = False
+
+        connection.on_read = self._on_read
+        connection.read_delimiter = None
+
+        self._send_frame(SETTINGS, 0, 0, ''.join((
+            _SETTING.pack(SETTINGS_MAX_CONCURRENT_STREAMS,
+                          server.http2_max_streams),
+            _SETTING.pack(SETTINGS_MAX_HEADER_LIST_SIZE,
+                          server.max_header_size),
+            )))
+        self._set_timeout()
+
+    ##### Event Handlers ######################################################
+
+    def _on_read(self, data):
+        """
+        Read frames from the connection, and then write anything that's been
+        queued up while handling them.
+        """
+        if self._buffer:
+            data = self._buffer + data
+            self._buffer = ''
+
+        pos = 0
+        preface = self._preface
+        if preface:
+            received = data[:len(preface)]
+            if not preface.startswith(received):
+                log.info('Invalid HTTP/2 connection preface from %r.',
+                    self.connection.remote_address)
+                self.connection.close(False)
+                return
+
+            self._preface = preface[len(received):]
+            pos = len(received)
+
+        end = len(data)
+        connection = self.connection
+        self._reading = True
+        try:
+            while end - pos >= 9:
+                type_length, flags, stream_id = _FRAME_HEADER.unpack_from(
+                    data, pos)
+                length = type_length >> 8
+                if length > DEFAULT_MAX_FRAME_SIZE:
+                    raise _ConnectionError(FRAME_SIZE_ERROR,
+                                           'Frame too large (%d).' % length)
+
+                if end - pos - 9 < length:
+                    break
+
+                payload = data[pos + 9:pos + 9 + length]
+                pos += 9 + length
+
+                try:
+                    self._read_frame(type_length & 0xff, flags,
+                                     stream_id & MAX_WINDOW_SIZE, payload)
+                except _StreamError as err:
+                    log.info('HTTP/2 stream error from %r: %s',
+                        connection.remote_address, err)
+                    self._reset(err.stream_id, err.code)
+
+                if connection._closed:
+                    return
+
+            self._buffer = data[pos:]
+
+        except _ConnectionError as err:
+            log.info('HTTP/2 connection error from %r: %s',
+                connection.remote_address, err)
+            self._close(err.code, str(err))
+            return
+
+        finally:
+            self._reading = False
+
+        self._flush()
+
+    def _on_write(self):
+        self._flush()
+
+    def _on_close(self):
+        for stream in self._streams.itervalues():
+            stream.connected = False
+            if stream.request is not None:
+                self.server._release(stream.request)
+        self._streams.clear()
+        self._ready.clear()
+
+    def _check_timeout(self, now):
+        """
+        Called by the server when the connection's deadline may have passed.
+        """
+        deadline = self._deadline()
+        if deadline is None:
+            self.connection._deadline = None
+            return
+
+        elif deadline > now:
+            self.server._set_deadline(self.connection, deadline)
+            return
+
+        self.connection._deadline = None
+        log.info('Timed out waiting for %s from %r.',
+            'a request body' if self._streams else 'a request',
+            self.connection.remote_address)
+        self._close(NO_ERROR)
+
+    ##### Frames ##############################################################
+
+    def _read_frame(self, type, flags, stream_id, payload):
+        """
+        Handle a single frame. Frames of unknown types are ignored.
+        """
+        if self._header_block is not None and type != CONTINUATION:
+            raise _ConnectionError(PROTOCOL_ERROR,
+                                   'Expected a CONTINUATION frame.')
+
+        if type == DATA:
+            self._read_data(flags, stream_id, payload)
+        elif type == HEADERS:
+            self._read_headers(flags, stream_id, payload)
+        elif type == WINDOW_UPDATE:
+            self._read_window_update(stream_id, payload)
+        elif type == SETTINGS:
+            self._read_settings(flags, stream_id, payload)
+        elif type == PING:
+            self._read_ping(flags, stream_id, payload)
+        elif type == PRIORITY:
+            self._read_priority(stream_id, payload)
+        elif type == RST_STREAM:
+            self._read_rst_stream(stream_id, payload)
+        elif type == GOAWAY:
+            self._read_goaway(stream_id)
+        elif type == CONTINUATION:
+            self._read_continuation(flags, stream_id, payload)
+        elif type == PUSH_PROMISE:
+            raise _ConnectionError(PROTOCOL_ERROR,
+                                   'Clients may not push streams.')
+
+    def _read_data(self, flags, stream_id, payload):
+        if not stream_id:
+            raise _ConnectionError(PROTOCOL_ERROR, 'DATA frame on stream 0.')
+
+        # The connection's window is credited straight away, as each
+        # stream's window limits what it may hold.
+        size = len(payload)
+        self._recv_window -= size
+        if self._recv_window < 0:
+            raise _ConnectionError(FLOW_CONTROL_ERROR,
+                                   'Connection window exceeded.')
+        self._recv_unacked += size
+        if self._recv_unacked >= WINDOW_UPDATE_THRESHOLD:
+            self._send_frame(WINDOW_UPDATE, 0, 0,
+                             _UINT32.pack(self._recv_unacked))
+            self._recv_window += self._recv_unacked
+            self._recv_unacked = 0
+
+        data = _unpad(flags, payload)
+
+        stream = self._streams.get(stream_id)
+        if stream is None:
+            if stream_id > self._last_stream_id:
+                raise _ConnectionError(PROTOCOL_ERROR,
+                                       'DATA frame on idle stream.')
+            # The stream has been reset, and data that was already in
+            # flight is ignored.
+            return
+
+        elif stream.remote_closed:
+            raise _StreamError(stream_id, STREAM_CLOSED,
+                               'DATA frame on closed stream.')
+
+        stream.recv_window -= size
+        if stream.recv_window < 0:
+            raise _StreamError(stream_id, FLOW_CONTROL_ERROR,
+                               'Stream window exceeded.')
+
+        stream._read_body(data, flags & FLAG_END_STREAM, size)
+
+    def _read_headers(self, flags, stream_id, payload):
+        if not stream_id:
+            raise _ConnectionError(PROTOCOL_ERROR,
+                                   'HEADERS frame on stream 0.')
+
+        block = _unpad(flags, payload)
+
+        priority = None
+        if flags & FLAG_PRIORITY:
+            if len(block) < 5:
+                raise _ConnectionError(FRAME_SIZE_ERROR,
+                                       'HEADERS frame too short.')
+            dependency, weight = _PRIORITY.unpack_from(block)
+            priority = (dependency & MAX_WINDOW_SIZE, weight + 1,
+                        bool(dependency >> 31))
+            block = block[5:]
+
+        if flags & FLAG_END_HEADERS:
+            self._end_headers(stream_id, flags, priority, block)
+        else:
+            self._header_block = (stream_id, flags, priority, [block])
+
+    def _read_continuation(self, flags, stream_id, payload):
+        pending = self._header_block
+        if pending is None or pending[0] != stream_id:
+            raise _ConnectionError(PROTOCOL_ERROR,
+                                   'Unexpected CONTINUATION frame.')
+
+        fragments = pending[3]
+        fragments.append(payload)
+        if sum(map(len, fragments)) > self.server.max_header_size + \
+                DEFAULT_MAX_FRAME_SIZE:
+            raise _ConnectionError(ENHANCE_YOUR_CALM,
+                                   'Header block too large.')
+
+        if flags & FLAG_END_HEADERS:
+            self._header_block = None
+            self._end_headers(stream_id, pending[1], pending[2],
+                              ''.join(fragments))
+
+    def _end_headers(self, stream_id, flags, priority, block):
+        """
+        Handle a complete header block, which either starts a new stream or
+        holds the trailers of a request body.
+        """
+        # Every block must be decoded, to keep the decoder's table in step
+        # with the client's.
+        try:
+            headers = self._decoder.decode(block)
+        except HPACKError as err:
+            raise _ConnectionError(COMPRESSION_ERROR, str(err))
+
+        stream = self._streams.get(stream_id)
+        if stream is not None:
+            if stream.remote_closed:
+                raise _StreamError(stream_id, STREAM_CLOSED,
+                                   'HEADERS frame on closed stream.')
+            elif not flags & FLAG_END_STREAM:
+                raise _StreamError(stream_id, PROTOCOL_ERROR,
+                                   'Trailers must end the stream.')
+
+            # Trailers are discarded, as for HTTP/1.
+            if priority is not None:
+                self._prioritize(stream_id, *priority)
+            stream._read_body('', True, 0)
+            return
+
+        if stream_id <= self._last_stream_id or not stream_id % 2:
+            raise _ConnectionError(PROTOCOL_ERROR,
+                                   'Invalid stream identifier %d.' % stream_id)
+        self._last_stream_id = stream_id
+
+        # Once GOAWAY has been sent or received, no new streams are started.
+        if self._closing:
+            return
+
+        if len(self._streams) >= self.server.http2_max_streams:
+            raise _StreamError(stream_id, REFUSED_STREAM,
+                               'Too many concurrent streams.')
+
+        if priority is not None:
+            self._prioritize(stream_id, *priority)
+        elif not stream_id in self._parents:
+            self._prioritize(stream_id, 0, DEFAULT_WEIGHT, False)
+
+        self._open_stream(stream_id, headers, flags & FLAG_END_STREAM)
+
+    def _read_window_update(self, stream_id, payload):
+        if len(payload) != 4:
+            raise _ConnectionError(FRAME_SIZE_ERROR,
+                                   'Invalid WINDOW_UPDATE frame.')
+
+        increment = _UINT32.unpack(payload)[0] & MAX_WINDOW_SIZE
+
+        if not stream_id:
+            if not increment:
+                raise _ConnectionError(PROTOCOL_ERROR,
+                                       'Invalid WINDOW_UPDATE increment.')
+
+            self._send_window += increment
+            if self._send_window > MAX_WINDOW_SIZE:
+                raise _ConnectionError(FLOW_CONTROL_ERROR,
+                                       'Connection window too large.')
+
+            for stream in self._streams.itervalues():
+                if stream._output:
+                    self._stream_ready(stream)
+            return
+
+        stream = self._streams.get(stream_id)
+        if stream is None:
+            if stream_id > self._last_stream_id:
+                raise _ConnectionError(PROTOCOL_ERROR,
+                                       'WINDOW_UPDATE frame on idle stream.')
+            return
+
+        elif not increment:
+            raise _StreamError(stream_id, PROTOCOL_ERROR,
+                               'Invalid WINDOW_UPDATE increment.')
+
+        stream.send_window += increment
+        if stream.send_window > MAX_WINDOW_SIZE:
+            raise _StreamError(stream_id, FLOW_CONTROL_ERROR,
+                               'Stream window too large.')
+
+        if stream._output:
+            self._stream_ready(stream)
+
+    def _read_settings(self, flags, stream_id, payload):
+        if stream_id:
+            raise _ConnectionError(PROTOCOL_ERROR,
+                                   'SETTINGS frame on a stream.')
+
+        if flags & FLAG_ACK:
+            if payload:
+                raise _ConnectionError(FRAME_SIZE_ERROR,
+                                       'Invalid SETTINGS acknowledgement.')
+            return
+
+        if len(payload) % 6:
+            raise _ConnectionError(FRAME_SIZE_ERROR, 'Invalid SETTINGS frame.')
+
+        for pos in xrange(0, len(payload), 6):
+            setting, value = _SETTING.unpack_from(payload, pos)
+
+            if setting == SETTINGS_HEADER_TABLE_SIZE:
+                # The client's limit is respected, but the table isn't made
+                # any bigger than the default.
+                self._encoder.resize(min(value, DEFAULT_TABLE_SIZE))
+
+            elif setting == SETTINGS_ENABLE_PUSH:
+                if value > 1:
+                    raise _ConnectionError(PROTOCOL_ERROR,
+                                           'Invalid SETTINGS_ENABLE_PUSH.')
+
+            elif setting == SETTINGS_INITIAL_WINDOW_SIZE:
+                if value > MAX_WINDOW_SIZE:
+                    raise _ConnectionError(FLOW_CONTROL_ERROR,
+                        'Invalid SETTINGS_INITIAL_WINDOW_SIZE.')
+
+                # The change applies to the windows of open streams too.
+                delta = value - self._initial_window
+                self._initial_window = value
+                for stream in self._streams.itervalues():
+                    stream.send_window += delta
+                    if stream.send_window > MAX_WINDOW_SIZE:
+                        raise _ConnectionError(FLOW_CONTROL_ERROR,
+                                               'Stream window too large.')
+                    if delta > 0 and stream._output:
+                        self._stream_ready(stream)
+
+            elif setting == SETTINGS_MAX_FRAME_SIZE:
+                if not DEFAULT_MAX_FRAME_SIZE <= value <= MAX_FRAME_SIZE:
+                    raise _ConnectionError(PROTOCOL_ERROR,
+                                           'Invalid SETTINGS_MAX_FRAME_SIZE.')
+                self._max_frame_size = value
+
+        self._send_frame(SETTINGS, FLAG_ACK, 0)
+
+    def _read_ping(self, flags, stream_id, payload):
+        if len(payload) != 8:
+            raise _ConnectionError(FRAME_SIZE_ERROR, 'Invalid PING frame.')
+        elif stream_id:
+            raise _ConnectionError(PROTOCOL_ERROR, 'PING frame on a stream.')
+
+        if not flags & FLAG_ACK:
+            self._send_frame(PING, FLAG_ACK, 0, payload)
+
+    def _read_priority(self, stream_id, payload):
+        if not stream_id:
+            raise _ConnectionError(PROTOCOL_ERROR,
+                                   'PRIORITY frame on stream 0.')
+        elif len(payload) != 5:
+            raise _StreamError(stream_id, FRAME_SIZE_ERROR,
+                               'Invalid PRIORITY frame.')
+
+        # Closed streams are gone from the tree, and the number of idle
+        # streams that may be given a priority is limited.
+        if not stream_id in self._parents:
+            if stream_id <= self._last_stream_id or len(self._parents) >= \
+                    2 * self.server.http2_max_streams:
+                return
+
+        dependency, weight = _PRIORITY.unpack(payload)
+        self._prioritize(stream_id, dependency & MAX_WINDOW_SIZE, weight + 1,
+                         bool(dependency >> 31))
+
+    def _read_rst_stream(self, stream_id, payload):
+        if len(payload) != 4:
+            raise _ConnectionError(FRAME_SIZE_ERROR,
+                                   'Invalid RST_STREAM frame.')
+        elif not stream_id or stream_id > self._last_stream_id:
+            raise _ConnectionError(PROTOCOL_ERROR,
+                                   'RST_STREAM frame on idle stream.')
+
+        self._remove_stream(stream_id)
+
+    def _read_goaway(self, stream_id):
+        if stream_id:
+            raise _ConnectionError(PROTOCOL_ERROR, 'GOAWAY frame on a stream.')
+
+        # Finish the streams in progress, and then close the connection.
+        self._closing = True
+
+    ##### Streams #############################################################
+
+    def _open_stream(self, stream_id, headers, end_stream):
+        """
+        Create a request for a new stream, and either call the request
+        handler or prepare to read the request body.
+        """
+        server = self.server
+        connection = self.connection
+
+        method = path = authority = None
+        scheme = None
+        fields = {}
+        regular = False
+
+        try:
+            for name, value in headers:
+                if name[:1] == ':':
+                    if regular:
+                        raise BadRequest('Pseudo-header after a header.')
+                    elif name == ':method' and method is None:
+                        method = value
+                    elif name == ':path' and path is None:
+                        path = value
+                    elif name == ':scheme' and scheme is None:
+                        scheme = value
+                    elif name == ':authority' and authority is None:
+                        authority = value
+                    else:
+                        raise BadRequest('Invalid pseudo-header %r.' % name)
+                    continue
+
+                regular = True
+                if name in CONNECTION_HEADERS or name.lower() != name or \
+                        name == 'te' and value != 'trailers':
+                    raise BadRequest('Invalid header %r.' % name)
+
+                # Cookies may be split into separate headers to compress
+                # better, but must be passed on as one.
+                if name == 'cookie' and name in fields:
+                    fields[name] = '%s; %s' % (fields[name], value)
+                elif name in fields or name == 'content-length':
+                    _add_header(fields, name, value)
+                else:
+                    fields[name] = value
+
+            if not method or not path or not scheme:
+                raise BadRequest('Missing pseudo-header.')
+
+        except BadRequest as err:
+            raise _StreamError(stream_id, PROTOCOL_ERROR, str(err))
+
+        if authority and not 'host' in fields:
+            fields['host'] = authority
+        headers = HTTPHeaders(_store=fields)
+
+        stream = _HTTP2Stream(self, stream_id)
+        self._streams[stream_id] = stream
+
+        request = self._request_class(stream, method, path, 'HTTP/2.0',
+            headers, 'https' if connection.ssl_enabled else 'http')
+        stream.request = request
+
+        # Once the connection has carried enough requests, let the client
+        # know no more will be accepted.
+        self._stream_count += 1
+        max_requests = server.max_requests_per_connection
+        if not server.keep_alive or \
+                max_requests and self._stream_count >= max_requests:
+            self._shutdown()
+
+        if end_stream:
+            stream.remote_closed = True
+            self._set_timeout()
+            self._dispatch(stream)
+            return
+
+        stream._body_length = length = headers.get_int('Content-Length')
+        self._set_timeout()
+
+        if server.stream_body:
+            request.body = None
+            stream._body_request = request
+            self._dispatch(stream)
+            return
+
+        if length and length > server.max_request and \
+                connection._multipart_boundary(request) is None:
+            stream._reject(BadRequest((
+                'Provided Content-Length (%d) larger than server limit %d.'
+                ) % (length, server.max_request),
+                code='413 Request Entity Too Large'))
+            return
+
+        parser = connection._multipart_parser(request)
+        if parser is not None:
+            stream._body_parser = parser
+        else:
+            stream._body_parts = []
+
+    def _dispatch(self, stream):
+        """
+        Call the server's request handler for a stream's request.
+        """
+        request = stream.request
+        if not self.server._admit(request):
+            return
+
+        try:
+            self.server.request_handler(request)
+        except Exception:
+            log.exception('Error handling HTTP request.')
+            if request._started:
+                if stream.connected:
+                    self._reset(stream.id, INTERNAL_ERROR)
+            else:
+                request.send_response("500 Internal Server Error", 500)
+
+    def _reset(self, stream_id, code):
+        """
+        Reset a stream, ending it straight away.
+        """
+        self._send_frame(RST_STREAM, 0, stream_id, _UINT32.pack(code))
+        self._remove_stream(stream_id)
+
+    def _remove_stream(self, stream_id):
+        """
+        Forget about a stream that has ended.
+        """
+        stream = self._streams.pop(stream_id, None)
+        if stream is not None:
+            stream.connected = False
+            if stream.request is not None:
+                self.server._release(stream.request)
+            if not self._streams:
+                self._idle_since = self.connection.engine.latest_poll_time
+
+        self._ready.discard(stream_id)
+        self._remove_node(stream_id)
+        self._set_timeout()
+
+        if self._closing and not self._streams and not self._reading:
+            self._flush()
+
+    def _shutdown(self):
+        """
+        Tell the client that no more streams will be accepted. The
+        connection is closed once the streams in progress have ended.
+        """
+        if not self._closing:
+            self._closing = True
+            self._send_frame(GOAWAY, 0, 0,
+                             _GOAWAY.pack(self._last_stream_id, NO_ERROR))
+
+    def _close(self, code, message=''):
+        """
+        Send GOAWAY and close the connection, abandoning any streams in
+        progress.
+        """
+        connection = self.connection
+        self._closing = True
+        self._on_close()
+
+        self._control.append(_frame(GOAWAY, 0, 0,
+            _GOAWAY.pack(self._last_stream_id, code) + message))
+        connection.write(''.join(self._control))
+        self._control = []
+        connection.close()
+
+    ##### Timeouts ############################################################
+
+    def _deadline(self):
+        """
+        Return the time at which the connection times out. Idle connections
+        are subject to the server's keep-alive timeout, and connections with
+        request bodies in progress to its body timeout.
+        """
+        server = self.server
+        if not self._streams:
+            if server.keep_alive_timeout:
+                return self._idle_since + server.keep_alive_timeout
+
+        elif server.body_timeout:
+            for stream in self._streams.itervalues():
+                if not stream.remote_closed and not stream._body_paused:
+                    return self.connection._last_read + server.body_timeout
+
+    def _set_timeout(self):
+        deadline = self._deadline()
+        if deadline is None:
+            self.connection._deadline = None
+        else:
+            self.server._set_deadline(self.connection, deadline)
+
+    ##### Priority ############################################################
+
+    def _prioritize(self, stream_id, dependency, weight, exclusive):
+        """
+        Move a stream to its place in the priority tree.
+        """
+        if dependency == stream_id:
+            raise _StreamError(stream_id, PROTOCOL_ERROR,
+                               'A stream may not depend on itself.')
+
+        parents = self._parents
+        children = self._children
+
+        # Dependencies on streams that aren't in the tree are replaced with
+        # the default priority.
+        if dependency and not dependency in parents:
+            dependency, weight, exclusive = 0, DEFAULT_WEIGHT, False
+
+        old = parents.get(stream_id)
+        if old is None:
+            children[stream_id] = []
+        else:
+            children[old].remove(stream_id)
+
+            # A stream made to depend on one of its own descendants has that
+            # descendant take its old place first.
+            node = dependency
+            while node:
+                node = parents[node]
+                if node == stream_id:
+                    children[parents[dependency]].remove(dependency)
+                    parents[dependency] = old
+                    children[old].append(dependency)
+                    break
+
+        if exclusive:
+            for child in children[dependency]:
+                parents[child] = stream_id
+                children[stream_id].append(child)
+            children[dependency] = []
+
+        parents[stream_id] = dependency
+        children[dependency].append(stream_id)
+        self._weights[stream_id] = weight
+        self._vtime[stream_id] = self._clock.get(dependency, 0)
+
+    def _remove_node(self, stream_id):
+        """
+        Remove a stream from the priority tree. Its children take its place.
+        """
+        parents = self._parents
+        parent = parents.pop(stream_id, None)
+        if parent is None:
+            return
+
+        children = self._children
+        children[parent].remove(stream_id)
+        for child in children.pop(stream_id):
+            parents[child] = parent
+            children[parent].append(child)
+
+        del self._weights[stream_id]
+        del self._vtime[stream_id]
+        self._clock.pop(stream_id, None)
+
+    def _next_stream(self):
+        """
+        Return the ready stream that should send next. Starting at the root,
+        the child with the lowest virtual time that either is ready or has
+        ready descendants is chosen, until a ready stream is reached.
+        """
+        ready = self._ready
+        if len(ready) == 1:
+            for stream_id in ready:
+                return stream_id
+
+        children = self._children
+        vtime = self._vtime
+        node = 0
+        while True:
+            best = None
+            for child in children[node]:
+                if (best is None or vtime[child] < vtime[best]) and \
+                        (child in ready or self._has_ready(child)):
+                    best = child
+
+            if best is None:
+                return next(iter(ready))
+            elif best in ready:
+                return best
+            node = best
+
+    def _has_ready(self, node):
+        ready = self._ready
+        for child in self._children[node]:
+            if child in ready or self._has_ready(child):
+                return True
+        return False
+
+    def _charge(self, stream_id, size):
+        """
+        Advance the virtual times of a stream and its ancestors after
+        sending data for it.
+        """
+        parents = self._parents
+        weights = self._weights
+        vtime = self._vtime
+        clock = self._clock
+
+        node = stream_id
+        while node:
+            parent = parents[node]
+            clock[parent] = vtime[node]
+            vtime[node] += size * 256 // weights[node]
+            node = parent
+
+    def _stream_ready(self, stream):
+        """
+        Called when a stream may have something to send.
+        """
+        stream_id = stream.id
+        if not stream_id in self._streams:
+            return
+
+        if not stream_id in self._ready:
+            self._ready.add(stream_id)
+
+            # A stream that has been idle starts again from its parent's
+            # current virtual time, rather than catching up.
+            parents = self._parents
+            vtime = self._vtime
+            clock = self._clock
+            node = stream_id
+            while node:
+                parent = parents[node]
+                if vtime[node] < clock.get(parent, 0):
+                    vtime[node] = clock[parent]
+                node = parent
+
+        if not self._reading:
+            self._flush()
+
+    ##### Output ##############################################################
+
+    def _send_frame(self, type, flags, stream_id, payload=''):
+        """
+        Queue a control frame, which is written before any response data.
+        """
+        self._control.append(_frame(type, flags, stream_id, payload))
+        if not self._reading:
+            self._flush()
+
+    def _flush(self):
+        """
+        Write queued control frames, and then response data for as long as
+        the connection's send buffer empties straight away.
+        """
+        connection = self.connection
+        if self._flushing or connection._closed:
+            return
+
+        self._flushing = True
+        try:
+            if self._control:
+                control = self._control
+                self._control = []
+                connection.write(''.join(control))
+
+            ready = self._ready
+            while ready and not connection._send_buffer and \
+                    not connection._closed:
+                out = []
+                size = 0
+                while ready and size < WRITE_SIZE:
+                    frames = self._next_frames()
+                    if frames:
+                        out.append(frames)
+                        size += len(frames)
+
+                if out:
+                    connection.write(''.join(out))
+
+        finally:
+            self._flushing = False
+
+        # Close once everything has been written. Closing with data still
+        # buffered would lose it if this is the connection's on_write.
+        if self._closing and not self._streams and \
+                not connection._send_buffer and not connection._closed:
+            connection.close()
+
+    def _next_frames(self):
+        """
+        Return the next frames for the highest priority ready stream. A
+        stream that can't send anything is no longer ready.
+        """
+        stream_id = self._next_stream()
+        stream = self._streams[stream_id]
+
+        headers = stream._response
+        if headers is not None:
+            stream._response = None
+            end = stream._finished and not stream._output
+            frames = self._header_frames(stream_id,
+                                         self._encoder.encode(headers), end)
+            self._charge(stream_id, len(frames))
+            if end:
+                frames += self._end_stream(stream)
+            return frames
+
+        elif stream._head is not None:
+            self._ready.discard(stream_id)
+            if stream._finished:
+                log.error('Response to %r finished without a status line.',
+                    stream.request)
+                self._reset(stream_id, INTERNAL_ERROR)
+            return ''
+
+        output = stream._output
+        if output:
+            size = min(self._max_frame_size, stream.send_window,
+                       self._send_window)
+            if size <= 0:
+                self._ready.discard(stream_id)
+                return ''
+
+            data = stream._take(size)
+            stream.send_window -= len(data)
+            self._send_window -= len(data)
+            self._charge(stream_id, len(data))
+
+            if stream._finished and not output:
+                return _frame(DATA, FLAG_END_STREAM, stream_id, data) + \
+                       self._end_stream(stream)
+            return _frame(DATA, 0, stream_id, data)
+
+        elif stream._finished:
+            return _frame(DATA, FLAG_END_STREAM, stream_id) + \
+                   self._end_stream(stream)
+
+        self._ready.discard(stream_id)
+        return ''
+
+    def _header_frames(self, stream_id, block, end):
+        """
+        Return a HEADERS frame, followed by CONTINUATION frames if the block
+        is larger than the client's maximum frame size.
+        """
+        flags = FLAG_END_STREAM if end else 0
+        size = self._max_frame_size
+        if len(block) <= size:
+            return _frame(HEADERS, flags | FLAG_END_HEADERS, stream_id, block)
+
+        frames = [_frame(HEADERS, flags, stream_id, block[:size])]
+        for pos in xrange(size, len(block), size):
+            flags = FLAG_END_HEADERS if pos + size >= len(block) else 0
+            frames.append(_frame(CONTINUATION, flags, stream_id,
+                                 block[pos:pos + size]))
+        return ''.join(frames)
+
+    def _end_stream(self, stream):
+        """
+        Forget about a stream that has sent the end of its response. If the
+        request body hasn't all been received, the client is told not to
+        bother sending the rest, with a frame that's returned.
+        """
+        tail = ''
+        if not stream.remote_closed:
+            tail = _frame(RST_STREAM, 0, stream.id, _UINT32.pack(NO_ERROR))
+        self._remove_stream(stream.id)
+        return tail
+
+###############################################################################
+# _HTTP2Stream Class
+###############################################################################
+
+class _HTTP2Stream(object):
+    """
+    A single HTTP/2 stream. It stands in for the connection of the request
+    it carries, turning the HTTP/1 response the request writes into frames
+    for its :class:`HTTP2Connection` to send.
+    """
+
+    # Responses are never held back for earlier requests.
+    _requests = ()
+
+    def __init__(self, http2, stream_id):
+        connection = http2.connection
+        self.http2 = http2
+        self.id = stream_id
+        self.request = None
+
+        self.server = connection.server
+        self.engine = connection.engine
+        self.generation = connection.generation
+        self.remote_address = connection.remote_address
+        self.local_address = connection.local_address
+        self.ssl_enabled = connection.ssl_enabled
+        self.connected = True
+
+        # Request Body
+        self.remote_closed = False
+        self.recv_window = DEFAULT_WINDOW_SIZE
+        self._recv_unacked = 0
+        self._body_request = None
+        self._body_paused = False
+        self._body_parts = None
+        self._body_parser = None
+        self._body_size = 0
+        self._body_length = None
+
+        # Response. The head is collected until it's complete, and then
+        # parsed into the headers to be sent.
+        self.send_window = http2._initial_window
+        self._head = ''
+        self._response = None
+        self._chunked = None
+        self._chunk_remaining = 0
+        self._output = deque()
+        self._finished = False
+
+    ##### I/O Methods #########################################################
+
+    def write(self, data, flush=False):
+        if not self.connected or self._finished:
+            return
+
+        if self._head is not None:
+            head = self._head + data
+            end = head.find(DOUBLE_CRLF)
+            if end == -1:
+                self._head = head
+                return
+
+            self._head = None
+            self._start_response(head[:end])
+            data = head[end + 4:]
+
+        if self._chunked is not None:
+            data = self._dechunk(data)
+
+        if data:
+            self._output.append(data)
+        self.http2._stream_ready(self)
+
+    def write_file(self, sfile, nbytes=0, offset=0):
+        if not self.connected or self._finished:
+            return
+
+        if not nbytes:
+            nbytes = os.fstat(sfile.fileno()).st_size - offset
+        if nbytes > 0:
+            self._output.append((sfile, offset, nbytes))
+        self.http2._stream_ready(self)
+
+    def finish(self, request=None):
+        if not self.connected or self._finished:
+            return
+
+        self._finished = True
+        self.http2._stream_ready(self)
+
+    def close(self, flush=True):
+        """
+        Reset the stream. A response that has been finished is sent in full
+        when ``flush`` is True.
+        """
+        if self.connected and not (flush and self._finished):
+            self.http2._reset(self.id, INTERNAL_ERROR)
+
+    def _pause_reading(self):
+        # Flow control credit is withheld while _body_paused is set.
+        pass
+
+    def _resume_reading(self):
+        self._acknowledge(0)
+        self.http2._set_timeout()
+
+    ##### Request Body ########################################################
+
+    def _read_body(self, data, end, size):
+        """
+        Handle part of the request body, which has used ``size`` bytes of
+        the stream's window.
+        """
+        if end:
+            self.remote_closed = True
+        else:
+            self._acknowledge(size)
+
+        if data:
+            self._body_size += len(data)
+            parts = self._body_parts
+            parser = self._body_parser
+
+            if self._body_request is not None:
+                request = self._body_request
+                if request.on_body_chunk is not None:
+                    self.http2.connection._safely_call(request.on_body_chunk,
+                                                       data)
+
+            elif parts is not None:
+                max_request = self.server.max_request
+                if self._body_size > max_request:
+                    self._reject(BadRequest(
+                        'Request body larger than server limit %d.' %
+                            max_request,
+                        code='413 Request Entity Too Large'))
+                    return
+
+                parts.append(data)
+
+            elif parser is not None:
+                self.request.body_file.write(data)
+                try:
+                    parser.feed(data)
+                except BadRequest as err:
+                    self._reject(err)
+                    return
+
+        if end:
+            self._end_body()
+
+    def _end_body(self):
+        """
+        Called when the whole request body has been received.
+        """
+        http2 = self.http2
+        http2._set_timeout()
+
+        request = self.request
+        parts = self._body_parts
+        parser = self._body_parser
+        self._body_parts = None
+        self._body_parser = None
+
+        if parts is None and parser is None and self._body_request is None:
+            # The request was rejected, and its body discarded.
+            return
+
+        if self._body_length is not None and \
+                self._body_length != self._body_size:
+            self._body_request = None
+            raise _StreamError(self.id, PROTOCOL_ERROR,
+                'Request body does not match its Content-Length.')
+
+        if parts is not None:
+            request.body = ''.join(parts)
+
+        elif parser is not None:
+            try:
+                parser.close()
+            except BadRequest as err:
+                self._reject(err)
+                return
+
+            request.body_file.seek(0)
+
+        else:
+            self._body_request = None
+            self._body_paused = False
+            if request.on_body_end is not None:
+                http2.connection._safely_call(request.on_body_end)
+            return
+
+        http2._dispatch(self)
+
+    def _acknowledge(self, size):
+        """
+        Credit the stream's window with data that has been dealt with,
+        unless the request handler has paused the body.
+        """
+        self._recv_unacked += size
+        unacked = self._recv_unacked
+        if unacked >= WINDOW_UPDATE_THRESHOLD and not self._body_paused and \
+                not self.remote_closed:
+            self.http2._send_frame(WINDOW_UPDATE, 0, self.id,
+                                   _UINT32.pack(unacked))
+            self.recv_window += unacked
+            self._recv_unacked = 0
+
+    def _reject(self, err):
+        """
+        Respond to a request that the request handler hasn't been called
+        for with an error, discarding the rest of its body.
+        """
+        log.info('Bad request from %r: %s', self.remote_address, err)
+        self._body_parts = None
+        self._body_parser = None
+
+        if err.message:
+            self.write('HTTP/2.0 %s%sContent-Type: text/html%s'
+                       'Content-Length: %d%s%s' % (err.code, CRLF, CRLF,
+                       len(err.message), DOUBLE_CRLF, err.message))
+        else:
+            self.write('HTTP/2.0 %s%s' % (err.code, DOUBLE_CRLF))
+        self.finish()
+
+    ##### Response ############################################################
+
+    def _start_response(self, head):
+        """
+        Turn the head of an HTTP/1 response into the headers of a HEADERS
+        frame.
+        """
+        lines = head.split(CRLF)
+        status = lines[0].partition(' ')[2][:3]
+
+        headers = [(':status', status)]
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            name = name.strip().lower()
+            if not name:
+                continue
+
+            elif name in CONNECTION_HEADERS:
+                if name == 'transfer-encoding' and 'chunked' in value.lower():
+                    self._chunked = ''
+                continue
+
+            headers.append((name, value.strip()))
+
+        self._response = headers
+
+    def _dechunk(self, data):
+        """
+        Remove the chunk framing from part of a chunked response body. The
+        stream's _chunk_remaining is the size of the rest of the current
+        chunk, 0 while waiting for a chunk size, -1 while waiting for the
+        line break after a chunk, and -2 once the last chunk has been seen.
+        """
+        data = self._chunked + data
+        remaining = self._chunk_remaining
+        end = len(data)
+        pos = 0
+        out = []
+
+        while pos < end:
+            if remaining > 0:
+                chunk = data[pos:pos + remaining]
+                out.append(chunk)
+                pos += len(chunk)
+                remaining -= len(chunk)
+                if not remaining:
+                    remaining = -1
+
+            elif remaining == -1:
+                if end - pos < 2:
+                    break
+                pos += 2
+                remaining = 0
+
+            elif remaining == 0:
+                eol = data.find(CRLF, pos)
+                if eol == -1:
+                    break
+                try:
+                    remaining = int(data[pos:eol].partition(';')[0], 16)
+                except ValueError:
+                    remaining = 0
+                pos = eol + 2
+                if remaining <= 0:
+                    remaining = -2
+
+            else:
+                # Trailers aren't sent.
+                pos = end
+
+        self._chunked = data[pos:]
+        self._chunk_remaining = remaining
+        return ''.join(out)
+
+    def _take(self, size):
+        """
+        Remove and return up to ``size`` bytes of the response body.
+        """
+        output = self._output
+        out = []
+
+        while output and size > 0:
+            item = output[0]
+            if type(item) is tuple:
+                sfile, offset, nbytes = item
+                sfile.seek(offset)
+                data = sfile.read(min(size, nbytes))
+                if not data or len(data) == nbytes:
+                    output.popleft()
+                    if not data:
+                        continue
+                else:
+                    output[0] = (sfile, offset + len(data), nbytes - len(data))
+
+            elif len(item) > size:
+                data = item[:size]
+                output[0] = item[size:]
+
+            else:
+                data = output.popleft()
+
+            out.append(data)
+            size -= len(data)
+
+        return ''.join(out)
@@ -120,6 +120,46 @@ responses.
 
 Please see the documentation for the :class:`HTTPRequest` class below for more
 information on what you can do.
+
+
+Streaming Request Bodies
+========================
+
+By default, a request body is read into memory before the request handler is
+called, which limits it to ``max_request`` bytes. Bodies sent with
+``Transfer-Encoding: chunked`` are decoded the same way. Large uploads can
+instead be handled as they arrive by creating the server with
+``stream_body=True``::
+
+    def my_handler(request):
+        if request.body is not None:
+            # There's no request body.
+            request.send_response("Nothing to upload.", 400)
+            return
+
+        upload = open('/tmp/upload', 'wb')
+
+        def on_end():
+            upload.close()
+            request.send_response("Thanks!")
+
+        request.on_body_chunk = upload.write
+        request.on_body_end = on_end
+
+    HTTPServer(my_handler, stream_body=True).listen(80)
+
+
+HTTP/2
+======
+
+A server created with ``http2=True`` also accepts
+`HTTP/2 <http://tools.ietf.org/html/rfc7540>`_ connections. When SSL is
+enabled, clients negotiate HTTP/2 with ALPN. Otherwise, clients that know
+the server supports it can start a plain connection with the HTTP/2
+connection preface. Each stream is passed to the request handler as an
+:class:`HTTPRequest`, with a :attr:`~HTTPRequest.protocol` of ``HTTP/2.0``,
+and responses are written exactly as for HTTP/1.x. See
+:mod:`pants.http.http2` for the details.
 """
 
 ###############################################################################
@@ -132,8 +172,13 @@ import json
 import mimetypes
 import os
 import pprint
+import socket
+import ssl
 import sys
+import tempfile
+import zlib
 
+from collections import deque, OrderedDict
 from datetime import datetime, timedelta
 from urlparse import parse_qsl
 
@@ -144,10 +189,13 @@ else:
 
 from pants.stream import Stream
 from pants.server import Server
+from pants.util.filecache import FileCache
 
-from pants.http.utils import BadRequest, CRLF, date, DOUBLE_CRLF, \
-    generate_signature, HTTP, HTTPHeaders, log, parse_multipart, read_headers, \
-    SERVER, WHITESPACE, parse_date
+from pants.http.http2 import HTTP2Connection, PREFACE
+from pants.http.utils import BadRequest, compare_digest, cookie_header, \
+    CRLF, date, DOUBLE_CRLF, generate_signature, HTTP, HTTPHeaders, \
+    http_date, log, MultipartParser, negotiate_encoding, parse_cookies, \
+    parse_date, RequestParser, SERVER
 
 ###############################################################################
 # Exports
@@ -157,6 +205,124 @@ __all__ = (
     "HTTPConnection", "HTTPRequest", "HTTPServer"
 )
 
+###############################################################################
+# Constants
+###############################################################################
+
+# Status lines for every known status code, so they needn't be formatted for
+# each response.
+STATUS_LINES = dict(
+    ((protocol, code), '%s %d %s%s' % (protocol, code, message, CRLF))
+    for protocol in ('HTTP/1.0', 'HTTP/1.1', 'HTTP/2.0')
+    for code, message in HTTP.iteritems())
+
+SERVER_HEADER = 'Server: %s' % SERVER
+
+# The types of response that are compressed by default, as prefixes of the
+# Content-Type header.
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript',
+                      'application/xml', 'application/xhtml+xml',
+                      'application/rss+xml', 'application/atom+xml',
+                      'image/svg+xml')
+
+# Whether HTTP/2 can be negotiated with TLS connections.
+HAS_ALPN = getattr(ssl, 'HAS_ALPN', False)
+
+# What a connection is waiting for, for the purpose of timeouts.
+_IDLE = 1
+_HEADERS = 2
+_BODY = 3
+
+# zlib window sizes for each content coding.
+COMPRESSION_WBITS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,
+    }
+
+# How often the engine's loop lag is measured, in seconds.
+LAG_INTERVAL = 0.1
+
+# The body of the response to requests that are shed by an overloaded server.
+SHED_BODY = 'The server is too busy to handle your request.'
+
+# Sent to connections that are turned away by the server's connection limits.
+SERVICE_UNAVAILABLE = CRLF.join((
+    'HTTP/1.1 503 Service Unavailable',
+    'Content-Length: 0',
+    'Connection: close',
+    'Server: %s' % SERVER,
+    '', ''))
+
+###############################################################################
+# Private Helper Functions
+###############################################################################
+
+def _parse_query(query):
+    """
+    Parse a query string into a dictionary. A variable given more than once
+    has a list of values.
+    """
+    out = {}
+    if query:
+        for key, val in parse_qsl(query, False):
+            if key in out:
+                if isinstance(out[key], list):
+                    out[key].append(val)
+                else:
+                    out[key] = [out[key], val]
+            else:
+                out[key] = val
+    return out
+
+def _parse_range(value, length):
+    """
+    Parse the value of a Range header for an entity of the given length,
+    returning a sorted list of inclusive ``(start, end)`` byte ranges with
+    overlapping and adjacent ranges merged. Ranges that lie entirely past
+    the end of the entity are left out, and a :exc:`ValueError` is raised
+    if the header is malformed.
+    """
+    if not value.startswith('bytes='):
+        raise ValueError("Unsupported range unit.")
+
+    ranges = []
+    for pair in value[6:].split(','):
+        pair = pair.strip()
+        if not pair:
+            continue
+
+        first, sep, last = pair.partition('-')
+        if not sep:
+            raise ValueError("Invalid byte range %r." % pair)
+
+        if not first:
+            # The final x bytes.
+            suffix = int(last)
+            if suffix <= 0:
+                continue
+            start = max(length - suffix, 0)
+            end = length - 1
+        else:
+            start = int(first)
+            end = int(last) if last else length - 1
+            if end < start:
+                raise ValueError("Invalid byte range %r." % pair)
+            end = min(end, length - 1)
+
+        if start < length:
+            ranges.append((start, end))
+
+    ranges.sort()
+    out = []
+    for start, end in ranges:
+        if out and start <= out[-1][1] + 1:
+            if end > out[-1][1]:
+                out[-1] = (out[-1][0], end)
+        else:
+            out.append((start, end))
+
+    return out
+
 ###############################################################################
 # HTTPConnection Class
 ###############################################################################
@@ -179,21 +345,62 @@ class HTTPConnection(Stream):
         # Request State Storage
         self.current_request = None
         self._finished = False
+        self._parser = None
+        self._http2 = None
+
+        # Timeouts. The server checks deadlines, so no timer is needed here.
+        self._request_count = 0
+        self._timeout_phase = None
+        self._deadline = None
+        self._deadline_slot = None
+        self._last_read = 0
+
+        # Request Body State
+        self._body_request = None
+        self._body_parts = None
+        self._body_parser = None
+        self._body_size = 0
+        self._body_remaining = 0
+        self._body_paused = False
+
+        # Requests whose responses haven't been written yet, in the order
+        # they were received. Only the first may write to the socket.
+        self._requests = deque()
 
         # Read the initial request.
         self._await_request()
 
     ##### I/O Methods #########################################################
 
-    def finish(self):
+    def finish(self, request=None):
         """
-        This method should be called when the response to the current
-        request has been completed, in preparation for either closing the
-        connection or attempting to read a new request from the connection.
+        This method should be called when the response to a request has been
+        completed, in preparation for either closing the connection or
+        attempting to read a new request from the connection.
 
         This method is called automatically when you use the method
         :meth:`HTTPRequest.finish`.
+
+        If pipelined requests are being handled, the responses are written
+        in the order the requests were received. A request that finishes
+        before the ones ahead of it has its response held until they are
+        done.
+
+        =========  ============
+        Argument   Description
+        =========  ============
+        request    *Optional.* The request that has been completed. Defaults to the oldest unfinished request.
+        =========  ============
         """
+        requests = self._requests
+        if request is None:
+            request = requests[0] if requests else self.current_request
+
+        request._complete = True
+
+        if requests and requests[0] is not request:
+            return
+
         self.flush()
         self._finished = True
         if not self._send_buffer:
@@ -201,76 +408,274 @@ class HTTPConnection(Stream):
 
     ##### Public Event Handlers ###############################################
 
+    def on_connect(self):
+        # Clients that negotiated HTTP/2 with ALPN start with its preface.
+        if self.ssl_enabled and self.server.http2 and HAS_ALPN and \
+                self._socket.selected_alpn_protocol() == 'h2':
+            self._start_http2(PREFACE)
+            return
+
+        self._set_timeout(_HEADERS)
+
     def on_write(self):
-        if self._finished:
+        if self._http2 is not None:
+            self._http2._on_write()
+        elif self._finished:
             self._request_finished()
 
     def on_close(self):
+        self._deadline = None
+        if self._http2 is not None:
+            self._http2._on_close()
+
         # Clear the on_read method to ensure that the connection is collected
         # immediately.
         del self.on_read
 
     ##### Internal Event Handlers #############################################
 
+    def _handle_read_event(self):
+        # Remember when data last arrived, for the body timeout.
+        self._last_read = self.engine.latest_poll_time
+        Stream._handle_read_event(self)
+
     def _await_request(self):
         """
         Sets the read handler and read delimiter to prepare to read an HTTP
         request from the socket.
         """
         self.on_read = self._read_header
-        self.read_delimiter = DOUBLE_CRLF
+        self.read_delimiter = None
+
+        if self._request_count:
+            self._set_timeout(_IDLE)
+
+    def _start_http2(self, preface):
+        """
+        Switch the connection to HTTP/2, expecting the given part of the
+        connection preface to be read next.
+        """
+        self._timeout_phase = None
+        self._http2 = HTTP2Connection(self, HTTPRequest, preface)
+
+    def _set_timeout(self, phase):
+        """
+        Start timing the given phase of reading a request. Idle keep-alive
+        connections aren't timed while a response is in progress.
+        """
+        server = self.server
+        self._timeout_phase = phase
+
+        if phase == _IDLE:
+            timeout = None if self._requests else server.keep_alive_timeout
+        elif phase == _HEADERS:
+            timeout = server.header_timeout
+        else:
+            timeout = server.body_timeout
+
+        if timeout:
+            server._set_deadline(self, self.engine.latest_poll_time + timeout)
+        else:
+            self._deadline = None
+
+    def _check_timeout(self, now):
+        """
+        Called by the server when the connection's deadline may have passed.
+        Deadlines that have moved are rescheduled, rather than being updated
+        every time something happens.
+        """
+        if self._http2 is not None:
+            self._http2._check_timeout(now)
+            return
+
+        server = self.server
+        phase = self._timeout_phase
+        deadline = self._deadline
+
+        if phase == _IDLE and self._requests:
+            self._deadline = None
+            return
+
+        elif phase == _BODY:
+            if self._body_paused:
+                deadline = now + server.body_timeout
+            else:
+                deadline = max(deadline, self._last_read + server.body_timeout)
+
+        if deadline > now:
+            server._set_deadline(self, deadline)
+            return
+
+        self._deadline = None
+        log.info('Timed out waiting for %s from %r.',
+            ('a request', 'request headers', 'a request body')[phase - 1],
+            self.remote_address)
+
+        # Don't write an error response if a response is already in progress,
+        # or the request handler is reading the body.
+        if phase == _IDLE or self._requests:
+            self.close(False)
+        else:
+            self._send_error(BadRequest('Request timed out.',
+                                        code='408 Request Timeout'))
+
+    def _keep_alive(self, request):
+        """
+        Whether or not the connection may be used for another request after
+        the given one.
+        """
+        if not self.server.keep_alive or request._last:
+            return False
+
+        headers = request.headers
+        connection = headers.get('Connection','').lower()
+
+        if request.protocol == 'HTTP/1.1':
+            return connection != 'close'
+
+        elif 'Content-Length' in headers or \
+                request.method in ('HEAD','GET'):
+            return connection == 'keep-alive'
+
+        return False
 
     def _request_finished(self):
         """
-        If keep-alive is supported, and the server configuration allows, then
-        the connection will be prepared to read another request. Otherwise, the
-        connection will be closed.
+        Called once the response to the oldest request has been written. If
+        keep-alive is supported, and the server configuration allows, then
+        the next pipelined response, if any, is written and the connection
+        continues reading requests. Otherwise, the connection will be closed.
         """
-        disconnect = True
+        requests = self._requests
 
-        if self.server.keep_alive:
-            headers = self.current_request.headers
-            connection = headers.get('Connection','').lower()
+        while True:
+            if requests:
+                request = requests.popleft()
+            else:
+                request = self.current_request
 
-            if self.current_request.protocol == 'HTTP/1.1':
-                disconnect = connection == 'close'
+            if request is self.current_request:
+                self.current_request = None
+            self._finished = False
 
-            elif 'Content-Length' in headers or \
-                    self.current_request.method in ('HEAD','GET'):
-                disconnect = connection != 'keep-alive'
+            if request is None or not self._keep_alive(request):
+                self.on_read = None
+                self.close()
+                return
 
-        self.current_request = None
-        self._finished = False
+            if not requests:
+                break
 
-        if disconnect:
-            self.on_read = None
-            self.close()
+            # Write the next response, which was held back until now.
+            request = requests[0]
+            if request._output:
+                self._send_buffer.extend(request._output)
+                request._output = None
+
+            if not request._complete:
+                if self._send_buffer:
+                    self._start_waiting_for_write_event()
+                break
+
+            self.flush()
+            self._finished = True
+            if self._send_buffer:
+                return
+
+        if not requests and self._timeout_phase == _IDLE:
+            self._set_timeout(_IDLE)
+
+        if self._reading_paused and not self._body_paused and \
+                len(requests) < self.server.pipeline_depth:
+            self._resume_reading()
+
+    def _dispatch(self, request, streaming=False):
+        """
+        Call the server's request handler for a newly received request.
+
+        Unless the connection won't be kept alive after the request, the
+        connection goes on to read the next request straight away, so
+        pipelined requests can be handled concurrently. Reading pauses when
+        the server's ``pipeline_depth`` requests are in progress. If the
+        request's body is being streamed, this happens once the body has
+        been read instead.
+        """
+        self._requests.append(request)
+
+        self._request_count += 1
+        max_requests = self.server.max_requests_per_connection
+        if max_requests and self._request_count >= max_requests:
+            request._last = True
+
+        if not streaming:
+            self._read_next(request)
+
+        if not self.server._admit(request):
+            return
+
+        try:
+            # Call the request handler.
+            self.server.request_handler(request)
+        except Exception:
+            log.exception('Error handling HTTP request.')
+            if request._started:
+                self.close(False)
+            else:
+                request.send_response("500 Internal Server Error", 500)
+                self.close()
+
+    def _read_next(self, request):
+        """
+        Prepare to read the request after the given one, if there will be
+        one, pausing if too many requests are in progress.
+        """
+        if not self._keep_alive(request):
+            self._deadline = None
+            self._pause_reading()
         else:
             self._await_request()
+            if len(self._requests) >= self.server.pipeline_depth:
+                self._pause_reading()
 
     def _read_header(self, data):
         """
         Read the headers of an HTTP request from the socket, and the request
         body if necessary, into a new HTTPRequest instance. Then, assuming that
         the headers are valid, call the server's request handler.
+
+        Data is passed to the connection's :class:`RequestParser` as it
+        arrives. Anything received after the end of the headers is returned
+        to the receive buffer, to be read as the body or the next request.
         """
+        if self._timeout_phase != _HEADERS:
+            self._set_timeout(_HEADERS)
+
         try:
-            initial_line, _, data = data.partition(CRLF)
+            parser = self._parser
+            if parser is None:
+                server = self.server
+                parser = self._parser = RequestParser(server.max_line,
+                    server.max_headers, server.max_header_size)
+
+            rest = parser.feed(data)
+            if rest is None:
+                return
 
-            try:
-                method, url, protocol = WHITESPACE.split(initial_line) #.split(' ')
-            except ValueError:
-                raise BadRequest('Invalid HTTP request line.')
+            if rest:
+                self._recv_buffer = rest + self._recv_buffer
 
-            if not protocol.startswith('HTTP/'):
-                raise BadRequest('Invalid HTTP protocol version.',
-                                 code='505 HTTP Version Not Supported')
+            method = parser.method
+            url = parser.url
+            protocol = parser.protocol
+            headers = parser.headers
+            parser.reset()
 
-            # Parse the headers.
-            if data:
-                headers = read_headers(data)
-            else:
-                headers = {}
+            # A client with prior knowledge of HTTP/2 support starts with its
+            # connection preface, which parses as a request with no headers.
+            if method == 'PRI' and url == '*' and protocol == 'HTTP/2.0' and \
+                    self.server.http2 and not self._request_count:
+                self._start_http2(PREFACE[PREFACE.index('SM'):])
+                return
 
             # If we're secure, we're HTTPs.
             if self.ssl_enabled:
@@ -282,24 +687,63 @@ class HTTPConnection(Stream):
             self.current_request = request = HTTPRequest(self,
                 method, url, protocol, headers, scheme)
 
-            # If we have a Content-Length header, read the request body.
-            length = headers.get('Content-Length')
-            if length:
-                if not isinstance(length, int):
+            # If we have a Content-Length header, or a chunked body, read
+            # the request body.
+            length = headers.get_int('Content-Length')
+            chunked = False
+
+            encoding = headers.get('Transfer-Encoding')
+            if encoding:
+                if encoding.strip().lower() != 'chunked':
                     raise BadRequest(
-                        'Provided Content-Length (%r) is invalid.' % length
-                        )
-                elif length > self.server.max_request:
+                        'Unsupported Transfer-Encoding (%r).' % encoding,
+                        code='501 Not Implemented')
+                elif length is not None:
+                    raise BadRequest('Content-Length and Transfer-Encoding '
+                                     'may not both be provided.')
+                chunked = True
+
+            elif length:
+                if length > self.server.max_request and \
+                        not self.server.stream_body and \
+                        self._multipart_boundary(request) is None:
                     raise BadRequest((
                         'Provided Content-Length (%d) larger than server '
                         'limit %d.'
                         ) % (length, self.server.max_request),
                         code='413 Request Entity Too Large')
 
-                if headers.get('Expect','').lower() == '100-continue':
+            if length or chunked:
+                self._set_timeout(_BODY)
+
+                # Don't interleave the interim response with a pipelined
+                # response that's still being written.
+                if not self._requests and \
+                        headers.get('Expect','').lower() == '100-continue':
                     self.write("%s 100 (Continue)%s" % (
                         protocol, DOUBLE_CRLF))
 
+                if self.server.stream_body:
+                    # Let the request handler read the body as it arrives.
+                    request.body = None
+                    self._start_body(request, chunked, length)
+                    self._dispatch(request, True)
+                    return
+
+                parser = self._multipart_parser(request)
+                if parser is not None:
+                    # Parse the body as it arrives, so that uploaded files
+                    # needn't be held in memory.
+                    self._start_body(request, chunked, length)
+                    self._body_parser = parser
+                    return
+
+                elif chunked:
+                    # Collect the chunks before parsing the body.
+                    self._start_body(request, True)
+                    self._body_parts = []
+                    return
+
                 # Await a request body.
                 self.on_read = self._read_request_body
                 self.read_delimiter = length
@@ -308,16 +752,7 @@ class HTTPConnection(Stream):
         except BadRequest as err:
             log.info('Bad request from %r: %s',
                 self.remote_address, err)
-            
-            self.write('HTTP/1.1 %s%s' % (err.code, CRLF))
-            if err.message:
-                self.write('Content-Type: text/html%s' % CRLF)
-                self.write('Content-Length: %d%s' % (len(err.message),
-                                                     DOUBLE_CRLF))
-                self.write(err.message)
-            else:
-                self.write(CRLF)
-            self.close()
+            self._send_error(err)
             return
 
         except Exception as err:
@@ -329,16 +764,7 @@ class HTTPConnection(Stream):
             self.close()
             return
 
-        try:
-            # Call the request handler.
-            self.server.request_handler(request)
-        except Exception:
-            log.exception('Error handling HTTP request.')
-            if request._started:
-                self.close(False)
-            else:
-                request.send_response("500 Internal Server Error", 500)
-                self.close()
+        self._dispatch(request)
 
     def _read_request_body(self, data):
         """
@@ -348,46 +774,245 @@ class HTTPConnection(Stream):
         request = self.current_request
         request.body = data
 
+        # Valid multipart bodies are parsed as they're read, and urlencoded
+        # bodies when request.post is first used.
+        if request.method in ('POST','PUT') and request.headers.get(
+                'Content-Type', '').startswith('multipart/form-data'):
+            log.warning('Invalid multipart/form-data.')
+
+        self._dispatch(request)
+
+    ##### Request Bodies ######################################################
+
+    def _multipart_boundary(self, request):
+        """
+        Return the boundary of the given request's body if it's a
+        ``multipart/form-data`` body, or None.
+        """
+        if request.method not in ('POST','PUT'):
+            return
+
+        content_type = request.headers.get('Content-Type', '')
+        if not content_type.startswith('multipart/form-data'):
+            return
+
+        for field in content_type.split(';'):
+            key, _, value = field.strip().partition('=')
+            if key == 'boundary' and value:
+                return value
+
+    def _multipart_parser(self, request):
+        """
+        Return a :class:`MultipartParser` for the given request if it has a
+        ``multipart/form-data`` body, or None. The raw body is spooled to
+        the request's :attr:`~HTTPRequest.body_file` as it's parsed, and
+        ``max_request`` limits the size of each part rather than the body.
+        """
+        boundary = self._multipart_boundary(request)
+        if boundary is None:
+            return
+
+        server = self.server
+        request.body_file = tempfile.SpooledTemporaryFile(server.spool_size)
+        return MultipartParser(request, boundary, server.spool_size,
+                               max_part=server.max_request)
+
+    def _start_body(self, request, chunked, length=0):
+        """
+        Prepare to read the body of the given request piece by piece, either
+        in chunks or up to its Content-Length.
+        """
+        self._body_request = request
+        self._body_size = 0
+        self._body_paused = False
+
+        if chunked:
+            self.on_read = self._read_chunk_size
+            self.read_delimiter = CRLF
+        else:
+            self._body_remaining = length
+            self.on_read = self._read_body
+            self.read_delimiter = None
+
+    def _read_body(self, data):
+        """
+        Read part of a request body with a known Content-Length.
+        """
+        remaining = self._body_remaining
+        if len(data) > remaining:
+            self._recv_buffer = data[remaining:] + self._recv_buffer
+            data = data[:remaining]
+
+        self._body_remaining = remaining = remaining - len(data)
+        self._body_data(data)
+
+        if not remaining and self._body_request is not None:
+            self._body_finished()
+
+    def _read_chunk_size(self, line):
+        """
+        Read the line that starts a chunk of a chunked request body.
+        """
+        size = line.partition(';')[0].strip()
         try:
-            content_type = request.headers.get('Content-Type', '')
-            if request.method in ('POST','PUT'):
-                if content_type.startswith('application/x-www-form-urlencoded'):
-                    post = request.post
-                    for key, val in parse_qsl(data, False):
-                        if key in post:
-                            if isinstance(post[key], list):
-                                post[key].append(val)
-                            else:
-                                post[key] = [post[key], val]
-                        else:
-                            post[key] = val
-
-                elif content_type.startswith('multipart/form-data'):
-                    for field in content_type.split(';'):
-                        key, _, value = field.strip().partition('=')
-                        if key == 'boundary' and value:
-                            parse_multipart(request, value, data)
-                            break
-                    else:
-                        log.warning('Invalid multipart/form-data.')
+            size = int(size, 16)
+            if size < 0:
+                raise ValueError
+        except ValueError:
+            self._body_error(BadRequest('Invalid chunk size (%r).' % size))
+            return
 
-        except BadRequest as err:
-            log.info('Bad request from %r: %s',
-                self.remote_address, err)
+        if not size:
+            # The last chunk. Skip past any trailers.
+            self.on_read = self._read_chunk_trailer
+            return
 
-            request.send_response(err.message, err.code)
-            self.close()
+        self._body_remaining = size
+        self.on_read = self._read_chunk_data
+        self.read_delimiter = None
+
+    def _read_chunk_data(self, data):
+        """
+        Read part of a chunk of a chunked request body.
+        """
+        remaining = self._body_remaining
+        if len(data) > remaining:
+            self._recv_buffer = data[remaining:] + self._recv_buffer
+            data = data[:remaining]
+
+        self._body_remaining = remaining = remaining - len(data)
+        if not remaining:
+            self.on_read = self._read_chunk_end
+            self.read_delimiter = CRLF
+
+        self._body_data(data)
+
+    def _read_chunk_end(self, data):
+        """
+        Read the line break that ends a chunk of a chunked request body.
+        """
+        if data:
+            self._body_error(BadRequest('Invalid chunked request body.'))
             return
 
+        self.on_read = self._read_chunk_size
+
+    def _read_chunk_trailer(self, line):
+        """
+        Read and discard the trailers of a chunked request body, until the
+        empty line that ends it.
+        """
+        if not line:
+            self._body_finished()
+
+    def _body_data(self, data):
+        """
+        Pass part of a request body to the request's ``on_body_chunk``, or
+        collect it if the body isn't being streamed.
+        """
+        if not data:
+            return
+
+        self._body_size += len(data)
+        request = self._body_request
+
+        parts = self._body_parts
+        parser = self._body_parser
+        if parts is None and parser is None:
+            if request.on_body_chunk is not None:
+                self._safely_call(request.on_body_chunk, data)
+            return
+
+        if parts is not None:
+            if self._body_size > self.server.max_request:
+                self._body_error(BadRequest(
+                    'Request body larger than server limit %d.' %
+                        self.server.max_request,
+                    code='413 Request Entity Too Large'))
+                return
+
+            parts.append(data)
+            return
+
+        request.body_file.write(data)
         try:
-            self.server.request_handler(request)
-        except Exception:
-            log.exception('Error handling HTTP request.')
-            if request._started:
-                self.close(False)
-            else:
-                request.send_response("500 Internal Server Error", 500)
-                self.close()
+            parser.feed(data)
+        except BadRequest as err:
+            self._body_error(err)
+
+    def _body_finished(self):
+        """
+        Called when the whole of a request body has been read.
+        """
+        request = self._body_request
+        parts = self._body_parts
+        parser = self._body_parser
+        self._body_request = None
+        self._body_parts = None
+        self._body_parser = None
+
+        if parts is not None:
+            self._read_request_body(''.join(parts))
+            return
+
+        elif parser is not None:
+            try:
+                parser.close()
+            except BadRequest as err:
+                log.info('Bad request from %r: %s',
+                    self.remote_address, err)
+                self._send_error(err)
+                return
+
+            request.body_file.seek(0)
+            self._dispatch(request)
+            return
+
+        self._body_paused = False
+        self._read_next(request)
+
+        if request.on_body_end is not None:
+            self._safely_call(request.on_body_end)
+
+        # Reading may have been paused by the request handler, but the body
+        # is done with, so carry on as for any other request.
+        if self._reading_paused and self._keep_alive(request) and \
+                len(self._requests) < self.server.pipeline_depth:
+            self._resume_reading()
+
+    def _body_error(self, err):
+        """
+        Deal with an invalid request body. If the request handler has
+        already been called, there's nothing to do but close the connection.
+        """
+        log.info('Bad request from %r: %s',
+            self.remote_address, err)
+
+        streaming = self._body_parts is None and self._body_parser is None
+        self._body_request = None
+        self._body_parts = None
+        self._body_parser = None
+        self._pause_reading()
+
+        if streaming:
+            self.close(False)
+        else:
+            self._send_error(err)
+
+    def _send_error(self, err):
+        """
+        Respond to a bad request that the request handler hasn't been called
+        for, and close the connection.
+        """
+        self.write('HTTP/1.1 %s%s' % (err.code, CRLF))
+        if err.message:
+            self.write('Content-Type: text/html%s' % CRLF)
+            self.write('Content-Length: %d%s' % (len(err.message),
+                                                 DOUBLE_CRLF))
+            self.write(err.message)
+        else:
+            self.write(CRLF)
+        self.close()
 
 ###############################################################################
 # HTTPRequest Class
@@ -402,17 +1027,71 @@ class HTTPRequest(object):
 
     HTTPRequest uses :class:`bytes` rather than :class:`str` unless otherwise
     stated, as network communications take place as bytes.
+
+    When the server's ``stream_body`` option is set, the request handler is
+    called as soon as the request's headers have been read, and the body is
+    not collected into :attr:`body`, which is ``None``. Instead, each piece of the body is
+    passed to :attr:`on_body_chunk` as it arrives, and :attr:`on_body_end`
+    is called once the whole body has been read. Use :meth:`pause_body` and
+    :meth:`resume_body` to stop the client sending more while earlier data
+    is being dealt with.
+
+    A ``multipart/form-data`` body is parsed as it arrives, into :attr:`post`
+    and :attr:`files`, rather than being collected into :attr:`body`, which
+    stays empty. The raw body is kept instead in :attr:`body_file`, a
+    file-like object that's moved to disk once it grows larger than the
+    server's ``spool_size``. For any other request, :attr:`body_file` is
+    ``None``.
+
+    When the server's ``compression`` option is set, responses of a suitable
+    type are compressed if the client accepts it. A response with a
+    ``Content-Length`` is collected and compressed once the whole body has
+    been sent. A chunked response is compressed a chunk at a time, as long
+    as it's written with :meth:`send_chunk`. Set :attr:`compress` to False
+    before sending the headers to send a response as it is.
     """
 
+    __slots__ = ('body', 'body_file', '_connection', '_generation', 'method', 'url',
+                 'protocol', 'headers', 'scheme', 'host', 'path', 'query',
+                 'fragment', '_started', '_output', '_complete', '_last',
+                 'compress', '_encoder', '_encoding', '_held_headers',
+                 '_compress_length', '_compress_data', '_remote_address',
+                 '_remote_ip',
+                 '_hostname', '_get', '_post', '_files', '_cookies',
+                 '_cookie_values', '_cookies_out', '_start', '_finish', '_first_byte',
+                 '_status', '_bytes_sent', '_in_flight', 'on_body_chunk',
+                 'on_body_end', '__dict__')
+
     def __init__(self, connection, method, url, protocol, headers=None,
                  scheme='http'):
         self.body       = ''
-        self.connection = connection
+        self.body_file  = None
+        self._connection = connection
+        self._generation = connection.generation
         self.method     = method
         self.url        = url
         self.protocol   = protocol
         self._started   = False
 
+        # Pipelining. A response written while an earlier request is still
+        # being answered is held in _output.
+        self._output    = None
+        self._complete  = False
+
+        # Whether the connection closes after this request.
+        self._last      = False
+
+        # Whether the request counts towards the server's in_flight.
+        self._in_flight = False
+
+        # Response Compression
+        self.compress   = True
+        self._encoder   = None
+        self._encoding  = None
+        self._held_headers = None
+        self._compress_length = None
+        self._compress_data = None
+
         if headers is None:
             self.headers = {}
         else:
@@ -420,37 +1099,35 @@ class HTTPRequest(object):
 
         # X-Headers
         if connection.server.xheaders:
-            remote_ip = self.headers.get('X-Real-IP')
-            if not remote_ip:
-                remote_ip = self.headers.get('X-Forwarded-For')
-                if not remote_ip:
-                    remote_ip = connection.remote_address
-                    if not isinstance(remote_ip, basestring):
-                        remote_ip = remote_ip[0]
-                else:
-                    remote_ip = remote_ip.partition(',')[0].strip()
-
-            self.remote_ip = remote_ip
             self.scheme = self.headers.get('X-Forwarded-Proto', scheme)
         else:
-            self.remote_ip = connection.remote_address
-            if not isinstance(self.remote_ip, basestring):
-                self.remote_ip = self.remote_ip[0]
-            self.scheme   = scheme
+            self.scheme = scheme
 
         # Calculated Variables
         self.host       = self.headers.get('Host', '127.0.0.1')
 
+        # The peer address is taken now, as the connection may be closed or
+        # serving another client by the time remote_ip is used.
+        self._remote_address = connection.remote_address
+
         # Timing Information
-        self._start     = time()
+        self._start     = connection.engine.latest_poll_time
         self._finish    = None
 
-        # Request Variables
-        self.post       = {}
-        self.files      = {}
+        # For the server's access log. The status is read from the start of
+        # the response.
+        self._first_byte = None
+        self._status    = None
+        self._bytes_sent = 0
 
-        # Split the URL into usable information.
-        self._parse_url()
+        # Streaming Request Bodies
+        self.on_body_chunk = None
+        self.on_body_end   = None
+
+        # Split the URL into usable information. The query string, and any
+        # other request variables, are only parsed when they're used.
+        self.path, _, query = url.partition('?')
+        self.query, _, self.fragment = query.partition('#')
 
     def __repr__(self):
         attr = ('protocol','method','scheme','host','url','path','time')
@@ -489,6 +1166,23 @@ class HTTPRequest(object):
 
     ##### Properties ##########################################################
 
+    @property
+    def connection(self):
+        """
+        The :class:`HTTPConnection` this request was received on.
+
+        If the server is recycling connections (see
+        :attr:`pants.server.Server.connection_pool_size`) and the
+        connection has since been reused for another client, accessing
+        this raises a :exc:`RuntimeError` rather than letting a late
+        response reach the wrong client.
+        """
+        connection = self._connection
+        if connection.generation != self._generation:
+            raise RuntimeError("%s refers to a recycled connection." %
+                               self.__class__.__name__)
+        return connection
+
     @property
     def cookies(self):
         """
@@ -500,14 +1194,24 @@ class HTTPRequest(object):
             return self._cookies
         except AttributeError:
             self._cookies = cookies = Cookie.SimpleCookie()
-            if 'Cookie' in self.headers:
-                raw = self.headers['Cookie']
-                if isinstance(raw, list):
-                    for i in raw:
-                        cookies.load(i)
-                else:
-                    cookies.load(raw)
-            return self._cookies
+            for name, value in self._parse_cookies().iteritems():
+                try:
+                    cookies[name] = value
+                except Cookie.CookieError:
+                    pass
+            return cookies
+
+    def _parse_cookies(self):
+        """
+        Return a dictionary of the values of the cookies received with this
+        request, which is cheaper to build than :attr:`cookies`.
+        """
+        try:
+            return self._cookie_values
+        except AttributeError:
+            raw = self.headers.get('Cookie')
+            self._cookie_values = values = parse_cookies(raw) if raw else {}
+            return values
 
     @property
     def cookies_out(self):
@@ -521,6 +1225,110 @@ class HTTPRequest(object):
             self._cookies_out = cookies = Cookie.SimpleCookie()
             return cookies
 
+    @property
+    def get(self):
+        """
+        A dictionary of the variables in the request's query string. A
+        variable given more than once has a list of values.
+        """
+        try:
+            return self._get
+        except AttributeError:
+            self._get = get = _parse_query(self.query)
+            return get
+
+    @get.setter
+    def get(self, value):
+        self._get = value
+
+    @property
+    def post(self):
+        """
+        A dictionary of the variables in an
+        ``application/x-www-form-urlencoded`` or ``multipart/form-data``
+        request body. A variable given more than once has a list of values.
+        """
+        try:
+            return self._post
+        except AttributeError:
+            body = self.body
+            if body and self.method in ('POST','PUT') and \
+                    self.headers.get('Content-Type', '').startswith(
+                        'application/x-www-form-urlencoded'):
+                self._post = post = _parse_query(body)
+            else:
+                self._post = post = {}
+            return post
+
+    @post.setter
+    def post(self, value):
+        self._post = value
+
+    @property
+    def files(self):
+        """
+        A dictionary of the files uploaded in a ``multipart/form-data``
+        request body, each a :class:`~pants.http.utils.MultipartFile`.
+        """
+        try:
+            return self._files
+        except AttributeError:
+            self._files = files = {}
+            return files
+
+    @files.setter
+    def files(self, value):
+        self._files = value
+
+    @property
+    def hostname(self):
+        """
+        The lower-cased :attr:`host` the request was sent to, without a port.
+        """
+        try:
+            return self._hostname
+        except AttributeError:
+            netloc = self.host.lower()
+            if '[' in netloc and ']' in netloc:
+                hostname = netloc.split(']')[0][1:]
+            elif ':' in netloc:
+                hostname = netloc.split(':')[0]
+            else:
+                hostname = netloc
+            self._hostname = hostname
+            return hostname
+
+    @property
+    def remote_ip(self):
+        """
+        The IP address of the client. When the server's ``xheaders`` option
+        is set, this is taken from the ``X-Real-IP`` or ``X-Forwarded-For``
+        header if there is one.
+        """
+        try:
+            return self._remote_ip
+        except AttributeError:
+            remote_ip = None
+            if self._connection.server.xheaders:
+                remote_ip = self.headers.get('X-Real-IP')
+                if not remote_ip:
+                    remote_ip = self.headers.get('X-Forwarded-For')
+                    if remote_ip:
+                        remote_ip = remote_ip.partition(',')[0].strip()
+
+            if not remote_ip:
+                remote_ip = self._remote_address
+                if remote_ip is not None and not isinstance(remote_ip,
+                                                            basestring):
+                    remote_ip = remote_ip[0]
+
+            self._remote_ip = remote_ip
+            return remote_ip
+
+    @remote_ip.setter
+    def remote_ip(self, value):
+        self._remote_ip = value
+
     @property
     def full_url(self):
         """
@@ -608,36 +1416,78 @@ class HTTPRequest(object):
         """
         Return the signed cookie with the key ``name`` if it exists and has a
         valid signature. Otherwise, return None.
+
+        Cookies that have been verified are remembered by the server, so a
+        client sending the same cookie again doesn't need it to be verified
+        and decoded again. Values decoded from JSON are shared between those
+        requests, and should be copied rather than modified.
         """
-        if not name in self.cookies:
+        raw = self._parse_cookies().get(name)
+        if raw is None:
             return None
 
-        try:
-            value, expires, ts, signature = self.cookies[name].value.rsplit('|', 3)
-            expires = int(expires)
-            ts = int(ts)
-        except (AttributeError, ValueError):
-            return None
+        server = self.connection.server
+        cache = server._cookie_cache
+        entry = cache.pop(raw, None)
 
-        v = base64.b64encode(str(value))
-        sig = generate_signature(self.connection.server.cookie_secret, expires, ts, v)
+        if entry is None:
+            try:
+                value, expires, ts, signature = raw.rsplit('|', 3)
+                expires = int(expires)
+                ts = int(ts)
+            except ValueError:
+                return None
+
+            v = base64.b64encode(value)
+            sig = generate_signature(server.cookie_secret, expires, ts, v)
+            if not compare_digest(signature, sig):
+                return None
+
+            # Process value
+            vtype = value[:1]
+            if vtype == b"j":
+                value = json.loads(value[1:])
+            elif vtype == b"u":
+                value = value[1:].decode("utf-8")
+            else:
+                value = value[1:]
 
-        if signature != sig or ts < time() - expires or ts > time() + expires:
+            entry = (value, expires, ts)
+
+        value, expires, ts = entry
+        now = time()
+        if ts < now - expires or ts > now + expires:
             return None
 
-        # Process value
-        vtype = value[:1]
-        if vtype == b"j":
-            value = json.loads(value[1:])
-        elif vtype == b"u":
-            value = value[1:].decode("utf-8")
-        else:
-            value = value[1:]
+        if server.cookie_cache_size:
+            cache[raw] = entry
+            if len(cache) > server.cookie_cache_size:
+                cache.popitem(last=False)
 
         return value
 
     ##### I/O Methods #########################################################
 
+    def pause_body(self):
+        """
+        Stop reading the request body from the client until
+        :meth:`resume_body` is called. Only has an effect while a streamed
+        body is being read.
+        """
+        connection = self.connection
+        if connection._body_request is self:
+            connection._body_paused = True
+            connection._pause_reading()
+
+    def resume_body(self):
+        """
+        Continue reading a request body after :meth:`pause_body`.
+        """
+        connection = self.connection
+        if connection._body_request is self and connection._body_paused:
+            connection._body_paused = False
+            connection._resume_reading()
+
     def finish(self):
         """
         This function should be called when the response has been completed,
@@ -649,7 +1499,19 @@ class HTTPRequest(object):
         of the HTTP server, if it will work at all.
         """
         self._finish = time()
-        self.connection.finish()
+        server = self._connection.server
+        server._release(self)
+
+        if self._held_headers is not None:
+            if self._compress_length is not None:
+                self._send_compressed()
+            else:
+                self._send_held_headers()
+
+        if server.access_log is not None:
+            server.access_log.record(self)
+
+        self.connection.finish(self)
 
     def send(self, data):
         """
@@ -662,7 +1524,61 @@ class HTTPRequest(object):
         =========  ============
         """
         self._started = True
-        self.connection.write(data)
+
+        if self._held_headers is not None:
+            if self._compress_length is not None:
+                # Collect the body, to be compressed once it's all here.
+                self._compress_data.append(data)
+                self._compress_length -= len(data)
+                if self._compress_length <= 0:
+                    self._send_compressed()
+                return
+
+            # The body is being chunked by hand, so it can't be compressed.
+            self._send_held_headers()
+
+        self._write(data)
+
+    def send_chunk(self, data):
+        """
+        Write a chunk of a response that was sent with the
+        ``Transfer-Encoding: chunked`` header, compressing it if the
+        response is being compressed. Writing an empty chunk ends the
+        response body.
+
+        =========  ============
+        Argument   Description
+        =========  ============
+        data       A string of data to be sent to the client.
+        =========  ============
+        """
+        self._started = True
+
+        encoder = self._encoder
+        if encoder is not None:
+            if self._held_headers is not None:
+                self._send_held_headers('Content-Encoding: %s' %
+                                        self._encoding)
+
+            if data:
+                data = encoder.compress(data) + \
+                       encoder.flush(zlib.Z_SYNC_FLUSH)
+                if not data:
+                    return
+            else:
+                self._encoder = None
+                tail = encoder.flush()
+                self._write('%x%s%s%s0%s' % (len(tail), CRLF, tail, CRLF,
+                                             DOUBLE_CRLF))
+                return
+
+        elif self._held_headers is not None:
+            self._send_held_headers()
+
+        if data:
+            self._write('%x%s%s%s' % (len(data), CRLF, data, CRLF))
+        else:
+            self._write('0%s' % DOUBLE_CRLF)
 
     def send_cookies(self, keys=None, end_headers=False):
         """
@@ -683,24 +1599,23 @@ class HTTPRequest(object):
         self._started = True
         if keys is None:
             if hasattr(self, '_cookies_out'):
-                out = self.cookies_out.output()
+                out = CRLF.join([cookie_header(morsel) for morsel in
+                                 self._cookies_out.itervalues()])
             else:
                 out = ''
         else:
-            out = []
-            for k in keys:
-                if not k in self.cookies_out:
-                    continue
-                out.append(self.cookies_out[k].output())
-            out = CRLF.join(out)
+            cookies = self.cookies_out
+            out = CRLF.join([cookie_header(cookies[k]) for k in keys
+                             if k in cookies])
 
-        if not out.endswith(CRLF):
+        # Nothing is written for an empty set of cookies, which would
+        # otherwise end the headers early.
+        if out:
             out += CRLF
-
         if end_headers:
-            self.connection.write('%s%s' % (out, CRLF))
-        else:
-            self.connection.write(out)
+            out += CRLF
+        if out:
+            self._write(out)
 
     def send_file(self, path, filename=None, guess_mime=True, headers=None):
         """
@@ -712,7 +1627,9 @@ class HTTPRequest(object):
         headers, Ranges, and the `sendfile <http://www.kernel.org/doc/man-pages/online/pages/man2/sendfile.2.html>`_
         system call to improve file transfer performance. Additionally, if the
         client had made a ``HEAD`` request, the contents of the file will not
-        be transferred.
+        be transferred. A request for several ranges is answered with a
+        ``multipart/byteranges`` response, with overlapping and adjacent
+        ranges merged.
 
         .. note::
 
@@ -737,6 +1654,9 @@ class HTTPRequest(object):
         """
         self._started = True
 
+        # Files are sent as they are, rather than read into memory.
+        self.compress = False
+
         # The base path
         base = self.connection.server.file_root
         if not base:
@@ -800,8 +1720,18 @@ class HTTPRequest(object):
         if not os.path.isabs(path):
             path = os.path.join(base, path)
 
-        # Let's start with some information on the file.
-        stat = os.stat(path)
+        # Let's start with some information on the file. With a file cache,
+        # a hot file is usually already open.
+        cache = getattr(self.connection.server, 'file_cache', None)
+        if cache is not None:
+            try:
+                f, stat = cache.open(path)
+            except IOError:
+                self.send_response('You do not have permission to access that file.', 403)
+                return
+        else:
+            f = None
+            stat = os.stat(path)
 
         modified = datetime.fromtimestamp(stat.st_mtime)
         expires = datetime.utcnow() + timedelta(days=7)
@@ -870,15 +1800,16 @@ class HTTPRequest(object):
                     del self.headers['Range']
 
         # Open the file.
-        if not os.access(path, os.R_OK):
-            self.send_response('You do not have permission to access that file.', 403)
-            return
+        if f is None:
+            if not os.access(path, os.R_OK):
+                self.send_response('You do not have permission to access that file.', 403)
+                return
 
-        try:
-            f = open(path, 'rb')
-        except IOError:
-            self.send_response('You do not have permission to access that file.', 403)
-            return
+            try:
+                f = open(path, 'rb')
+            except IOError:
+                self.send_response('You do not have permission to access that file.', 403)
+                return
 
         # If we have no Range header, just do things the easy way.
         if not 'Range' in self.headers:
@@ -888,80 +1819,75 @@ class HTTPRequest(object):
             self.send_headers(headers)
 
             if self.method != 'HEAD':
-                self.connection.write_file(f)
+                self._write_file(f)
 
             self.finish()
             return
 
-        # Start parsing the Range header.
+        # Parse the Range header. Ranges that can't be satisfied are dropped,
+        # and a 416 is only sent if none are left.
         length = stat.st_size
-        start = length - 1
-        end = 0
-
         try:
-            if not self.headers['Range'].startswith('bytes='):
-                raise ValueError
-
-            for pair in self.headers['Range'][6:].split(','):
-                pair = pair.strip()
-
-                if pair.startswith('-'):
-                    # Final x bytes.
-                    val = int(pair[1:])
-                    if val > length:
-                        raise ValueError
-
-                    end = length - 1
-
-                    s = length - val
-                    if s < start:
-                        start = s
+            ranges = _parse_range(self.headers['Range'], length)
+        except ValueError:
+            ranges = None
 
-                elif pair.endswith('-'):
-                    # Everything past x.
-                    val = int(pair[:-1])
-                    if val > length - 1:
-                        raise ValueError
+        if not ranges:
+            self.send_response('416 Requested Range Not Satisfiable', 416)
+            return
 
-                    end = length - 1
-                    if val < start:
-                        start = val
+        # A single range is sent as it is, with a Content-Range header.
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            total = 1 + (end - start)
+            headers['Content-Range'] = 'bytes %d-%d/%d' % (start, end, length)
+            headers['Content-Length'] = total
 
-                else:
-                    s, e = map(int, pair.split('-'))
-                    if start < 0 or start > end or end > length - 1:
-                        raise ValueError
+            self.send_status(206)
+            self.send_headers(headers)
 
-                    if s < start:
-                        start = s
+            if self.method != 'HEAD':
+                if end == length - 1:
+                    total = 0
 
-                    if e > end:
-                        end = e
+                self._write_file(f, total, start)
 
-        except ValueError:
-            # Any ValueErrors need to send a 416 error response.
-            self.send_response('416 Requested Range Not Satisfiable', 416)
+            self.finish()
             return
 
-        # Set the Content-Range header, and the Content-Length.
-        total = 1 + (end - start)
-        headers['Content-Range'] = 'bytes %d-%d/%d' % (start, end, length)
-        headers['Content-Length'] = total
+        # Several ranges are sent as the parts of a multipart/byteranges
+        # body. Only the part headers are built here; the ranges themselves
+        # are still written straight from the file.
+        boundary = os.urandom(12).encode('hex')
+        part_type = headers['Content-Type']
+        headers['Content-Type'] = 'multipart/byteranges; boundary=%s' % boundary
+
+        parts = []
+        total = 0
+        for start, end in ranges:
+            head = '%s--%s%sContent-Type: %s%sContent-Range: bytes %d-%d/%d%s' % (
+                CRLF, boundary, CRLF, part_type, CRLF, start, end, length,
+                DOUBLE_CRLF)
+            parts.append((head, start, 1 + (end - start)))
+            total += len(head) + 1 + (end - start)
+
+        tail = '%s--%s--%s' % (CRLF, boundary, CRLF)
+        headers['Content-Length'] = total + len(tail)
 
-        # Now, send the response.
         self.send_status(206)
         self.send_headers(headers)
 
         if self.method != 'HEAD':
-            if end == length - 1:
-                total = 0
-
-            self.connection.write_file(f, nbytes=total, offset=start)
+            for head, start, nbytes in parts:
+                self._write(head)
+                self._write_file(f, nbytes, start)
+            self._write(tail)
 
         self.finish()
 
 
-    def send_headers(self, headers, end_headers=True, cookies=True):
+    def send_headers(self, headers, end_headers=True, cookies=True,
+                     block=None):
         """
         Write a dictionary of HTTP headers to the client.
 
@@ -971,11 +1897,14 @@ class HTTPRequest(object):
         headers                 A dictionary of HTTP headers.
         end_headers   True      *Optional.* If this is set to True, a double CRLF sequence will be written at the end of the cookie headers, signifying the end of the HTTP headers segment and the beginning of the response.
         cookies       True      *Optional.* If this is set to True, HTTP cookies will be sent along with the headers.
+        block         None      *Optional.* A :class:`~pants.http.utils.HeaderBlock` of pre-serialized headers to send as well. It must not contain any of the headers in ``headers``.
         ============  ========  ============
         """
         self._started = True
         out = []
         append = out.append
+        if block is not None and block.data:
+            append(block.data[:-2])
         if isinstance(headers, (tuple,list)):
             hv = headers
             headers = []
@@ -994,21 +1923,35 @@ class HTTPRequest(object):
                 else:
                     append('%s: %s' % (key, val))
 
-        if not 'date' in headers and self.protocol == 'HTTP/1.1':
-            append('Date: %s' % date(datetime.utcnow()))
+        if block is not None:
+            headers.extend(block._data)
+
+        if not 'date' in headers and self.protocol != 'HTTP/1.0':
+            now = self.connection.engine.latest_poll_time
+            append('Date: %s' % http_date(now))
 
         if not 'server' in headers:
-            append('Server: %s' % SERVER)
+            append(SERVER_HEADER)
+
+        if self._last and not 'connection' in headers:
+            append('Connection: close')
 
         if cookies and hasattr(self, '_cookies_out'):
             self.send_cookies()
 
+        if end_headers and self.compress and self._held_headers is None:
+            server = self.connection.server
+            if server.compression and self._start_compression(hv, out):
+                # Hold the headers until the body is known.
+                self._held_headers = out
+                return
+
         if end_headers:
             append(CRLF)
         else:
             append('')
 
-        self.connection.write(CRLF.join(out))
+        self._write(CRLF.join(out))
 
     def send_response(self, content, code=200, content_type='text/plain'):
         """
@@ -1071,41 +2014,170 @@ class HTTPRequest(object):
         =========  ========  ============
         """
         self._started = True
+
+        # Once the connection switches protocols, the request is done.
+        if code == 101:
+            self.connection.server._release(self)
+
         try:
-            self.connection.write('%s %d %s%s' % (
-                self.protocol, code, HTTP[code], CRLF))
+            status = STATUS_LINES[self.protocol, code]
         except KeyError:
-            self.connection.write('%s %s%s' % (
-                self.protocol, code, CRLF))
+            try:
+                status = '%s %d %s%s' % (self.protocol, code, HTTP[code], CRLF)
+            except KeyError:
+                status = '%s %s%s' % (self.protocol, code, CRLF)
+        self._write(status)
 
     write = send
 
+    ##### Internal Methods ####################################################
+
+    def _start_compression(self, headers, out):
+        """
+        Decide whether or not to compress a response with the given headers,
+        adding a ``Vary`` header to ``out`` if it could have been. Returns
+        True if the response will be compressed, in which case the header
+        lines in ``out`` mustn't be written until the body is known.
+        """
+        if self.method == 'HEAD':
+            return False
+
+        server = self.connection.server
+
+        if isinstance(headers, (tuple, list)):
+            items = headers
+        else:
+            items = headers.iteritems()
+
+        values = {}
+        for key, val in items:
+            values[key.lower()] = val
+
+        if 'content-encoding' in values:
+            return False
+
+        content_type = str(values.get('content-type', ''))
+        content_type = content_type.partition(';')[0].strip().lower()
+        if not content_type.startswith(server.compression_types):
+            return False
+
+        chunked = 'chunked' in str(values.get('transfer-encoding', '')).lower()
+        if not chunked:
+            try:
+                length = int(values['content-length'])
+            except (KeyError, ValueError):
+                return False
+            if length < server.compression_min_size:
+                return False
+
+        # The response could be compressed, so caches must know that it
+        # depends on the request's Accept-Encoding.
+        vary = values.get('vary')
+        if vary is None:
+            out.append('Vary: Accept-Encoding')
+        elif not 'accept-encoding' in str(vary).lower():
+            for i, line in enumerate(out):
+                if line[:5].lower() == 'vary:':
+                    out[i] = '%s, Accept-Encoding' % line
+                    break
+
+        encoding = negotiate_encoding(self.headers.get('Accept-Encoding'))
+        if encoding is None:
+            return False
+
+        if not chunked:
+            out[:] = [line for line in out
+                      if line[:15].lower() != 'content-length:']
+            self._compress_length = length
+            self._compress_data = []
+
+        self._encoding = encoding
+        self._encoder = zlib.compressobj(server.compression_level,
+                                         zlib.DEFLATED,
+                                         COMPRESSION_WBITS[encoding])
+        return True
+
+    def _send_held_headers(self, *lines):
+        """
+        Write headers that were held back by :meth:`send_headers`, along
+        with any extra header lines.
+        """
+        out = self._held_headers
+        self._held_headers = None
+        out.extend(lines)
+        out.append(CRLF)
+        self._write(CRLF.join(out))
+
+    def _send_compressed(self):
+        """
+        Compress a response body that has been collected by :meth:`send`,
+        and write it along with the held headers.
+        """
+        encoder = self._encoder
+        data = ''.join(self._compress_data)
+        data = encoder.compress(data) + encoder.flush()
+
+        self._encoder = None
+        self._compress_data = None
+        self._compress_length = None
+
+        self._send_held_headers('Content-Encoding: %s' % self._encoding,
+                                'Content-Length: %d' % len(data))
+        self._write(data)
+
+    def _write(self, data):
+        """
+        Write data to the connection, or hold it if an earlier pipelined
+        request is still being answered.
+        """
+        if self._first_byte is None:
+            self._first_byte = time()
+            try:
+                self._status = int(data[9:12])
+            except ValueError:
+                pass
+        self._bytes_sent += len(data)
+
+        connection = self.connection
+        requests = connection._requests
+        if requests and requests[0] is not self:
+            if self._output is None:
+                self._output = []
+            self._output.append((Stream.SEND_STRING, data))
+        else:
+            connection.write(data)
+
+    def _write_file(self, sfile, nbytes=0, offset=0):
+        """
+        Write a file to the connection, or hold it if an earlier pipelined
+        request is still being answered.
+        """
+        if nbytes:
+            self._bytes_sent += nbytes
+        else:
+            self._bytes_sent += os.fstat(sfile.fileno()).st_size - offset
+
+        connection = self.connection
+        requests = connection._requests
+        if requests and requests[0] is not self:
+            if self._output is None:
+                self._output = []
+            self._output.append((Stream.SEND_FILE, (sfile, offset, nbytes)))
+        else:
+            connection.write_file(sfile, nbytes, offset)
+
     ##### Internal Event Handlers #############################################
 
     def _parse_url(self):
         # Do this ourselves because urlparse is too heavy.
         self.path, _, query = self.url.partition('?')
         self.query, _, self.fragment = query.partition('#')
-        netloc = self.host.lower()
 
-        # In-lined the hostname logic
-        if '[' in netloc and ']' in netloc:
-            self.hostname = netloc.split(']')[0][1:]
-        elif ':' in netloc:
-            self.hostname = netloc.split(':')[0]
-        else:
-            self.hostname = netloc
-
-        self.get = get = {}
-        if self.query:
-            for key, val in parse_qsl(self.query, False):
-                if key in get:
-                    if isinstance(get[key], list):
-                        get[key].append(val)
-                    else:
-                        get[key] = [get[key], val]
-                else:
-                    get[key] = val
+        # Parse the new query string when it's next used.
+        try:
+            del self._get
+        except AttributeError:
+            pass
 
 ###############################################################################
 # HTTPServer Class
@@ -1126,24 +2198,79 @@ class HTTPServer(Server):
     not valid or larger than the specified limit (which defaults to 10 MiB, or
     10,485,760 bytes).
 
-    ================  ========  ============
-    Argument          Default   Description
-    ================  ========  ============
-    request_handler             A callable that accepts a single argument. That argument is an instance of the :class:`HTTPRequest` class representing the current request.
-    max_request       10 MiB    *Optional.* The maximum allowed length, in bytes, of an HTTP request body. This should be kept small, as the entire request body will be held in memory.
-    keep_alive        True      *Optional.* Whether or not multiple requests are allowed over a single connection.
-    cookie_secret     None      *Optional.* A string to use when signing secure cookies.
-    xheaders          False     *Optional.* Whether or not to use ``X-Forwarded-For`` and ``X-Forwarded-Proto`` headers.
-    sendfile          False     *Optional.* Whether or not to use ``X-Sendfile`` headers. If this is set to a string, that string will be used as the header name.
-    sendfile_prefix   None      *Optional.* A string to prefix paths with for use in the ``X-Sendfile`` headers. Useful for nginx.
-    file_root         None      *Optional.* The root path to send files from using :meth:`~pants.http.server.HTTPRequest.send_file`.
-    ================  ========  ============
+    ===========================  ========  ============
+    Argument                     Default   Description
+    ===========================  ========  ============
+    request_handler                        A callable that accepts a single argument. That argument is an instance of the :class:`HTTPRequest` class representing the current request.
+    max_request                  10 MiB    *Optional.* The maximum allowed length, in bytes, of an HTTP request body. This should be kept small, as the entire request body will be held in memory. ``multipart/form-data`` bodies are the exception: they're spooled to disk, and the limit applies to each of their parts instead.
+    keep_alive                   True      *Optional.* Whether or not multiple requests are allowed over a single connection.
+    cookie_secret                None      *Optional.* A string to use when signing secure cookies.
+    cookie_cache_size            256       *Optional.* The number of verified secure cookies to remember, so that :meth:`HTTPRequest.get_secure_cookie` needn't verify them again. If 0, secure cookies are verified every time.
+    xheaders                     False     *Optional.* Whether or not to use ``X-Forwarded-For`` and ``X-Forwarded-Proto`` headers.
+    sendfile                     False     *Optional.* Whether or not to use ``X-Sendfile`` headers. If this is set to a string, that string will be used as the header name.
+    sendfile_prefix              None      *Optional.* A string to prefix paths with for use in the ``X-Sendfile`` headers. Useful for nginx.
+    file_root                    None      *Optional.* The root path to send files from using :meth:`~pants.http.server.HTTPRequest.send_file`.
+    file_cache_size              0         *Optional.* The number of open files to keep in the server's :attr:`file_cache` for :meth:`~pants.http.server.HTTPRequest.send_file`. If 0, files are opened for every request.
+    file_cache_ttl               1.0       *Optional.* The number of seconds a cached file is trusted before it is checked for changes.
+    max_line                     8192      *Optional.* The maximum length, in bytes, of the request line or of a single header line.
+    max_headers                  100       *Optional.* The maximum number of headers in a request.
+    max_header_size              65536     *Optional.* The maximum size, in bytes, of a request's headers, including the request line.
+    pipeline_depth               16        *Optional.* The maximum number of pipelined requests on a connection that may be in progress at once. Reading from the connection pauses when the limit is reached.
+    spool_size                   64 KiB    *Optional.* The size, in bytes, at which files uploaded in ``multipart/form-data`` request bodies are moved from memory to temporary files on disk.
+    compression                  False     *Optional.* Whether or not to compress responses with gzip or deflate when the client accepts it. See :attr:`HTTPRequest.compress`.
+    compression_level            6         *Optional.* The zlib compression level, from 1 (fastest) to 9 (smallest).
+    compression_min_size         1024      *Optional.* The smallest response body, in bytes, that will be compressed. Chunked responses are always compressed.
+    compression_types                      *Optional.* A tuple of Content-Type prefixes for the responses that may be compressed. Defaults to text, JSON, JavaScript, XML and SVG.
+    stream_body                  False     *Optional.* Whether or not to call the request handler before a request body has been read, passing the body to it piece by piece. See :class:`HTTPRequest`. ``max_request`` doesn't apply to streamed bodies.
+    keep_alive_timeout           0         *Optional.* The number of seconds an idle keep-alive connection is kept open while waiting for another request. If 0, idle connections aren't closed.
+    header_timeout               0         *Optional.* The number of seconds a client has to send the request line and headers of a request, once it has started sending them. A ``408 Request Timeout`` response is sent if it takes longer. If 0, there is no limit.
+    body_timeout                 0         *Optional.* The number of seconds a request body may go without any data arriving before the connection is closed. If 0, there is no limit.
+    max_requests_per_connection  0         *Optional.* The number of requests after which a connection is closed, with a ``Connection: close`` header on the last response. If 0, there is no limit.
+    http2                        False     *Optional.* Whether or not to accept HTTP/2 connections, negotiated with ALPN when SSL is enabled, or started with the HTTP/2 connection preface otherwise. See :mod:`pants.http.http2`.
+    http2_max_streams            100       *Optional.* The maximum number of streams that may be in progress at once on an HTTP/2 connection.
+    max_in_flight                0         *Optional.* The number of requests in progress at which new requests are shed. If 0, there is no limit.
+    max_loop_lag                 0         *Optional.* The delay, in seconds, of the engine's loop at which new requests are shed. If 0, there is no limit.
+    retry_after                  1         *Optional.* The number of seconds clients are asked to wait, with a ``Retry-After`` header, before retrying a shed request.
+    access_log                   None      *Optional.* A :class:`~pants.http.accesslog.AccessLog` to record finished requests with.
+    ===========================  ========  ============
+
+    Timeouts are checked once a second, so a connection may be closed up to a
+    second later than its timeout.
+
+    When ``file_cache_size`` is set, :attr:`file_cache` is a
+    :class:`~pants.util.filecache.FileCache`. Call its ``invalidate()``
+    method to drop files that have changed before their ``ttl`` is up.
+
+    When ``max_in_flight`` or ``max_loop_lag`` is set, an overloaded server
+    sheds load by answering new requests with a ``503 Service Unavailable``
+    instead of calling the request handler. The server's load is the larger
+    of :attr:`in_flight` and :attr:`loop_lag` as a fraction of its limit.
+    If the request handler has a ``request_priority`` method, it's called
+    with each request that would be shed, and a request with priority *n*
+    is only shed once the load reaches *n* + 1. An
+    :class:`~pants.web.application.Application` takes the priority from
+    the request's route. The number of requests shed so far is kept in
+    :attr:`requests_shed`.
     """
     ConnectionClass = HTTPConnection
 
     def __init__(self, request_handler, max_request=10485760, keep_alive=True,
                     cookie_secret=None, xheaders=False, sendfile=False,
-                    sendfile_prefix=None, file_root=None, **kwargs):
+                    sendfile_prefix=None, file_root=None, file_cache_size=0,
+                    file_cache_ttl=1.0, max_line=8192, max_headers=100,
+                    max_header_size=65536, pipeline_depth=16, spool_size=65536,
+                    stream_body=False, compression=False, compression_level=6,
+                    compression_min_size=1024,
+                    compression_types=COMPRESSIBLE_TYPES, keep_alive_timeout=0,
+                    header_timeout=0, body_timeout=0,
+                    max_requests_per_connection=0, http2=False,
+                    http2_max_streams=100, max_in_flight=0, max_loop_lag=0,
+                    retry_after=1, access_log=None, cookie_cache_size=256,
+                    **kwargs):
+        # Server.__init__ may call startSSL, which needs these.
+        self.http2              = http2
+        self.http2_max_streams  = http2_max_streams
+
         Server.__init__(self, **kwargs)
 
         # Storage
@@ -1154,9 +2281,49 @@ class HTTPServer(Server):
         self.sendfile           = sendfile
         self.sendfile_prefix    = sendfile_prefix
         self.file_root          = os.path.abspath(file_root) if file_root else None
+        self.max_line           = max_line
+        self.max_headers        = max_headers
+        self.max_header_size    = max_header_size
+        self.pipeline_depth     = pipeline_depth
+        self.spool_size         = spool_size
+        self.stream_body        = stream_body
+        self.compression        = compression
+        self.compression_level  = compression_level
+        self.compression_min_size = compression_min_size
+        self.compression_types  = tuple(compression_types)
+        self.keep_alive_timeout = keep_alive_timeout
+        self.header_timeout     = header_timeout
+        self.body_timeout       = body_timeout
+        self.max_requests_per_connection = max_requests_per_connection
+        self.max_in_flight      = max_in_flight
+        self.max_loop_lag       = max_loop_lag
+        self.retry_after        = retry_after
+        self.access_log         = access_log
+
+        if file_cache_size:
+            self.file_cache     = FileCache(file_cache_size, file_cache_ttl,
+                                            self.engine)
+        else:
+            self.file_cache     = None
 
         self._cookie_secret     = cookie_secret
 
+        # Verified secure cookies, by their raw values.
+        self.cookie_cache_size  = cookie_cache_size
+        self._cookie_cache      = OrderedDict()
+
+        # Connection deadlines, bucketed by the second they expire in.
+        self._timeouts          = {}
+        self._timeout_slot      = None
+        self._timeout_timer     = None
+
+        # Load shedding.
+        self.in_flight          = 0
+        self.loop_lag           = 0.0
+        self.requests_shed      = 0
+        self._lag_timer         = None
+        self._lag_checked       = None
+
     @property
     def cookie_secret(self):
         if self._cookie_secret is None:
@@ -1167,8 +2334,218 @@ class HTTPServer(Server):
     @cookie_secret.setter
     def cookie_secret(self, val):
         self._cookie_secret = val
+        self._cookie_cache.clear()
 
-    def listen(self, address=None, backlog=1024, slave=True):
+    @property
+    def retry_after(self):
+        return self._retry_after
+
+    @retry_after.setter
+    def retry_after(self, val):
+        # The response to shed requests is built once, so shedding stays
+        # cheap when it matters most.
+        self._retry_after = val
+        self._shed_head = CRLF.join((
+            'HTTP/1.1 503 Service Unavailable',
+            'Content-Type: text/plain',
+            'Content-Length: %d' % len(SHED_BODY),
+            'Retry-After: %d' % val,
+            SERVER_HEADER,
+            'Date: '))
+
+    def on_connection_rejected(self, sock, addr):
+        """
+        Called when a new connection cannot be admitted because of the
+        server's ``max_connections`` or ``max_connections_per_ip`` limits.
+
+        Unless SSL is enabled, a ``503 Service Unavailable`` response is
+        written to the socket without waiting for the request before the
+        connection is closed.
+        """
+        if not self.ssl_enabled:
+            try:
+                sock.setblocking(False)
+                sock.send(SERVICE_UNAVAILABLE)
+            except socket.error:
+                pass
+
+        Server.on_connection_rejected(self, sock, addr)
+
+    def startSSL(self, ssl_options={}):
+        """
+        Enable SSL on the server, as with
+        :meth:`pants.server.Server.startSSL`.
+
+        If the server accepts HTTP/2 and ALPN is available, the
+        :func:`ssl.wrap_socket` options are used to build an
+        :class:`ssl.SSLContext` that offers ``h2`` as well as
+        ``http/1.1``, unless a ``context`` is given in ``ssl_options``.
+        """
+        if self.http2 and HAS_ALPN and not 'context' in ssl_options:
+            ssl_options = dict(ssl_options)
+            context = ssl.SSLContext(ssl_options.pop('ssl_version',
+                                                     ssl.PROTOCOL_SSLv23))
+            context.verify_mode = ssl_options.pop('cert_reqs', ssl.CERT_NONE)
+
+            ca_certs = ssl_options.pop('ca_certs', None)
+            if ca_certs:
+                context.load_verify_locations(ca_certs)
+
+            certfile = ssl_options.pop('certfile', None)
+            keyfile = ssl_options.pop('keyfile', None)
+            if certfile:
+                context.load_cert_chain(certfile, keyfile)
+
+            ciphers = ssl_options.pop('ciphers', None)
+            if ciphers:
+                context.set_ciphers(ciphers)
+
+            context.set_alpn_protocols(['h2', 'http/1.1'])
+            ssl_options['context'] = context
+
+        return Server.startSSL(self, ssl_options)
+
+    def close(self):
+        """
+        Close the server. Connections that have already been accepted stay
+        open, but are no longer timed out.
+        """
+        if self._timeout_timer is not None:
+            self._timeout_timer()
+            self._timeout_timer = None
+        self._timeouts.clear()
+
+        if self._lag_timer is not None:
+            self._lag_timer()
+            self._lag_timer = None
+
+        if self.access_log is not None:
+            self.access_log.flush()
+
+        Server.close(self)
+
+    ##### Load Shedding #######################################################
+
+    def _admit(self, request):
+        """
+        Decide whether a new request is handled, counting it as in flight,
+        or shed with a ``503 Service Unavailable`` response. Returns True if
+        the request handler should be called.
+        """
+        load = 0.0
+        if self.max_in_flight:
+            load = float(self.in_flight) / self.max_in_flight
+        if self.max_loop_lag:
+            load = max(load, self.loop_lag / self.max_loop_lag)
+
+        if load >= 1:
+            priority = getattr(self.request_handler, 'request_priority', None)
+            if priority is None or load >= 1 + priority(request):
+                self.requests_shed += 1
+                now = self.engine.latest_poll_time
+                if request.method == 'HEAD':
+                    request._write('%s%s%s' % (self._shed_head,
+                                               http_date(now), DOUBLE_CRLF))
+                else:
+                    request._write('%s%s%s%s' % (self._shed_head,
+                                   http_date(now), DOUBLE_CRLF, SHED_BODY))
+                request.finish()
+                return False
+
+        request._in_flight = True
+        self.in_flight += 1
+        return True
+
+    def _release(self, request):
+        """
+        Stop counting a request as in flight, once it's been finished or
+        its connection has closed.
+        """
+        if request._in_flight:
+            request._in_flight = False
+            self.in_flight -= 1
+
+    def _handle_connection_close(self, connection):
+        """
+        Stop counting the requests of a closing connection as in flight,
+        since they won't be finished. This is done here rather than in the
+        connection's ``on_close``, which protocols taking over the connection,
+        such as WebSockets, replace.
+        """
+        for request in connection._requests:
+            self._release(request)
+        if connection.current_request is not None:
+            self._release(connection.current_request)
+
+        Server._handle_connection_close(self, connection)
+
+    def _measure_lag(self):
+        """
+        Measure how late the engine ran this cycle, which is how long the
+        engine's loop was kept busy by other work. The measurement decays
+        rather than dropping straight back down, so load isn't shed in
+        bursts.
+        """
+        now = self.engine.latest_poll_time
+        if self._lag_checked is not None:
+            lag = max(now - self._lag_checked - LAG_INTERVAL, 0.0)
+            self.loop_lag = max(lag, self.loop_lag / 2)
+        self._lag_checked = now
+
+    ##### Timeouts ############################################################
+
+    def _set_deadline(self, connection, deadline):
+        """
+        Schedule a call to the connection's ``_check_timeout`` at the given
+        time. A connection is only ever in one slot. If it's already in an
+        earlier slot, it's left there and reschedules itself when checked.
+        """
+        connection._deadline = deadline
+        slot = int(deadline) + 1
+
+        current = connection._deadline_slot
+        if current is not None and current <= slot:
+            return
+
+        connection._deadline_slot = slot
+        timeouts = self._timeouts
+        if slot in timeouts:
+            timeouts[slot].append(connection)
+        else:
+            timeouts[slot] = [connection]
+
+        if self._timeout_slot is None or slot < self._timeout_slot:
+            self._timeout_slot = slot
+
+        if self._timeout_timer is None:
+            self._timeout_timer = self.engine.cycle(1.0, self._check_timeouts)
+
+    def _check_timeouts(self):
+        """
+        Check the connections with deadlines that have passed.
+        """
+        now = self.engine.latest_poll_time
+        timeouts = self._timeouts
+
+        slot = self._timeout_slot
+        while slot is not None and slot <= now:
+            for connection in timeouts.pop(slot, ()):
+                if connection._deadline_slot != slot:
+                    continue
+                connection._deadline_slot = None
+                if connection._deadline is not None and \
+                        not connection._closed:
+                    connection._check_timeout(now)
+
+            slot = min(timeouts) if timeouts else None
+            self._timeout_slot = slot
+
+        if not timeouts and self._timeout_timer is not None:
+            self._timeout_timer()
+            self._timeout_timer = None
+
+    def listen(self, address=None, backlog=1024, slave=True, defer_accept=None,
+               fastopen=None):
         """
         Begins listening for connections to the HTTP server.
 
@@ -1178,6 +2555,13 @@ class HTTPServer(Server):
         default. Port 443 is selected if SSL has been enabled prior to the
         call to listen, otherwise port 80 will be used.
 
+        HTTP clients always send the first bytes of a connection, which
+        makes ``defer_accept`` (a number of seconds) a cheap way to avoid
+        waking the server for connections that have not sent a request
+        yet, and ``fastopen`` (a queue length) lets returning clients
+        send their request in the SYN. Both are Linux-only and ignored
+        elsewhere.
+
         .. seealso::
 
             See :func:`pants.server.Server.listen` for more information on
@@ -1195,5 +2579,13 @@ class HTTPServer(Server):
             else:
                 address = tuple(address[0] + (port,) + address[2:])
 
+        if self.max_loop_lag and self._lag_timer is None:
+            # The engine may not be running yet, so the first cycle only
+            # starts the measurement.
+            self._lag_checked = None
+            self._lag_timer = self.engine.cycle(LAG_INTERVAL,
+                                                self._measure_lag)
+
         return Server.listen(self, address=address, backlog=backlog,
-                                slave=slave)
+                             slave=slave, defer_accept=defer_accept,
+                             fastopen=fastopen)
@@ -25,6 +25,7 @@ import hmac
 import logging
 import mimetypes
 import re
+import tempfile
 import time
 
 from datetime import datetime
@@ -51,6 +52,17 @@ SERVER_URL  = 'http://www.pantspowered.org/'
 
 USER_AGENT = "HTTPants/%s" % pants_version
 
+# Escapes in quoted cookie values.
+_COOKIE_ESCAPE = re.compile(r'\\(?:([0-3][0-7][0-7])|(.))')
+
+# The attributes of a Cookie.Morsel, in the order they're written, with
+# the names they're written as.
+MORSEL_ATTRIBUTES = (
+    ('comment', 'Comment'), ('domain', 'Domain'), ('expires', 'expires'),
+    ('httponly', 'httponly'), ('max-age', 'Max-Age'), ('path', 'Path'),
+    ('secure', 'secure'), ('version', 'Version'),
+    )
+
 # Formats for parse_date to use.
 DATE_FORMATS = (
     "%a, %d %b %Y %H:%M:%S %Z",
@@ -65,6 +77,13 @@ COMMA_HEADERS = ('Accept', 'Accept-Charset', 'Accept-Encoding',
     'Transfer-Encoding', 'Upgrade', 'Vary', 'Via', 'Warning',
     'WWW-Authenticate')
 
+# Header values are kept as strings. Those of the headers that must be
+# numbers are checked when they're parsed, and may be read as integers with
+# HTTPHeaders.get_int.
+NUMERIC_HEADERS = frozenset(('content-length', 'max-forwards'))
+
+_COMMA_HEADERS = frozenset(h.lower() for h in COMMA_HEADERS)
+
 STRANGE_HEADERS = {
     'a-im': 'A-IM',
     'c-pep': 'C-PEP',
@@ -206,6 +225,9 @@ class HTTPHeaders(object):
     HTTPHeaders is a dict-like object that holds parsed HTTP headers, provides
     access to them in a case-insensitive way, and that normalizes the case of
     the headers upon iteration.
+
+    Parsed header values are strings. Use :meth:`get_int` to read a header,
+    such as ``Content-Length``, as an integer.
     """
 
     __slots__ = ('_data',)
@@ -281,6 +303,19 @@ class HTTPHeaders(object):
     def get(self, key, default=None):
         return self._data.get(key.lower(), default)
 
+    def get_int(self, key, default=None):
+        """
+        Return the value of the given header as an integer, or ``default``
+        if there's no such header or its value isn't an integer.
+        """
+        val = self._data.get(key.lower())
+        if val is None:
+            return default
+        try:
+            return int(val)
+        except (TypeError, ValueError):
+            return default
+
     def setdefault(self, key, default=None):
         return self._data.setdefault(key.lower(), default)
 
@@ -298,6 +333,469 @@ class HTTPHeaders(object):
         return _normalize_header(key), val
 
 
+###############################################################################
+# HeaderBlock Class
+###############################################################################
+
+class HeaderBlock(HTTPHeaders):
+    """
+    A set of HTTP headers that is serialized once, when it is created, so it
+    can be sent with many responses without being formatted again. Pass it
+    to :meth:`HTTPRequest.send_headers <pants.http.server.HTTPRequest.send_headers>`
+    as the ``block`` argument.
+
+    A HeaderBlock should not be modified after it has been created. Its
+    :meth:`copy` method returns a normal, modifiable :class:`HTTPHeaders`
+    instance.
+    """
+
+    __slots__ = ('data', 'body_headers')
+
+    def __init__(self, data=None, _store=None):
+        HTTPHeaders.__init__(self, data, _store)
+
+        out = []
+        for key, val in self.iteritems():
+            if type(val) is list:
+                for v in val:
+                    out.append('%s: %s%s' % (key, v, CRLF))
+            else:
+                out.append('%s: %s%s' % (key, val, CRLF))
+
+        self.data = ''.join(out)
+
+        # Headers describing the body need to be seen by code building a
+        # response, so blocks containing them can't be sent as they are.
+        store = self._data
+        self.body_headers = 'content-type' in store or \
+                            'content-length' in store or \
+                            'transfer-encoding' in store
+
+    def conflicts(self, headers):
+        """
+        Return True if the block can't be sent along with the given headers
+        unchanged, either because the headers replace some of the block's or
+        because the block describes the response body.
+        """
+        if self.body_headers:
+            return True
+
+        store = self._data
+        if isinstance(headers, HTTPHeaders):
+            keys = headers._data
+        elif isinstance(headers, (tuple, list)):
+            keys = (key.lower() for key, val in headers)
+        else:
+            keys = (key.lower() for key in headers)
+
+        for key in keys:
+            if key in store:
+                return True
+        return False
+
+    def copy(self):
+        return HTTPHeaders(_store=self._data.copy())
+
+
+###############################################################################
+# RequestParser Class
+###############################################################################
+
+class RequestParser(object):
+    """
+    An incremental parser for the head of an HTTP/1.x request: the request
+    line and the headers.
+
+    Data is passed to :meth:`feed` as it arrives. Complete lines are
+    parsed immediately and only a trailing partial line is kept, so a head
+    that arrives in many pieces isn't searched over and over, and limits
+    are enforced before an oversized head has been buffered.
+
+    Once the head is complete, the request line is available as
+    :attr:`method`, :attr:`url` and :attr:`protocol`, and the headers as
+    :attr:`headers`. Call :meth:`reset` before parsing the next request.
+
+    ============  ========  ============
+    Argument      Default   Description
+    ============  ========  ============
+    max_line      8192      *Optional.* The maximum length, in bytes, of the request line or a single header line.
+    max_headers   100       *Optional.* The maximum number of header lines.
+    max_size      65536     *Optional.* The maximum size, in bytes, of the entire head.
+    ============  ========  ============
+    """
+    __slots__ = ('max_line', 'max_headers', 'max_size', 'method', 'url',
+                 'protocol', 'headers', '_buffer', '_size', '_count',
+                 '_key', '_store')
+
+    def __init__(self, max_line=8192, max_headers=100, max_size=65536):
+        self.max_line = max_line
+        self.max_headers = max_headers
+        self.max_size = max_size
+        self.reset()
+
+    def reset(self):
+        """
+        Prepare the parser to read a new request.
+        """
+        self.method = None
+        self.url = None
+        self.protocol = None
+        self.headers = None
+
+        self._buffer = ''
+        self._size = 0
+        self._count = 0
+        self._key = None
+        self._store = None
+
+    def feed(self, data):
+        """
+        Parse a chunk of data received from the client.
+
+        Returns None if the head isn't complete yet. Otherwise, returns the
+        data that followed the head, which may be an empty string. Raises
+        :class:`BadRequest` if the head is invalid or exceeds a limit.
+
+        =========  ============
+        Argument   Description
+        =========  ============
+        data       A string of data received from the client.
+        =========  ============
+        """
+        if self._buffer:
+            data = self._buffer + data
+            self._buffer = ''
+
+        if self.method is None:
+            # Empty lines before the request line are ignored.
+            data = data.lstrip(CRLF)
+
+        # Find the end of the head if it's here, and otherwise the end of
+        # the last complete line.
+        rest = None
+        if self.method is not None and data[:2] == CRLF:
+            lines = ()
+            rest = data[2:]
+            used = 2
+        else:
+            end = data.find(DOUBLE_CRLF)
+            if end != -1:
+                lines = data[:end].split(CRLF)
+                rest = data[end + 4:]
+                used = end + 4
+            else:
+                end = data.rfind(CRLF)
+                if end != -1:
+                    lines = data[:end].split(CRLF)
+                    used = end + 2
+                else:
+                    lines = ()
+                    used = 0
+
+                self._buffer = data[used:]
+                if len(self._buffer) > self.max_line:
+                    if self.method is None and not lines:
+                        raise BadRequest('Request line too long.',
+                                         code='414 Request-URI Too Long')
+                    raise BadRequest('Request header line too long.',
+                        code='431 Request Header Fields Too Large')
+
+        self._size += used
+        if self._size > self.max_size:
+            raise BadRequest('Request headers too large.',
+                             code='431 Request Header Fields Too Large')
+
+        if lines:
+            if self.method is None:
+                self._read_request_line(lines[0])
+                lines = lines[1:]
+            if lines:
+                self._read_header_lines(lines)
+
+        if rest is None:
+            return None
+
+        self.headers = HTTPHeaders(_store=self._store)
+        self._store = None
+        return rest
+
+    def _read_request_line(self, line):
+        if len(line) > self.max_line:
+            raise BadRequest('Request line too long.',
+                             code='414 Request-URI Too Long')
+
+        parts = line.split()
+        if len(parts) != 3:
+            raise BadRequest('Invalid HTTP request line.')
+
+        method, url, protocol = parts
+        if not protocol.startswith('HTTP/'):
+            raise BadRequest('Invalid HTTP protocol version.',
+                             code='505 HTTP Version Not Supported')
+
+        self.method = method
+        self.url = url
+        self.protocol = protocol
+        self._store = {}
+
+    def _read_header_lines(self, lines):
+        self._count += len(lines)
+        if self._count > self.max_headers:
+            raise BadRequest('Too many request headers.',
+                             code='431 Request Header Fields Too Large')
+
+        max_line = self.max_line
+        target = self._store
+        key = self._key
+        numeric = NUMERIC_HEADERS
+
+        for line in lines:
+            if len(line) > max_line:
+                raise BadRequest('Request header line too long.',
+                                 code='431 Request Header Fields Too Large')
+
+            # A continuation of the previous header.
+            if key and line[:1] in (' ', '\t'):
+                if key in numeric:
+                    raise BadRequest('Folded %s header.' %
+                                     _normalize_header(key))
+                val = line.strip()
+                if isinstance(target[key], list):
+                    if target[key]:
+                        target[key][-1] += ' ' + val
+                    else:
+                        target[key].append(val)
+                else:
+                    target[key] += ' ' + val
+                continue
+
+            key, colon, val = line.partition(':')
+            if not colon:
+                raise BadRequest('Illegal header line: %r' % line)
+
+            key = key.strip().lower()
+            val = val.strip()
+
+            if key in target or key in numeric:
+                _add_header(target, key, val)
+            else:
+                target[key] = val
+
+        self._key = key
+
+
+###############################################################################
+# Multipart Parser
+###############################################################################
+
+class MultipartFile(dict):
+    """
+    A file uploaded in a ``multipart/form-data`` request body, as found in
+    :attr:`HTTPRequest.files <pants.http.server.HTTPRequest.files>`. The
+    ``filename`` and ``content_type`` keys hold the information sent with
+    the file, ``body`` holds its contents as a string, and ``file`` is a
+    file-like object with the same contents.
+    """
+
+
+class MultipartParser(object):
+    """
+    An incremental parser for ``multipart/form-data`` request bodies, which
+    modifies a request's ``post`` and ``files`` dictionaries as the parts of
+    the body arrive.
+
+    Uploaded files are written to :class:`tempfile.SpooledTemporaryFile`
+    instances, which are kept in memory until they grow larger than
+    ``spool_size`` and are then moved to disk. Each file's contents are
+    also read into its ``body`` key once the file is complete. Only a small
+    part of the body is buffered while it's parsed, so memory use depends
+    on the size of the largest part rather than of the whole body, and can
+    be limited with ``max_part``.
+
+    ===========  ========  ============
+    Argument     Default   Description
+    ===========  ========  ============
+    request                The :class:`~pants.http.server.HTTPRequest` that should be modified to include the parsed data.
+    boundary               The ``multipart/form-data`` boundary to be used for splitting the data into parts.
+    spool_size   65536     *Optional.* The size, in bytes, at which uploaded files are moved to disk.
+    max_header   16384     *Optional.* The maximum size, in bytes, of the headers of a single part.
+    max_part     None      *Optional.* The maximum size, in bytes, of the contents of a single part. If None, there is no limit.
+    ===========  ========  ============
+
+    Data is passed to the parser with :meth:`feed`, and :meth:`close`
+    should be called once the whole body has been read. Invalid data
+    raises :class:`BadRequest`.
+    """
+    __slots__ = ('request', 'spool_size', 'max_header', 'max_part',
+                 '_delimiter', '_buffer', '_state', '_name', '_target',
+                 '_size')
+
+    # Parser States
+    BOUNDARY = 0
+    HEADERS = 1
+    BODY = 2
+    DONE = 3
+
+    def __init__(self, request, boundary, spool_size=65536, max_header=16384,
+                 max_part=None):
+        if boundary.startswith('"') and boundary.endswith('"'):
+            boundary = boundary[1:-1]
+
+        self.request = request
+        self.spool_size = spool_size
+        self.max_header = max_header
+        self.max_part = max_part
+
+        # The first boundary needn't follow a line break, so start with one.
+        self._delimiter = '%s--%s' % (CRLF, boundary)
+        self._buffer = CRLF
+        self._state = MultipartParser.BODY
+        self._name = None
+        self._target = None
+        self._size = 0
+
+    def feed(self, data):
+        """
+        Parse the next piece of a request body.
+        """
+        buf = self._buffer + data
+        delimiter = self._delimiter
+
+        while True:
+            state = self._state
+
+            if state == MultipartParser.BODY:
+                mark = buf.find(delimiter)
+                if mark == -1:
+                    # Keep enough to find a delimiter that has been split.
+                    keep = len(delimiter) - 1
+                    if len(buf) > keep:
+                        self._write(buf[:-keep])
+                        buf = buf[-keep:]
+                    break
+
+                self._write(buf[:mark])
+                self._end_part()
+                buf = buf[mark + len(delimiter):]
+                self._state = MultipartParser.BOUNDARY
+
+            elif state == MultipartParser.BOUNDARY:
+                if buf[:2] == '--':
+                    self._state = MultipartParser.DONE
+                    buf = ''
+                    break
+
+                # Skip any padding after the boundary.
+                mark = buf.find(CRLF)
+                if mark == -1:
+                    if len(buf) > self.max_header:
+                        raise BadRequest('Invalid multipart/form-data.')
+                    break
+
+                buf = buf[mark + 2:]
+                self._state = MultipartParser.HEADERS
+
+            elif state == MultipartParser.HEADERS:
+                if buf[:2] == CRLF:
+                    mark = 0
+                else:
+                    mark = buf.find(DOUBLE_CRLF)
+
+                if mark == -1:
+                    if len(buf) > self.max_header:
+                        raise BadRequest('Part headers in multipart/form-data '
+                                         'too long.')
+                    break
+
+                self._start_part(read_headers(buf[:mark]))
+                buf = buf[mark + (4 if mark else 2):]
+                self._state = MultipartParser.BODY
+
+            else:
+                # Ignore anything after the final boundary.
+                buf = ''
+                break
+
+        self._buffer = buf
+
+    def close(self):
+        """
+        Finish parsing the request body. Raises :class:`BadRequest` if the
+        final boundary wasn't found.
+        """
+        if self._state != MultipartParser.DONE:
+            self._end_part(False)
+            self._state = MultipartParser.DONE
+            raise BadRequest('Incomplete multipart/form-data.')
+
+    ##### Internal Methods ####################################################
+
+    def _start_part(self, headers):
+        disposition = headers.get('Content-Disposition', '')
+        if not disposition.startswith('form-data;'):
+            log.warning('Invalid multipart/form-data part.')
+            return
+
+        values = {}
+        for field in disposition[10:].split(';'):
+            key, _, value = field.strip().partition('=')
+            values[key] = value.strip('"').decode('utf-8')
+
+        if not 'name' in values:
+            log.warning('Missing name value in multipart/form-data part.')
+            return
+
+        self._name = values['name']
+        self._size = 0
+        if 'filename' in values:
+            self._target = MultipartFile(
+                filename=values['filename'],
+                content_type=headers.get('Content-Type',
+                                         'application/unknown'),
+                file=tempfile.SpooledTemporaryFile(self.spool_size))
+        else:
+            self._target = []
+
+    def _write(self, data):
+        target = self._target
+        if target is None or not data:
+            return
+
+        self._size += len(data)
+        if self.max_part is not None and self._size > self.max_part:
+            raise BadRequest('Part of multipart/form-data body larger than '
+                             'limit %d.' % self.max_part,
+                             code='413 Request Entity Too Large')
+
+        if isinstance(target, list):
+            target.append(data)
+        else:
+            target['file'].write(data)
+
+    def _end_part(self, complete=True):
+        target = self._target
+        if target is None:
+            return
+
+        name = self._name
+        self._target = None
+        self._name = None
+
+        if isinstance(target, list):
+            if complete:
+                self.request.post.setdefault(name, []).append(''.join(target))
+
+        elif complete:
+            f = target['file']
+            f.seek(0)
+            target['body'] = f.read()
+            f.seek(0)
+            self.request.files.setdefault(name, []).append(target)
+
+        else:
+            target['file'].close()
+
+
 ###############################################################################
 # Support Functions
 ###############################################################################
@@ -313,6 +811,72 @@ def generate_signature(key, *parts):
         hash.update(str(p))
     return hash.hexdigest()
 
+# Signatures are compared in constant time, so that how long a comparison
+# takes doesn't reveal how much of a forged signature is correct.
+try:
+    compare_digest = hmac.compare_digest
+except AttributeError:
+    def compare_digest(a, b):
+        if len(a) != len(b):
+            return False
+        result = 0
+        for x, y in zip(a, b):
+            result |= ord(x) ^ ord(y)
+        return result == 0
+
+def parse_cookies(header):
+    """
+    Parse the value of a ``Cookie`` header, or a list of them, into a
+    dictionary of cookie names and values. Quoted values are unquoted the
+    way :class:`Cookie.SimpleCookie` quotes them, but the header is only
+    split rather than run through its regular expression.
+    """
+    if isinstance(header, list):
+        header = ';'.join(header)
+
+    cookies = {}
+    for pair in header.split(';'):
+        name, sep, value = pair.partition('=')
+        name = name.strip()
+        if not sep or not name or name[0] == '$':
+            continue
+
+        value = value.strip()
+        if len(value) > 1 and value[0] == '"' and value[-1] == '"':
+            value = value[1:-1]
+            if '\\' in value:
+                value = _COOKIE_ESCAPE.sub(_unescape_cookie, value)
+
+        cookies[name] = value
+    return cookies
+
+def _unescape_cookie(match):
+    octal = match.group(1)
+    if octal:
+        return chr(int(octal, 8))
+    return match.group(2)
+
+def cookie_header(morsel):
+    """
+    Return the ``Set-Cookie`` header line for a :class:`Cookie.Morsel`, as
+    its ``output()`` method would.
+    """
+    out = ['Set-Cookie: %s=%s' % (morsel.key, morsel.coded_value)]
+    append = out.append
+    for key, name in MORSEL_ATTRIBUTES:
+        value = morsel.get(key, '')
+        if value == '':
+            continue
+        elif key == 'expires' and type(value) is int:
+            append('%s=%s' % (name, http_date(time.time() + value)))
+        elif key == 'max-age' and type(value) is int:
+            append('%s=%d' % (name, value))
+        elif key == 'secure' or key == 'httponly':
+            append(name)
+        else:
+            append('%s=%s' % (name, value))
+    return '; '.join(out)
+
 def content_type(filename):
     return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
 
@@ -358,7 +922,8 @@ def encode_multipart(vars, files=None, boundary=None):
 def parse_multipart(request, boundary, data):
     """
     Parse a ``multipart/form-data`` request body and modify the request's
-    ``post`` and ``files`` dictionaries as is appropriate.
+    ``post`` and ``files`` dictionaries as is appropriate. See
+    :class:`MultipartParser`, which can parse a body as it arrives.
 
     =========  ============
     Argument   Description
@@ -368,49 +933,48 @@ def parse_multipart(request, boundary, data):
     data       The data to be parsed.
     =========  ============
     """
+    parser = MultipartParser(request, boundary)
+    parser.feed(data)
+    parser.close()
 
-    if boundary.startswith('"') and boundary.endswith('"'):
-        boundary = boundary[1:-1]
-
-    footer_length = len(boundary) + 4
-    if data.endswith(CRLF):
-        footer_length += 2
-
-    parts = data[:-footer_length].split('--%s%s' % (boundary, CRLF))
-    for part in parts:
-        if not part:
-            continue
-
-        eoh = part.find(DOUBLE_CRLF)
-        if eoh == -1:
-            log.warning(
-                'Missing part headers in multipart/form-data. Skipping.')
-            continue
-
-        headers = read_headers(part[:eoh])
-        name_header = headers.get('Content-Disposition', '')
-        if not name_header.startswith('form-data;') or not part.endswith(CRLF):
-            log.warning('Invalid multipart/form-data part.')
-            continue
-
-        value = part[eoh+4:-2]
-        name_values = {}
-        for name_part in name_header[10:].split(';'):
-            name, name_value = name_part.strip().split('=', 1)
-            name_values[name] = name_value.strip('"').decode('utf-8')
-
-        if not 'name' in name_values:
-            log.warning('Missing name value in multipart/form-data part.')
-            continue
-
-        name = name_values['name']
-        if 'filename' in name_values:
-            content_type = headers.get('Content-Type', 'application/unknown')
-            request.files.setdefault(name, []).append(dict(
-                filename=name_values['filename'], body=value,
-                content_type=content_type))
-        else:
-            request.post.setdefault(name, []).append(value)
+def negotiate_encoding(accept, available=('gzip', 'deflate')):
+    """
+    Choose a content coding for a response from the value of a request's
+    ``Accept-Encoding`` header, returning None if there isn't one that the
+    client accepts.
+
+    ==========  ============
+    Argument    Description
+    ==========  ============
+    accept      The value of the ``Accept-Encoding`` header.
+    available   *Optional.* The codings that may be used, in order of preference.
+    ==========  ============
+    """
+    if not accept:
+        return None
+
+    qualities = {}
+    for item in accept.split(','):
+        coding, _, params = item.partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params[:2] == 'q=':
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip().lower()] = quality
+
+    best = None
+    best_quality = 0.0
+    default = qualities.get('*', 0.0)
+    for coding in available:
+        quality = qualities.get(coding, default)
+        if quality > best_quality:
+            best = coding
+            best_quality = quality
+
+    return best
 
 def read_headers(data, target=None):
     """
@@ -438,50 +1002,81 @@ def read_headers(data, target=None):
         for line in data.split(CRLF):
             if not line:
                 raise BadRequest('Illegal header line: %r' % line)
-            if key and line[0] in ' \t':
+            if key and line[:1] in (' ', '\t'):
+                if key in NUMERIC_HEADERS:
+                    raise BadRequest('Folded %s header.' %
+                                     _normalize_header(key))
                 val = line.strip()
                 mline = True
             else:
                 mline = False
-                try:
-                    key, val = line.split(':', 1)
-                except ValueError:
+                key, colon, val = line.partition(':')
+                if not colon:
                     raise BadRequest('Illegal header line: %r' % line)
 
                 key = key.strip().lower()
                 val = val.strip()
 
-                try:
-                    val = int(val)
-                except ValueError:
-                    pass
-
-            if key in target:
-                if mline:
-                    if isinstance(target[key], list):
-                        if target[key]:
-                            target[key][-1] += ' ' + val
-                        else:
-                            target[key].append(val)
+            if mline:
+                if isinstance(target[key], list):
+                    if target[key]:
+                        target[key][-1] += ' ' + val
                     else:
-                        target[key] += ' ' + val
-                elif key in COMMA_HEADERS:
-                    target[key] = '%s, %s' % (target[key], val)
-                elif isinstance(target[key], list):
-                    target[key].append(val)
+                        target[key].append(val)
                 else:
-                    target[key] = [target[key], val]
-                continue
-            target[key] = val
+                    target[key] += ' ' + val
+            elif key in target or key in NUMERIC_HEADERS:
+                _add_header(target, key, val)
+            else:
+                target[key] = val
 
     if cast:
         target = HTTPHeaders(_store=target)
 
     return target
 
+def _add_header(target, key, val):
+    """
+    Add a header to a dictionary of parsed headers, when it's a repeated or
+    numeric header. Repeated headers are joined if their values are comma
+    separated lists, and otherwise become lists of values.
+    """
+    if key in NUMERIC_HEADERS:
+        if not val.isdigit():
+            raise BadRequest('Invalid %s header (%r).' % (
+                _normalize_header(key), val))
+        elif key in target and target[key] != val:
+            raise BadRequest('Conflicting %s headers.' %
+                             _normalize_header(key))
+        target[key] = val
+
+    elif key not in target:
+        target[key] = val
+    elif key in _COMMA_HEADERS:
+        target[key] = '%s, %s' % (target[key], val)
+    elif isinstance(target[key], list):
+        target[key].append(val)
+    else:
+        target[key] = [target[key], val]
+
 def date(dt):
     return dt.strftime("%a, %d %b %Y %H:%M:%S GMT")
 
+_date_cache = [None, None]
+
+def http_date(timestamp):
+    """
+    Format a timestamp as an HTTP date. The result is cached for the rest
+    of the second, as every response needs one.
+    """
+    second = int(timestamp)
+    cache = _date_cache
+    if cache[0] != second:
+        cache[1] = time.strftime("%a, %d %b %Y %H:%M:%S GMT",
+                                 time.gmtime(second))
+        cache[0] = second
+    return cache[1]
+
 def parse_date(text):
     for fmt in DATE_FORMATS:
         try:
@@ -100,11 +100,15 @@ any of Python's SSL defaults unless clearly stated in this documentation.
 # Imports
 ###############################################################################
 
+import errno
+import select
 import socket
 import ssl
 import weakref
 
-from pants._channel import _Channel, HAS_IPV6, sock_type
+from pants._channel import _Channel, HAS_IPV6, sock_type, \
+    TCP_DEFER_ACCEPT, TCP_FASTOPEN
+from pants.engine import Engine
 from pants.stream import Stream
 
 
@@ -116,6 +120,16 @@ import logging
 log = logging.getLogger("pants")
 
 
+###############################################################################
+# Constants
+###############################################################################
+
+# Errors raised by accept() that leave the connection waiting in the
+# listen queue rather than indicating a problem with the server itself.
+ACCEPT_OVERFLOW_ERRORS = (errno.EMFILE, errno.ENFILE, errno.ENOBUFS,
+                          errno.ENOMEM)
+
+
 ###############################################################################
 # Server Class
 ###############################################################################
@@ -142,10 +156,41 @@ class Server(_Channel):
                        :meth:`~pants.server.Server.startSSL` will be
                        called with these options once the server is
                        ready. By default, SSL will not be enabled.
+    accept_budget      *Optional.* The maximum number of connections
+                       to accept in response to a single read event.
+                       Defaults to 128.
+    max_connections    *Optional.* The maximum number of connections
+                       that may be open at once. When the limit is
+                       reached the server stops accepting and leaves
+                       new connections in the listen queue until an
+                       existing connection closes. Defaults to None,
+                       meaning no limit.
+    max_connections_   *Optional.* The maximum number of connections
+    per_ip             that may be open at once from a single remote
+                       address. Connections beyond the limit are
+                       passed to
+                       :meth:`~pants.server.Server.on_connection_rejected`.
+                       Defaults to None, meaning no limit.
+    connection_pool_   *Optional.* The number of closed connection
+    size               objects to keep for reuse. See
+                       :meth:`~pants.server.Server.on_accept`.
+                       Defaults to 0, meaning connections are not
+                       reused.
     =================  ================================================
     """
     ConnectionClass = Stream
 
+    # Setting these at the class level makes them easy to override on a
+    # per-class basis.
+    accept_budget = 128
+    max_connections = None
+    max_connections_per_ip = None
+    connection_pool_size = 0
+
+    # Set by listen().
+    defer_accept = None
+    fastopen = None
+
     def __init__(self, ConnectionClass=None, **kwargs):
         sock = kwargs.get("socket", None)
         if sock and sock_type(sock) != socket.SOCK_STREAM:
@@ -166,6 +211,7 @@ class Server(_Channel):
         # SSL state
         self.ssl_enabled = False
         self._ssl_options = None
+        self._ssl_context = None
         if kwargs.get("ssl_options", None) is not None:
             self.startSSL(kwargs["ssl_options"])
 
@@ -174,6 +220,30 @@ class Server(_Channel):
             self.ConnectionClass = ConnectionClass
         self.channels = weakref.WeakValueDictionary()
 
+        # Accept state
+        if kwargs.get("accept_budget", None) is not None:
+            self.accept_budget = kwargs["accept_budget"]
+        self.accepted = 0
+        self.accept_overflows = 0
+        self._accept_rate = 0.0
+        self._accept_window_start = self.engine.latest_poll_time
+        self._accept_window_count = 0
+
+        # Admission state
+        if kwargs.get("max_connections", None) is not None:
+            self.max_connections = kwargs["max_connections"]
+        if kwargs.get("max_connections_per_ip", None) is not None:
+            self.max_connections_per_ip = kwargs["max_connections_per_ip"]
+        self.connection_count = 0
+        self.rejected = 0
+        self._connection_ips = {}
+        self._ip_counts = {}
+
+        # Connection pool
+        if kwargs.get("connection_pool_size", None) is not None:
+            self.connection_pool_size = kwargs["connection_pool_size"]
+        self._connection_pool = []
+
     ##### Properties ##########################################################
 
     @property
@@ -196,6 +266,24 @@ class Server(_Channel):
     def local_address(self, val):
         self._local_address = val
 
+    @property
+    def accept_rate(self):
+        """
+        The number of connections accepted per second, measured over
+        the most recent window of at least one second.
+
+        Together with :attr:`accepted` (the total number of connections
+        accepted) and :attr:`accept_overflows` (the number of times
+        pending connections had to be left in the listen queue, either
+        because :attr:`accept_budget` was exhausted or because the
+        process ran out of file descriptors), this can be used to
+        monitor the server during connection storms.
+        """
+        elapsed = self.engine.latest_poll_time - self._accept_window_start
+        if elapsed < 1.0:
+            return self._accept_rate
+        return self._accept_window_count / elapsed
+
     ##### Control Methods #####################################################
 
     def startSSL(self, ssl_options={}):
@@ -222,6 +310,11 @@ class Server(_Channel):
         **must** be ``False`` and the ``server_side`` option **must** be
         true, or a :exc:`ValueError` will be raised.
 
+        An :class:`ssl.SSLContext` may be given as the ``context`` option,
+        in which case sockets are wrapped with its
+        :meth:`~ssl.SSLContext.wrap_socket` method, and the other options
+        are passed to that instead.
+
         Attempting to enable SSL on a closed channel or a channel that
         already has SSL enabled on it will raise a :exc:`RuntimeError`.
 
@@ -247,11 +340,13 @@ class Server(_Channel):
             raise ValueError("SSL option 'do_handshake_on_connect' must be False.")
 
         self.ssl_enabled = True
+        self._ssl_context = ssl_options.pop("context", None)
         self._ssl_options = ssl_options
 
         return self
 
-    def listen(self, address, backlog=1024, slave=True):
+    def listen(self, address, backlog=1024, slave=True, defer_accept=None,
+               fastopen=None):
         """
         Begin listening for connections made to the channel.
 
@@ -277,6 +372,18 @@ class Server(_Channel):
         Calling :meth:`listen()` on a closed channel or a channel that
         is already listening will raise a :exc:`RuntimeError`.
 
+        On Linux, two TCP options can be used to cut latency for
+        request/response protocols where the client speaks first, such
+        as HTTP. ``defer_accept`` sets ``TCP_DEFER_ACCEPT``, so that the
+        kernel only reports a new connection once the client has sent
+        some data, or the given number of seconds has passed. The server
+        isn't woken for connections that never send anything, and the
+        first read on a new connection finds the request already
+        waiting. ``fastopen`` enables TCP Fast Open (``TCP_FASTOPEN``)
+        with a queue of the given length, allowing returning clients to
+        send their first request in the SYN and save a round trip. Both
+        are silently ignored if the platform doesn't support them.
+
         Returns the channel.
 
         ===============  ================================================
@@ -289,6 +396,13 @@ class Server(_Channel):
                          Server listening on IPv6 INADDR_ANY to
                          create a slave Server that listens on the
                          IPv4 INADDR_ANY.
+        defer_accept     *Optional.* The number of seconds to wait for
+                         data on a new connection before waking the
+                         server for it. Defaults to None, meaning
+                         disabled.
+        fastopen         *Optional.* The maximum number of pending TCP
+                         Fast Open requests. Defaults to None, meaning
+                         disabled.
         ===============  ================================================
         """
         if self.listening:
@@ -302,6 +416,9 @@ class Server(_Channel):
             raise ValueError("Unable to determine address family from "
                              "address: %s" % repr(address))
 
+        self.defer_accept = defer_accept
+        self.fastopen = fastopen
+
         self._do_listen(address, family, backlog, slave)
 
         return self
@@ -345,6 +462,16 @@ class Server(_Channel):
         :attr:`~pants.server.Server.ConnectionClass` to wrap the socket
         and add it to the server.
 
+        If :attr:`~pants.server.Server.connection_pool_size` is non-zero,
+        connections that have closed are kept and recycled rather than
+        creating a new instance. A recycled connection is reset by
+        calling its ``__init__`` method again, so this should only be
+        enabled for connection classes whose constructor fully resets
+        their state. Each time a connection is recycled its
+        :attr:`~pants.stream.Stream.generation` is incremented, which
+        allows code that holds on to a connection to detect that it is
+        no longer talking to the same client.
+
         =========  ============
         Argument   Description
         =========  ============
@@ -352,11 +479,43 @@ class Server(_Channel):
         addr       The new socket's address.
         =========  ============
         """
-        connection = self.ConnectionClass(engine=self.engine, socket=socket)
+        if self._connection_pool:
+            connection = self._connection_pool.pop()
+            connection._recycle(engine=self.engine, socket=socket)
+        else:
+            connection = self.ConnectionClass(engine=self.engine, socket=socket)
         connection.server = self
+        connection._server = self
         self.channels[connection.fileno] = connection
+
+        ip = addr[0] if isinstance(addr, tuple) else addr
+        self._connection_ips[connection.fileno] = ip
+        self._ip_counts[ip] = self._ip_counts.get(ip, 0) + 1
+        self.connection_count += 1
+
         connection._handle_connect_event()
 
+    def on_connection_rejected(self, sock, addr):
+        """
+        Called when a new connection has been accepted but cannot be
+        admitted because one of the server's connection limits has been
+        reached. The socket has not been wrapped in an SSL context.
+
+        By default, closes the new connection. Subclasses may override
+        this to send a short response, such as an HTTP 503, first.
+
+        =========  ============
+        Argument   Description
+        =========  ============
+        sock       The newly connected socket object.
+        addr       The new socket's address.
+        =========  ============
+        """
+        try:
+            sock.close()
+        except socket.error:
+            pass
+
     def on_close(self):
         """
         Called after the channel has finished closing.
@@ -366,6 +525,8 @@ class Server(_Channel):
         for channel in self.channels.values():
             channel.close(flush=False)
 
+        self._connection_pool = []
+
     ##### Public Error Handlers ###############################################
 
     def on_ssl_wrap_error(self, sock, addr, exception):
@@ -433,6 +594,8 @@ class Server(_Channel):
             self._socket.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
             slave = False
 
+        self._set_listen_options(self.defer_accept, self.fastopen)
+
         try:
             self._socket_bind(addr)
             self._socket_listen(backlog)
@@ -450,36 +613,246 @@ class Server(_Channel):
             except Exception:
                 self._slave = None
 
+    def _set_listen_options(self, defer_accept, fastopen):
+        """
+        Apply the ``TCP_DEFER_ACCEPT`` and ``TCP_FASTOPEN`` options to
+        the listening socket, where requested and supported.
+
+        =============  =================================================
+        Argument       Description
+        =============  =================================================
+        defer_accept   The number of seconds to defer accepting for, or
+                       None.
+        fastopen       The TCP Fast Open queue length, or None.
+        =============  =================================================
+        """
+        if self._socket.family not in (socket.AF_INET, socket.AF_INET6):
+            return
+
+        if defer_accept:
+            self._socket_set_tcp_option(TCP_DEFER_ACCEPT, int(defer_accept))
+
+        if fastopen:
+            self._socket_set_tcp_option(TCP_FASTOPEN, int(fastopen))
+
     ##### Internal Event Handler Methods ######################################
 
     def _handle_read_event(self):
         """
         Handle a read event raised on the channel.
+
+        Pending connections are drained from the listen queue, up to
+        :attr:`accept_budget` of them, before any of them are set up.
+        Anything left over is picked up on the next read event.
         """
-        while True:
+        pending = []
+        overflows = 0
+        budget = self.accept_budget
+
+        capacity = self._accept_capacity()
+        if capacity is not None:
+            if capacity <= 0:
+                self._pause_accepting()
+                return
+            budget = min(budget, capacity)
+
+        while len(pending) < budget:
             try:
                 sock, addr = self._socket_accept()
-            except socket.error:
-                log.exception("Exception raised by accept() on %r." % self)
-                try:
-                    sock.close()
-                except socket.error:
-                    pass
-                return
+            except socket.error as err:
+                if err.args[0] in ACCEPT_OVERFLOW_ERRORS:
+                    log.warning("Unable to accept connection on %r: %s" %
+                                (self, err))
+                    overflows += 1
+                else:
+                    log.exception("Exception raised by accept() on %r." % self)
+                break
 
             if sock is None:
+                break
+
+            pending.append((sock, addr))
+        else:
+            if self._accept_pending():
+                overflows += 1
+
+        if pending or overflows:
+            self._update_accept_stats(len(pending), overflows)
+
+        for index, (sock, addr) in enumerate(pending):
+            if self._closed:
+                # A callback closed the server, so the rest of the batch
+                # won't be set up.
+                for sock, addr in pending[index:]:
+                    sock.close()
                 return
 
+            if not self._admit_connection(addr):
+                self.rejected += 1
+                self._safely_call(self.on_connection_rejected, sock, addr)
+                continue
+
             if self.ssl_enabled:
                 try:
                     sock.setblocking(False)
-                    sock = ssl.wrap_socket(sock, **self._ssl_options)
+                    if self._ssl_context is not None:
+                        sock = self._ssl_context.wrap_socket(sock,
+                            **self._ssl_options)
+                    else:
+                        sock = ssl.wrap_socket(sock, **self._ssl_options)
                 except ssl.SSLError as e:
                     self._safely_call(self.on_ssl_wrap_error, sock, addr, e)
                     continue
 
             self._safely_call(self.on_accept, sock, addr)
 
+        if self._closed:
+            return
+
+        if capacity is not None and self._accept_capacity() <= 0:
+            self._pause_accepting()
+
+    def _accept_pending(self):
+        """
+        Return True if another connection is waiting in the listen queue,
+        without accepting it.
+        """
+        try:
+            if hasattr(select, "poll"):
+                poller = select.poll()
+                poller.register(self._socket.fileno(), select.POLLIN)
+                return bool(poller.poll(0))
+            return bool(select.select([self._socket], [], [], 0)[0])
+        except (select.error, socket.error, ValueError):
+            return True
+
+    def _accept_capacity(self):
+        """
+        Return the number of connections that may still be accepted
+        under :attr:`~pants.server.Server.max_connections`, or None if
+        there is no limit.
+        """
+        if self.max_connections is None:
+            return None
+        return self.max_connections - self.connection_count
+
+    def _admit_connection(self, addr):
+        """
+        Determine whether a newly accepted connection from the given
+        address may be admitted under
+        :attr:`~pants.server.Server.max_connections_per_ip`.
+
+        =========  ============
+        Argument   Description
+        =========  ============
+        addr       The new socket's address.
+        =========  ============
+        """
+        limit = self.max_connections_per_ip
+        if limit is None:
+            return True
+
+        ip = addr[0] if isinstance(addr, tuple) else addr
+        return self._ip_counts.get(ip, 0) < limit
+
+    def _handle_connection_close(self, connection):
+        """
+        Forget about a connection accepted by this server once it has
+        closed, keeping it for reuse if the connection pool has room and
+        resuming accepting if the server had been paused by
+        :attr:`~pants.server.Server.max_connections`.
+
+        ===========  ============
+        Argument     Description
+        ===========  ============
+        connection   The connection that is closing.
+        ===========  ============
+        """
+        ip = self._connection_ips.pop(connection.fileno, None)
+        if ip is None:
+            return
+
+        self.connection_count -= 1
+        count = self._ip_counts[ip] - 1
+        if count:
+            self._ip_counts[ip] = count
+        else:
+            del self._ip_counts[ip]
+
+        if len(self._connection_pool) < self.connection_pool_size and \
+                type(connection) is self.ConnectionClass:
+            # A pooled connection stays alive, so it has to be taken out
+            # of channels by hand.
+            if self.channels.get(connection.fileno) is connection:
+                del self.channels[connection.fileno]
+            self._connection_pool.append(connection)
+
+        capacity = self._accept_capacity()
+        if capacity is None or capacity > 0:
+            self._resume_accepting()
+
+    def _pause_accepting(self):
+        """
+        Stop waiting for read events on the listening sockets, leaving
+        new connections in the kernel's listen queue.
+        """
+        self._wait_for_read_events(False)
+        if self._slave:
+            self._slave._wait_for_read_events(False)
+
+    def _resume_accepting(self):
+        """
+        Start waiting for read events on the listening sockets again.
+        """
+        self._wait_for_read_events(True)
+        if self._slave:
+            self._slave._wait_for_read_events(True)
+
+    def _wait_for_read_events(self, wait):
+        """
+        Start or stop waiting for read events on the channel, updating
+        the engine if necessary.
+
+        =========  ============
+        Argument   Description
+        =========  ============
+        wait       Whether or not to wait for read events.
+        =========  ============
+        """
+        if self._closed or bool(self._events & Engine.READ) == wait:
+            return
+
+        if wait:
+            self._events = self._events | Engine.READ
+        else:
+            self._events = self._events & ~Engine.READ
+        self.engine.modify_channel(self)
+
+    def _update_accept_stats(self, count, overflows):
+        """
+        Record the outcome of a read event for
+        :attr:`~pants.server.Server.accept_rate` and friends.
+
+        ==========  ====================================================
+        Argument    Description
+        ==========  ====================================================
+        count       The number of connections that were accepted.
+        overflows   The number of times connections had to be left in
+                    the listen queue.
+        ==========  ====================================================
+        """
+        self.accepted += count
+        self.accept_overflows += overflows
+
+        now = self.engine.latest_poll_time
+        elapsed = now - self._accept_window_start
+        if elapsed >= 1.0:
+            self._accept_rate = self._accept_window_count / elapsed
+            self._accept_window_start = now
+            self._accept_window_count = 0
+
+        self._accept_window_count += count
+
     def _handle_write_event(self):
         """
         Handle a write event raised on the channel.
@@ -499,6 +872,8 @@ class _SlaveServer(Server):
     def __init__(self, engine, server, addr, backlog):
         Server.__init__(self, engine=engine)
         self.server = server
+        self.accept_budget = server.accept_budget
+        self.on_connection_rejected = server.on_connection_rejected
 
         # Now, listen our way.
         if server._socket.family == socket.AF_INET6:
@@ -516,6 +891,8 @@ class _SlaveServer(Server):
         except AttributeError:
             pass
 
+        self._set_listen_options(server.defer_accept, server.fastopen)
+
         try:
             self._socket_bind(addr)
             self._socket_listen(backlog)
@@ -533,3 +910,18 @@ class _SlaveServer(Server):
     def on_close(self):
         if self.server._slave == self:
             self.server._slave = None
+
+    def _accept_capacity(self):
+        return self.server._accept_capacity()
+
+    def _admit_connection(self, addr):
+        return self.server._admit_connection(addr)
+
+    def _pause_accepting(self):
+        self.server._pause_accepting()
+
+    def _resume_accepting(self):
+        self.server._resume_accepting()
+
+    def _update_accept_stats(self, count, overflows):
+        self.server._update_accept_stats(count, overflows)
@@ -142,7 +142,8 @@ import socket
 import ssl
 import struct
 
-from pants._channel import _Channel, HAS_IPV6, sock_type
+from pants._channel import _Channel, HAS_IPV6, sock_type, \
+    TCP_FASTOPEN_CONNECT
 from pants.engine import Engine
 
 
@@ -225,6 +226,10 @@ class Stream(_Channel):
         self.connected = False
         self.connecting = False
         self._closing = False
+        self._reading_paused = False
+
+        # The server that accepted this stream, if any.
+        self._server = None
 
         # SSL state
         self.ssl_enabled = False
@@ -414,6 +419,10 @@ class Stream(_Channel):
     regex_search = True
     _buffer_size = 2 ** 16  # 64kb
 
+    #: The number of times this stream has been recycled by a server's
+    #: connection pool. See :attr:`pants.server.Server.connection_pool_size`.
+    generation = 0
+
     @property
     def buffer_size(self):
         """
@@ -525,7 +534,7 @@ class Stream(_Channel):
 
         return self
 
-    def connect(self, address):
+    def connect(self, address, fastopen=False):
         """
         Connect the channel to a remote socket.
 
@@ -552,12 +561,24 @@ class Stream(_Channel):
         Calling :meth:`connect()` on a closed channel or a channel that
         is already connected will raise a :exc:`RuntimeError`.
 
+        If ``fastopen`` is True and the platform supports it (Linux 4.11
+        or later), TCP Fast Open is used for the connection. Once the
+        server has issued the stream a Fast Open cookie, reconnecting
+        doesn't wait for the handshake: the connection is reported
+        immediately and the first data written is sent along with the
+        SYN, saving a round trip. This is mainly useful for clients that
+        reconnect frequently to the same server and write first. Note
+        that in this case connection errors are only reported once the
+        first data has been written.
+
         Returns the channel.
 
         ===============  ===============================================
         Arguments        Description
         ===============  ===============================================
         address          The remote address to connect to.
+        fastopen         *Optional.* Whether or not to use TCP Fast
+                         Open. Defaults to False.
         ===============  ===============================================
         """
         if self.connected or self.connecting:
@@ -571,7 +592,7 @@ class Stream(_Channel):
         address, family, resolved = self._format_address(address)
 
         if resolved:
-            self._do_connect(address, family)
+            self._do_connect(address, family, fastopen=fastopen)
         else:
             try:
                 result = socket.getaddrinfo(address[0], address[1], family)
@@ -583,7 +604,7 @@ class Stream(_Channel):
 
             # We only care about the first result.
             result = result[0]
-            self._do_connect(result[-1], result[0])
+            self._do_connect(result[-1], result[0], fastopen=fastopen)
 
         return self
 
@@ -613,6 +634,10 @@ class Stream(_Channel):
 
         self._safely_call(self.on_close)
 
+        if self._server is not None:
+            self._server._handle_connection_close(self)
+            self._server = None
+
         self._remote_address = None
         self._local_address = None
 
@@ -793,7 +818,63 @@ class Stream(_Channel):
 
     ##### Internal Methods ####################################################
 
-    def _do_connect(self, address, family, error=None):
+    def _recycle(self, **kwargs):
+        """
+        Reset a closed stream so it can wrap a new socket, incrementing
+        its :attr:`~pants.stream.Stream.generation`.
+
+        All instance attributes are dropped before the constructor runs,
+        so handlers that were replaced on the instance, such as by a
+        WebSocket taking over the connection, don't carry over to the
+        next client.
+
+        Keyword arguments are passed through to the constructor.
+        """
+        if not self._closed:
+            raise RuntimeError("_recycle() called on open %r." % self)
+
+        generation = self.generation + 1
+        self.__dict__.clear()
+        self.generation = generation
+        self.__init__(**kwargs)
+
+    def _pause_reading(self):
+        """
+        Stop reading from the socket and stop passing buffered data to
+        :meth:`~pants.stream.Stream.on_read` until
+        :meth:`~pants.stream.Stream._resume_reading` is called. Data that
+        arrives in the meantime is left to the operating system, which
+        eventually stops the remote end from sending more.
+        """
+        if self._reading_paused:
+            return
+
+        self._reading_paused = True
+        if not self._closed and self._events & Engine.READ:
+            self._events = self._events & ~Engine.READ
+            self.engine.modify_channel(self)
+
+    def _resume_reading(self):
+        """
+        Start reading from the socket again after
+        :meth:`~pants.stream.Stream._pause_reading`, and process any data
+        that was already buffered.
+        """
+        if not self._reading_paused:
+            return
+
+        self._reading_paused = False
+        if self._closed:
+            return
+
+        if not self._events & Engine.READ:
+            self._events = self._events | Engine.READ
+            self.engine.modify_channel(self)
+
+        if self._recv_buffer:
+            self._process_recv_buffer()
+
+    def _do_connect(self, address, family, error=None, fastopen=False):
         """
         A callback method to be used with
         :meth:`~pants._channel._Channel._resolve_addr` - either connects
@@ -808,6 +889,7 @@ class Stream(_Channel):
                    resolution failed.
         error      *Optional.* Error information or None if no error
                    occurred.
+        fastopen   *Optional.* Whether or not to use TCP Fast Open.
         =========  =====================================================
         """
         if not address:
@@ -824,6 +906,10 @@ class Stream(_Channel):
 
         sock = socket.socket(family, socket.SOCK_STREAM)
         self._socket_set(sock)
+
+        if fastopen and family in (socket.AF_INET, socket.AF_INET6):
+            self._socket_set_tcp_option(TCP_FASTOPEN_CONNECT, 1)
+
         self.engine.add_channel(self)
 
         try:
@@ -847,6 +933,9 @@ class Stream(_Channel):
             self._ssl_do_handshake()
             return
 
+        if self._reading_paused:
+            return
+
         while True:
             try:
                 data = self._socket_recv()
@@ -926,7 +1015,7 @@ class Stream(_Channel):
         Process the :attr:`~pants.stream.Stream._recv_buffer`, passing
         chunks of data to :meth:`~pants.stream.Stream.on_read`.
         """
-        while self._recv_buffer:
+        while self._recv_buffer and not self._reading_paused:
             delimiter = self.read_delimiter
 
             if delimiter is None:
@@ -1066,31 +1155,41 @@ class Stream(_Channel):
 
     def _process_send_file(self, sfile, offset, nbytes):
         """
-        Send data from a file to the remote socket.
+        Send data from a file to the remote socket, for as long as the
+        socket will accept it.
         """
-        try:
-            bytes_sent = self._socket_sendfile(sfile, offset, nbytes)
-        except socket.error as err:
-            self._safely_call(self.on_write_error, err)
-            return 0
+        if nbytes <= 0:
+            # Work out how much of the file is left once, rather than on
+            # every call.
+            nbytes = os.fstat(sfile.fileno()).st_size - offset
 
-        offset += bytes_sent
+        total = 0
 
-        if nbytes > 0:
-            if nbytes - bytes_sent > 0:
-                nbytes -= bytes_sent
-            else:
-                # Reached the end of the segment.
-                return bytes_sent
+        while nbytes > 0:
+            try:
+                bytes_sent = self._socket_sendfile(sfile, offset, nbytes)
+            except socket.error as err:
+                self._safely_call(self.on_write_error, err)
+                return 0
+
+            if bytes_sent == 0:
+                break
+
+            total += bytes_sent
+            offset += bytes_sent
+            nbytes -= bytes_sent
+
+        if nbytes <= 0 or self._closed:
+            # Reached the end of the segment.
+            return total
 
-        # TODO This is awful. Find a better way.
         if os.fstat(sfile.fileno()).st_size - offset <= 0:
-            # Reached the end of the file.
-            return bytes_sent
+            # The file was truncated while it was being sent.
+            return total
 
+        # The socket is full. Wait for the next write event.
         self._send_buffer.insert(0, (Stream.SEND_FILE, (sfile, offset, nbytes)))
-
-        return bytes_sent
+        return 0
 
     def _process_send_ssl_handshake(self, ssl_options):
         """
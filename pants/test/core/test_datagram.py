@@ -0,0 +1,220 @@
+###############################################################################
+#
+# Copyright 2012 Pants Developers (see AUTHORS.txt)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+
+import socket
+import time
+import unittest
+
+from pants.datagram import Datagram, SO_REUSEPORT
+from pants.util.mmsg import HAS_MMSG, HAS_UDP_OFFLOAD
+
+from pants.test._pants_util import *
+
+class EchoDatagram(Datagram):
+    def on_read(self, data):
+        self.write(data)
+
+class TestDatagramEcho(PantsTestCase):
+    batch_size = 0
+
+    def setUp(self):
+        self.server = EchoDatagram(batch_size=self.batch_size)
+        self.server.listen(('127.0.0.1', 4040))
+        PantsTestCase.setUp(self)
+
+    def tearDown(self):
+        PantsTestCase.tearDown(self)
+        self.server.close()
+
+    def test_echo_one_datagram(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.settimeout(1.0)
+        sock.sendto("hello", ('127.0.0.1', 4040))
+        data, addr = sock.recvfrom(1024)
+        self.assertEqual(data, "hello")
+        self.assertEqual(addr, ('127.0.0.1', 4040))
+        sock.close()
+
+    def test_echo_many_datagrams(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.settimeout(1.0)
+        requests = ["datagram %d" % i for i in xrange(50)]
+        for request in requests:
+            sock.sendto(request, ('127.0.0.1', 4040))
+
+        # Datagrams from one sender are buffered together, so the echoes
+        # may be coalesced.
+        received = ''
+        expected = ''.join(requests)
+        while len(received) < len(expected):
+            received += sock.recvfrom(65536)[0]
+        self.assertEqual(received, expected)
+        sock.close()
+
+@unittest.skipUnless(HAS_MMSG, "recvmmsg() and sendmmsg() are unavailable.")
+class TestDatagramBatchedEcho(TestDatagramEcho):
+    batch_size = 16
+
+    def test_batch_buffers_allocated(self):
+        self.assertEqual(self.server._mmsg_recv.count, 16)
+        self.assertEqual(self.server._mmsg_send.count, 16)
+
+class PacketEchoDatagram(Datagram):
+    def on_read(self, data, addr):
+        self.write(data, addr)
+
+class TestDatagramPacketMode(PantsTestCase):
+    def setUp(self):
+        self.server = PacketEchoDatagram(packet_mode=True)
+        self.server.listen(('127.0.0.1', 4040))
+        PantsTestCase.setUp(self)
+
+    def tearDown(self):
+        PantsTestCase.tearDown(self)
+        self.server.close()
+
+    def test_packets_delivered_individually(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.settimeout(1.0)
+        requests = ["datagram %d" % i for i in xrange(20)]
+        for request in requests:
+            sock.sendto(request, ('127.0.0.1', 4040))
+
+        responses = [sock.recvfrom(1024)[0] for request in requests]
+        self.assertEqual(responses, requests)
+        self.assertEqual(self.server._recv_buffer, {})
+        self.assertEqual(self.server.remote_address, None)
+        sock.close()
+
+class PacketCollector(Datagram):
+    def __init__(self, **kwargs):
+        Datagram.__init__(self, **kwargs)
+        self.received = []
+
+    def on_read(self, data, addr):
+        self.received.append(data)
+
+class TestDatagramSegments(PantsTestCase):
+    gro = False
+
+    def setUp(self):
+        self.server = PacketCollector(packet_mode=True, gro=self.gro)
+        self.server.listen(('127.0.0.1', 4040))
+        self.client = Datagram().listen(('127.0.0.1', 0))
+        PantsTestCase.setUp(self)
+
+    def tearDown(self):
+        PantsTestCase.tearDown(self)
+        self.client.close()
+        self.server.close()
+
+    def _wait_for(self, count):
+        for i in xrange(100):
+            if len(self.server.received) >= count:
+                break
+            time.sleep(0.01)
+
+    def test_write_equal_segments(self):
+        segments = ["%04d" % i * 25 for i in xrange(100)] + ["short"]
+        self._engine.callback(self.client.write_segments, segments,
+                              ('127.0.0.1', 4040), True)
+        self._wait_for(len(segments))
+        self.assertEqual(self.server.received, segments)
+
+    def test_write_unequal_segments(self):
+        segments = ["a", "bb", "ccc"]
+        self._engine.callback(self.client.write_segments, segments,
+                              ('127.0.0.1', 4040), True)
+        self._wait_for(len(segments))
+        self.assertEqual(self.server.received, segments)
+
+@unittest.skipUnless(HAS_MMSG and HAS_UDP_OFFLOAD,
+                     "UDP segmentation offload is unavailable.")
+class TestDatagramSegmentsGRO(TestDatagramSegments):
+    gro = True
+
+@unittest.skipUnless(HAS_MMSG, "recvmmsg() and sendmmsg() are unavailable.")
+class TestDatagramBatchedSend(PantsTestCase):
+    def setUp(self):
+        self.server = PacketCollector(packet_mode=True)
+        self.server.listen(('127.0.0.1', 4040))
+        self.client = Datagram(batch_size=4).listen(('127.0.0.1', 0))
+        PantsTestCase.setUp(self)
+
+    def tearDown(self):
+        PantsTestCase.tearDown(self)
+        self.client.close()
+        self.server.close()
+
+    def _write(self):
+        self.client.write("a", ('127.0.0.1', 4040))
+        self.client.write("b", ('localhost', 4040))
+        self.client.write("c", ('127.0.0.1', 4040))
+        self.client.flush()
+
+    def test_hostname_in_batch(self):
+        self._engine.callback(self._write)
+        for i in xrange(100):
+            if len(self.server.received) >= 3:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.server.received, ["a", "b", "c"])
+
+@unittest.skipUnless(SO_REUSEPORT, "SO_REUSEPORT is unavailable.")
+class TestDatagramListenGroup(PantsTestCase):
+    steering = None
+
+    def setUp(self):
+        self.group = PacketCollector.listen_group(('127.0.0.1', 4040), 4,
+                                                  steering=self.steering,
+                                                  packet_mode=True)
+        PantsTestCase.setUp(self)
+
+    def tearDown(self):
+        PantsTestCase.tearDown(self)
+        for channel in self.group:
+            channel.close()
+
+    def test_group_shares_address(self):
+        self.assertEqual(len(self.group), 4)
+        for channel in self.group:
+            self.assertEqual(channel.local_address, ('127.0.0.1', 4040))
+
+    def test_group_receives_all_datagrams(self):
+        socks = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                 for i in xrange(16)]
+        for i, sock in enumerate(socks):
+            sock.sendto("datagram %d" % i, ('127.0.0.1', 4040))
+
+        for i in xrange(100):
+            received = sum((c.received for c in self.group), [])
+            if len(received) >= len(socks):
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(sorted(received),
+                         sorted("datagram %d" % i for i in xrange(16)))
+        for sock in socks:
+            sock.close()
+
+class TestDatagramListenGroupCPUSteering(TestDatagramListenGroup):
+    steering = "cpu"
+
+    def test_steering_attached(self):
+        self.assertTrue(self.group[0]._attach_steering(
+            [(0x06, 0, 0, 0)]))
@@ -0,0 +1,107 @@
+###############################################################################
+#
+# Copyright 2012 Pants Developers (see AUTHORS.txt)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+
+import os
+import tempfile
+import unittest
+
+from pants.engine import Engine
+from pants.util.filecache import FileCache
+
+class TestFileCache(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.write(fd, "Hello, World!")
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_open_reuses_file(self):
+        cache = FileCache()
+        f1, stat1 = cache.open(self.path)
+        f2, stat2 = cache.open(self.path)
+        self.assertIs(f1, f2)
+        self.assertEqual(stat1.st_size, 13)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertTrue(self.path in cache)
+
+    def test_changed_file_reopened_after_ttl(self):
+        cache = FileCache(ttl=0)
+        f1, stat1 = cache.open(self.path)
+
+        with open(self.path, 'ab') as f:
+            f.write(" Again.")
+
+        f2, stat2 = cache.open(self.path)
+        self.assertIsNot(f1, f2)
+        self.assertEqual(stat2.st_size, 20)
+
+    def test_unchanged_file_reused_after_ttl(self):
+        cache = FileCache(ttl=0)
+        f1, stat1 = cache.open(self.path)
+        f2, stat2 = cache.open(self.path)
+        self.assertIs(f1, f2)
+        self.assertFalse(self.path in cache)
+
+    def test_ttl_follows_engine_clock(self):
+        engine = Engine()
+        cache = FileCache(ttl=1.0, engine=engine)
+        f1, stat1 = cache.open(self.path)
+
+        with open(self.path, 'ab') as f:
+            f.write(" Again.")
+
+        engine.latest_poll_time += 0.5
+        self.assertTrue(self.path in cache)
+        f2, stat2 = cache.open(self.path)
+        self.assertIs(f1, f2)
+
+        engine.latest_poll_time += 1.0
+        self.assertFalse(self.path in cache)
+        f3, stat3 = cache.open(self.path)
+        self.assertIsNot(f1, f3)
+        self.assertEqual(stat3.st_size, 20)
+
+    def test_invalidate(self):
+        cache = FileCache()
+        f1, stat1 = cache.open(self.path)
+        cache.invalidate(self.path)
+        self.assertEqual(len(cache), 0)
+        f2, stat2 = cache.open(self.path)
+        self.assertIsNot(f1, f2)
+
+        cache.invalidate()
+        self.assertEqual(len(cache), 0)
+
+    def test_least_recently_used_evicted(self):
+        fd, other = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            cache = FileCache(size=1)
+            cache.open(self.path)
+            cache.open(other)
+            self.assertEqual(len(cache), 1)
+            self.assertFalse(self.path in cache)
+            self.assertTrue(other in cache)
+        finally:
+            os.remove(other)
+
+    def test_missing_file(self):
+        cache = FileCache()
+        self.assertRaises(OSError, cache.open, self.path + ".missing")
@@ -18,6 +18,7 @@
 
 import os
 import socket
+import tempfile
 import unittest
 
 import pants
@@ -51,3 +52,43 @@ class TestSendfile(PantsTestCase):
     def tearDown(self):
         PantsTestCase.tearDown(self)
         self.server.close()
+
+class LargeFileSender(pants.Stream):
+    path = None
+
+    def on_connect(self):
+        self.sfile = open(self.path, 'rb')
+        self.write_file(self.sfile)
+        self.close()
+
+    def on_close(self):
+        self.sfile.close()
+
+class TestSendfileLargeFile(PantsTestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        self.expected_data = os.urandom(4 * 2 ** 20)
+        os.write(fd, self.expected_data)
+        os.close(fd)
+
+        LargeFileSender.path = self.path
+        self.server = pants.Server(ConnectionClass=LargeFileSender).listen(('127.0.0.1', 4040))
+        PantsTestCase.setUp(self)
+
+    def test_sendfile_large_file(self):
+        sock = socket.socket()
+        sock.settimeout(1.0)
+        sock.connect(('127.0.0.1', 4040))
+        chunks = []
+        while True:
+            data = sock.recv(2 ** 16)
+            if not data:
+                break
+            chunks.append(data)
+        self.assertEqual(''.join(chunks), self.expected_data)
+        sock.close()
+
+    def tearDown(self):
+        PantsTestCase.tearDown(self)
+        self.server.close()
+        os.remove(self.path)
@@ -0,0 +1,287 @@
+###############################################################################
+#
+# Copyright 2012 Pants Developers (see AUTHORS.txt)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+
+import socket
+import time
+import unittest
+
+import pants
+
+from pants.test._pants_util import *
+
+class Echo(pants.Stream):
+    def on_read(self, data):
+        self.write(data)
+
+class TestServerAcceptBudget(PantsTestCase):
+    def setUp(self):
+        self.server = pants.Server(ConnectionClass=Echo, accept_budget=2)
+        self.server.listen(('127.0.0.1', 4040))
+        PantsTestCase.setUp(self)
+
+    def test_server_accepts_more_connections_than_budget(self):
+        socks = []
+        for i in range(5):
+            sock = socket.socket()
+            sock.settimeout(1.0)
+            sock.connect(('127.0.0.1', 4040))
+            socks.append(sock)
+
+        for sock in socks:
+            request = repr(sock)
+            sock.send(request)
+            self.assertEqual(sock.recv(1024), request)
+
+        self.assertEqual(self.server.accepted, 5)
+        self.assertTrue(self.server.accept_rate >= 0)
+
+        for sock in socks:
+            sock.close()
+
+    def tearDown(self):
+        PantsTestCase.tearDown(self)
+        self.server.close()
+
+class TestServerAcceptOverflows(unittest.TestCase):
+    def test_server_counts_only_real_overflows(self):
+        server = pants.Server(ConnectionClass=Echo, accept_budget=2)
+        server.listen(('127.0.0.1', 4040))
+
+        socks = []
+        def connect(count):
+            for i in range(count):
+                sock = socket.socket()
+                sock.settimeout(1.0)
+                sock.connect(('127.0.0.1', 4040))
+                socks.append(sock)
+            time.sleep(0.05)
+
+        # Exactly the budget is waiting, so nothing is left behind.
+        connect(2)
+        server._handle_read_event()
+        self.assertEqual(server.accepted, 2)
+        self.assertEqual(server.accept_overflows, 0)
+
+        connect(3)
+        server._handle_read_event()
+        self.assertEqual(server.accepted, 4)
+        self.assertEqual(server.accept_overflows, 1)
+
+        server.close()
+        for sock in socks:
+            sock.close()
+
+class TestServerClosedMidBatch(unittest.TestCase):
+    def test_server_closes_rest_of_batch(self):
+        accepted = []
+
+        class ClosingServer(pants.Server):
+            def on_accept(self, sock, addr):
+                accepted.append(sock)
+                self.close()
+
+        server = ClosingServer(ConnectionClass=Echo)
+        server.listen(('127.0.0.1', 4040))
+
+        taken = []
+        socket_accept = server._socket_accept
+        def _socket_accept():
+            sock, addr = socket_accept()
+            if sock is not None:
+                taken.append(sock)
+            return sock, addr
+        server._socket_accept = _socket_accept
+
+        socks = []
+        for i in range(3):
+            sock = socket.socket()
+            sock.settimeout(1.0)
+            sock.connect(('127.0.0.1', 4040))
+            socks.append(sock)
+        time.sleep(0.05)
+
+        server._handle_read_event()
+        self.assertEqual(len(accepted), 1)
+        self.assertEqual(len(taken), 3)
+        for sock in taken[1:]:
+            self.assertRaises(socket.error, sock.fileno)
+        for sock in socks[1:]:
+            self.assertEqual(sock.recv(1024), "")
+
+        for sock in accepted + socks:
+            sock.close()
+
+class TestServerMaxConnections(PantsTestCase):
+    def setUp(self):
+        self.server = pants.Server(ConnectionClass=Echo, max_connections=1)
+        self.server.listen(('127.0.0.1', 4040))
+        PantsTestCase.setUp(self)
+
+    def test_server_waits_for_a_free_connection(self):
+        sock1 = socket.socket()
+        sock1.settimeout(1.0)
+        sock1.connect(('127.0.0.1', 4040))
+        sock1.send("one")
+        self.assertEqual(sock1.recv(1024), "one")
+
+        # The second connection sits in the listen queue.
+        sock2 = socket.socket()
+        sock2.settimeout(0.3)
+        sock2.connect(('127.0.0.1', 4040))
+        sock2.send("two")
+        self.assertRaises(socket.timeout, sock2.recv, 1024)
+        self.assertEqual(self.server.connection_count, 1)
+
+        sock1.close()
+        sock2.settimeout(1.0)
+        self.assertEqual(sock2.recv(1024), "two")
+        sock2.close()
+
+    def tearDown(self):
+        PantsTestCase.tearDown(self)
+        self.server.close()
+
+class TestServerMaxConnectionsPerIP(PantsTestCase):
+    def setUp(self):
+        self.server = pants.Server(ConnectionClass=Echo,
+                                   max_connections_per_ip=1)
+        self.server.listen(('127.0.0.1', 4040))
+        PantsTestCase.setUp(self)
+
+    def test_server_rejects_excess_connections(self):
+        sock1 = socket.socket()
+        sock1.settimeout(1.0)
+        sock1.connect(('127.0.0.1', 4040))
+        sock1.send("one")
+        self.assertEqual(sock1.recv(1024), "one")
+
+        sock2 = socket.socket()
+        sock2.settimeout(1.0)
+        sock2.connect(('127.0.0.1', 4040))
+        try:
+            self.assertEqual(sock2.recv(1024), "")
+        except socket.error:
+            pass
+        self.assertEqual(self.server.rejected, 1)
+
+        sock1.close()
+        sock2.close()
+
+    def tearDown(self):
+        PantsTestCase.tearDown(self)
+        self.server.close()
+
+class TestServerConnectionPool(PantsTestCase):
+    def setUp(self):
+        self.server = pants.Server(ConnectionClass=Echo,
+                                   connection_pool_size=1)
+        self.server.listen(('127.0.0.1', 4040))
+        PantsTestCase.setUp(self)
+
+    def _echo(self):
+        sock = socket.socket()
+        sock.settimeout(1.0)
+        sock.connect(('127.0.0.1', 4040))
+        sock.send("ping")
+        self.assertEqual(sock.recv(1024), "ping")
+        connection = self.server.channels.values()[0]
+        sock.close()
+
+        for i in range(20):
+            if not self.server.connection_count:
+                break
+            time.sleep(0.05)
+
+        return connection
+
+    def test_server_recycles_closed_connections(self):
+        first = self._echo()
+        generation = first.generation
+        second = self._echo()
+        self.assertTrue(first is second)
+        self.assertEqual(second.generation, generation + 1)
+
+    def test_closed_connections_leave_channels(self):
+        self._echo()
+        self.assertEqual(len(self.server.channels), 0)
+        self._echo()
+        self.assertEqual(len(self.server.channels), 0)
+
+    def test_recycled_connections_drop_replaced_handlers(self):
+        closed = []
+        sock = socket.socket()
+        sock.settimeout(1.0)
+        sock.connect(('127.0.0.1', 4040))
+        sock.send("ping")
+        self.assertEqual(sock.recv(1024), "ping")
+        first = self.server.channels.values()[0]
+        first.on_close = lambda: closed.append(first.generation)
+        sock.close()
+
+        for i in range(20):
+            if not self.server.connection_count:
+                break
+            time.sleep(0.05)
+
+        second = self._echo()
+        self.assertTrue(first is second)
+        self.assertFalse('on_close' in second.__dict__)
+        self.assertEqual(closed, [0])
+
+    def tearDown(self):
+        PantsTestCase.tearDown(self)
+        self.server.close()
+
+class TestServerTCPOptions(PantsTestCase):
+    def setUp(self):
+        self.server = pants.Server(ConnectionClass=Echo)
+        self.server.listen(('127.0.0.1', 4040), defer_accept=1, fastopen=16)
+        PantsTestCase.setUp(self)
+
+    def test_server_echoes_with_tcp_options(self):
+        sock = socket.socket()
+        sock.settimeout(1.0)
+        sock.connect(('127.0.0.1', 4040))
+        request = repr(sock)
+        sock.send(request)
+        self.assertEqual(sock.recv(1024), request)
+        sock.close()
+
+    def test_stream_connects_with_fastopen(self):
+        received = []
+
+        class Client(pants.Stream):
+            def on_connect(self):
+                self.write("fast")
+
+            def on_read(self, data):
+                received.append(data)
+                self.close()
+
+        self._engine.callback(Client().connect, ('127.0.0.1', 4040), True)
+
+        for i in range(20):
+            if received:
+                break
+            time.sleep(0.05)
+
+        self.assertEqual(received, ["fast"])
+
+    def tearDown(self):
+        PantsTestCase.tearDown(self)
+        self.server.close()
@@ -0,0 +1,378 @@
+###############################################################################
+#
+# Copyright 2012 Pants Developers (see AUTHORS.txt)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+
+###############################################################################
+# Imports
+###############################################################################
+
+import socket
+import struct
+import time
+import unittest
+
+from pants.http import HTTPServer
+from pants.http.hpack import Decoder, Encoder, HPACKError, decode_integer, \
+    encode_integer, huffman_decode, huffman_encode
+from pants.http.http2 import PREFACE
+from pants.engine import Engine
+from pants.web import Application
+
+from pants.test._pants_util import *
+
+###############################################################################
+# HPACK
+###############################################################################
+
+class HPACKTest(unittest.TestCase):
+    def test_integers(self):
+        # RFC 7541, C.1
+        self.assertEqual(encode_integer(10, 5), '\x0a')
+        self.assertEqual(encode_integer(1337, 5), '\x1f\x9a\x0a')
+        self.assertEqual(encode_integer(42, 8), '\x2a')
+        self.assertEqual(decode_integer(bytearray('\x1f\x9a\x0a'), 0, 5), (1337, 3))
+
+    def test_huffman(self):
+        # RFC 7541, C.4.1
+        self.assertEqual(huffman_encode('www.example.com'),
+                         'f1e3c2e5f23a6ba0ab90f4ff'.decode('hex'))
+        data = ''.join(chr(i) for i in range(256)) * 2
+        self.assertEqual(huffman_decode(huffman_encode(data)), data)
+        self.assertRaises(HPACKError, huffman_decode, '\x00')
+
+    def test_decode_requests(self):
+        # RFC 7541, C.4
+        decoder = Decoder()
+        self.assertEqual(decoder.decode(
+            '828684418cf1e3c2e5f23a6ba0ab90f4ff'.decode('hex')),
+            [(':method', 'GET'), (':scheme', 'http'), (':path', '/'),
+             (':authority', 'www.example.com')])
+        self.assertEqual(decoder.decode(
+            '828684be5886a8eb10649cbf'.decode('hex')),
+            [(':method', 'GET'), (':scheme', 'http'), (':path', '/'),
+             (':authority', 'www.example.com'),
+             ('cache-control', 'no-cache')])
+        self.assertEqual(decoder.decode(
+            '828785bf408825a849e95ba97d7f8925a849e95bb8e8b4bf'.decode('hex')),
+            [(':method', 'GET'), (':scheme', 'https'),
+             (':path', '/index.html'), (':authority', 'www.example.com'),
+             ('custom-key', 'custom-value')])
+
+    def test_round_trip(self):
+        encoder = Encoder()
+        decoder = Decoder()
+        blocks = [
+            [(':status', '200'), ('content-type', 'text/html'),
+             ('set-cookie', 'a=b'), ('x-long', 'z' * 5000)],
+            [(':status', '404'), ('content-type', 'text/html'),
+             ('set-cookie', 'a=b')],
+            ]
+        for headers in blocks * 3:
+            self.assertEqual(decoder.decode(encoder.encode(headers)), headers)
+
+        encoder.resize(0)
+        self.assertEqual(decoder.decode(encoder.encode(blocks[1])), blocks[1])
+
+###############################################################################
+# The Test Case Base
+###############################################################################
+
+class HTTP2TestCase(PantsTestCase):
+    def request_handler(self, request):
+        raise NotImplementedError
+
+    def setUp(self):
+        engine = Engine.instance()
+        self.server = HTTPServer(self.request_handler, engine=engine,
+                                 http2=True)
+        self.server.listen(('127.0.0.1', 4040))
+        PantsTestCase.setUp(self, engine)
+
+    def tearDown(self):
+        PantsTestCase.tearDown(self)
+        self.server.close()
+
+def frame(type, flags, stream_id, payload=''):
+    return struct.pack('!IBI', len(payload) << 8 | type, flags,
+                       stream_id) + payload
+
+class Client(object):
+    """
+    Just enough of an HTTP/2 client to talk to the test server.
+    """
+    def __init__(self, settings='', update_windows=True):
+        self.sock = socket.create_connection(('127.0.0.1', 4040))
+        self.sock.settimeout(1.0)
+        self.sock.sendall(PREFACE + frame(0x4, 0, 0, settings))
+        self.encoder = Encoder()
+        self.decoder = Decoder()
+        self.buffer = ''
+        self.headers = {}
+        self.bodies = {}
+        self.ended = []
+        self.order = []
+        self.update_windows = update_windows
+
+    def request(self, stream_id, path, method='GET', body=None,
+                priority=''):
+        """
+        Return the frames of a request.
+        """
+        headers = [(':method', method), (':path', path), (':scheme', 'http'),
+                   (':authority', 'example.com')]
+        if body is not None:
+            headers.append(('content-type',
+                            'application/x-www-form-urlencoded'))
+        block = self.encoder.encode(headers)
+        flags = 0x4
+        if priority:
+            flags |= 0x20
+        if body is None:
+            return frame(0x1, flags | 0x1, stream_id, priority + block)
+        return frame(0x1, flags, stream_id, priority + block) + \
+               frame(0x0, 0x1, stream_id, body)
+
+    def send(self, *frames):
+        self.sock.sendall(''.join(frames))
+
+    def read(self, streams):
+        """
+        Read frames until the given streams have ended.
+        """
+        while not set(streams) <= set(self.ended):
+            if len(self.buffer) >= 9:
+                type_length, flags, stream_id = struct.unpack('!IBI',
+                                                              self.buffer[:9])
+                length = type_length >> 8
+                if len(self.buffer) >= 9 + length:
+                    payload = self.buffer[9:9 + length]
+                    self.buffer = self.buffer[9 + length:]
+                    self.handle(type_length & 0xff, flags, stream_id, payload)
+                    continue
+
+            data = self.sock.recv(65536)
+            if not data:
+                break
+            self.buffer += data
+
+    def handle(self, type, flags, stream_id, payload):
+        if type == 0x1:
+            self.headers[stream_id] = dict(self.decoder.decode(payload))
+            self.bodies[stream_id] = ''
+        elif type == 0x0:
+            self.bodies[stream_id] += payload
+            self.order.append(stream_id)
+            if self.update_windows and payload:
+                increment = struct.pack('!I', len(payload))
+                self.send(frame(0x8, 0, 0, increment),
+                          frame(0x8, 0, stream_id, increment))
+        elif type == 0x3:
+            self.ended.append(stream_id)
+            return
+
+        if type in (0x0, 0x1) and flags & 0x1:
+            self.ended.append(stream_id)
+
+    def close(self):
+        self.sock.close()
+
+###############################################################################
+# The Tests
+###############################################################################
+
+class BasicTest(HTTP2TestCase):
+    def request_handler(self, request):
+        if request.path == '/chunked':
+            request.send_status(200)
+            request.send_headers({'Transfer-Encoding': 'chunked'})
+            request.send_chunk('Hello, ')
+            request.send_chunk('World!')
+            request.send_chunk('')
+            request.finish()
+        elif request.method == 'POST':
+            request.send_response('%s %s' % (request.body,
+                                             request.post.get('a')))
+        else:
+            request.send_response('%s %s %s' % (request.protocol,
+                request.host, request.path))
+
+    def test_get(self):
+        client = Client()
+        client.send(client.request(1, '/hello'))
+        client.read([1])
+        client.close()
+
+        self.assertEqual(client.headers[1][':status'], '200')
+        self.assertEqual(client.headers[1]['content-length'], '27')
+        self.assertEqual(client.bodies[1], 'HTTP/2.0 example.com /hello')
+
+    def test_concurrent_streams(self):
+        client = Client()
+        client.send(*[client.request(stream_id, '/%d' % stream_id)
+                      for stream_id in (1, 3, 5)])
+        client.read([1, 3, 5])
+        client.close()
+
+        for stream_id in (1, 3, 5):
+            self.assertEqual(client.bodies[stream_id],
+                             'HTTP/2.0 example.com /%d' % stream_id)
+
+    def test_request_body(self):
+        client = Client()
+        client.send(client.request(1, '/', 'POST', 'a=1&b=2'))
+        client.read([1])
+        client.close()
+
+        self.assertEqual(client.bodies[1], 'a=1&b=2 1')
+
+    def test_chunked_response(self):
+        client = Client()
+        client.send(client.request(1, '/chunked'))
+        client.read([1])
+        client.close()
+
+        self.assertFalse('transfer-encoding' in client.headers[1])
+        self.assertEqual(client.bodies[1], 'Hello, World!')
+
+    def test_http1(self):
+        sock = socket.create_connection(('127.0.0.1', 4040))
+        sock.settimeout(1.0)
+        sock.sendall('GET / HTTP/1.1\r\nHost: example.com\r\n'
+                     'Connection: close\r\n\r\n')
+        data = ''
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+        sock.close()
+
+        self.assertTrue(data.endswith('HTTP/1.1 example.com /'))
+
+class FlowControlTest(HTTP2TestCase):
+    def request_handler(self, request):
+        request.send_response('x' * 100000)
+
+    def test_window(self):
+        client = Client(update_windows=False)
+        client.send(client.request(1, '/'))
+        self.assertRaises(socket.timeout, client.read, [1])
+        self.assertEqual(len(client.bodies[1]), 65535)
+
+        increment = struct.pack('!I', 40000)
+        client.send(frame(0x8, 0, 0, increment), frame(0x8, 0, 1, increment))
+        client.read([1])
+        client.close()
+
+        self.assertEqual(len(client.bodies[1]), 100000)
+
+class PriorityTest(HTTP2TestCase):
+    def request_handler(self, request):
+        request.send_response('x' * 60000)
+
+    def test_dependency(self):
+        # Stream 5 depends on stream 3, so it's sent once 3 is done.
+        client = Client()
+        client.send(client.request(3, '/', priority=struct.pack('!IB', 0, 15)),
+                    client.request(5, '/', priority=struct.pack('!IB', 3, 15)))
+        client.read([3, 5])
+        client.close()
+
+        order = client.order
+        self.assertEqual(order.index(5), order.count(3))
+        self.assertEqual(len(client.bodies[5]), 60000)
+
+    def test_weights(self):
+        # Stream 3 has three times the weight of stream 5, so it gets about
+        # three times as much of the connection's window.
+        client = Client(struct.pack('!HI', 0x4, 1000000), False)
+        client.send(client.request(3, '/', priority=struct.pack('!IB', 0, 47)),
+                    client.request(5, '/', priority=struct.pack('!IB', 0, 15)))
+        self.assertRaises(socket.timeout, client.read, [3, 5])
+        client.close()
+
+        self.assertEqual(len(client.bodies[3]) + len(client.bodies[5]), 65535)
+        self.assertTrue(len(client.bodies[3]) > 2 * len(client.bodies[5]))
+
+class StreamErrorTest(HTTP2TestCase):
+    def request_handler(self, request):
+        request.send_response('ok')
+
+    def test_refused_stream(self):
+        self.server.http2_max_streams = 1
+
+        # The first stream stays open, waiting for its body.
+        client = Client()
+        client.send(client.request(1, '/', 'POST', '')[:-9],
+                    client.request(3, '/'))
+        client.read([3])
+        client.close()
+
+        self.assertFalse(3 in client.headers)
+
+    def test_invalid_header(self):
+        client = Client()
+        client.send(frame(0x1, 0x5, 1, client.encoder.encode([
+            (':method', 'GET'), (':path', '/'), (':scheme', 'http'),
+            ('connection', 'keep-alive')])), client.request(3, '/'))
+        client.read([1, 3])
+        client.close()
+
+        self.assertFalse(1 in client.headers)
+        self.assertEqual(client.bodies[3], 'ok')
+
+class LoadSheddingTest(HTTP2TestCase):
+    def setUp(self):
+        self.held = []
+        app = Application()
+
+        @app.route('/slow')
+        def slow(request):
+            request.auto_finish = False
+            self.held.append(request)
+
+        @app.route('/health', priority=10)
+        def health(request):
+            return 'healthy'
+
+        @app.route('/')
+        def index(request):
+            return 'index'
+
+        engine = Engine.instance()
+        self.server = HTTPServer(app, engine=engine, http2=True,
+                                 max_in_flight=1, retry_after=5)
+        self.server.listen(('127.0.0.1', 4040))
+        PantsTestCase.setUp(self, engine)
+
+    def test_shed_stream(self):
+        client = Client()
+        client.send(client.request(1, '/slow'))
+        for i in xrange(100):
+            if self.held:
+                break
+            time.sleep(0.01)
+
+        client.send(client.request(3, '/'), client.request(5, '/health'))
+        client.read([3, 5])
+        client.close()
+
+        self.assertEqual(client.headers[3][':status'], '503')
+        self.assertEqual(client.headers[3]['retry-after'], '5')
+        self.assertEqual(client.headers[5][':status'], '200')
+        self.assertEqual(client.bodies[5], 'healthy')
+        self.assertEqual(self.server.requests_shed, 1)
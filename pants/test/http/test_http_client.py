@@ -23,7 +23,7 @@
 import unittest
 import json
 
-from pants.http import HTTPClient
+from pants.http import HTTPClient, HTTPServer
 from pants.engine import Engine
 
 from pants.test._pants_util import *
@@ -64,11 +64,7 @@ class HTTPTestCase(unittest.TestCase):
         self.engine.stop()
 
     def tearDown(self):
-        if self.client._stream:
-            self.client._want_close = True
-            self.client._no_process = True
-            self.client._stream.close()
-            self.client._stream = None
+        self.client.close()
         del self.client
         del self.engine
 
@@ -363,3 +359,84 @@ class ForceURLEncodedTest(HTTPTestCase):
         self.client.post("http://httpbin.org/post",
                 headers={"Content-Type": "application/x-www-form-urlencoded"})
         self.start()
+
+
+class PoolTest(HTTPTestCase):
+    def setUp(self):
+        HTTPTestCase.setUp(self)
+        self.server = HTTPServer(self.request_handler, engine=self.engine)
+        self.server.listen(('127.0.0.1', 4040))
+
+        self.connections = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.bodies = []
+        self.expected = 1
+
+    def tearDown(self):
+        HTTPTestCase.tearDown(self)
+        self.server.close()
+
+    def request_handler(self, request):
+        if not request.connection in self.connections:
+            self.connections.append(request.connection)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        def finish():
+            self.in_flight -= 1
+            request.send_response(request.path)
+
+        self.engine.defer(0.05, finish)
+
+    def on_response(self, response):
+        self.bodies.append(response.content)
+        if len(self.bodies) == self.expected:
+            self.got_response = True
+            self.stop()
+
+    def test_concurrency(self):
+        self.client.max_connections_per_host = 2
+        self.expected = 6
+        for i in xrange(6):
+            self.client.get("http://127.0.0.1:4040/%d" % i)
+        self.start()
+
+        self.assertEqual(sorted(self.bodies), ['/%d' % i for i in xrange(6)])
+        self.assertEqual(self.max_in_flight, 2)
+        self.assertEqual(len(self.connections), 2)
+
+    def get_first(self, on_response):
+        with self.client.session(on_response=on_response) as ses:
+            ses.get("http://127.0.0.1:4040/a")
+
+    def get_second(self):
+        self.client.get("http://127.0.0.1:4040/b")
+
+    def test_reuse(self):
+        self.get_first(lambda response: self.get_second())
+        self.start()
+
+        self.assertEqual(self.bodies, ['/b'])
+        self.assertEqual(len(self.connections), 1)
+
+    def test_idle_timeout(self):
+        self.client.idle_timeout = 0.1
+        self.get_first(lambda response: self.engine.defer(0.3,
+                                                          self.get_second))
+        self.start()
+
+        self.assertEqual(self.bodies, ['/b'])
+        self.assertEqual(len(self.connections), 2)
+
+    def test_retry_closed(self):
+        # The server closes the idle connection just as it's reused.
+        def on_response(response):
+            self.connections[0].close(False)
+            self.get_second()
+
+        self.get_first(on_response)
+        self.start()
+
+        self.assertEqual(self.bodies, ['/b'])
+        self.assertEqual(len(self.connections), 2)
@@ -22,13 +22,19 @@
 ###############################################################################
 
 import json
+import socket
+import time
+from StringIO import StringIO
+import zlib
 try:
     import requests
 except ImportError:
     requests = None
 
-from pants.http import HTTPServer
+from pants.http import AccessLog, HTTPServer, Histogram, WebSocket
 from pants.engine import Engine
+from pants.http.utils import encode_multipart
+from pants.web import Application
 
 from pants.test._pants_util import *
 
@@ -50,6 +56,32 @@ class HTTPTestCase(PantsTestCase):
         PantsTestCase.tearDown(self)
         self.server.close()
 
+def raw_response(data):
+    """
+    Send raw request data to the test server, and return everything that is
+    received before the server closes the connection.
+    """
+    sock = socket.create_connection(('127.0.0.1', 4040))
+    sock.settimeout(1.0)
+    sock.sendall(data)
+
+    data = ''
+    while True:
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    sock.close()
+    return data
+
+def raw_request(data):
+    """
+    Send raw request data to the test server, and return the bodies of the
+    responses that are received before the server closes the connection.
+    """
+    return [part.split('\r\n\r\n', 1)[1]
+            for part in raw_response(data).split('HTTP/1.1 ')[1:]]
+
 ###############################################################################
 # The Cases
 ###############################################################################
@@ -124,3 +156,531 @@ class ResponseBody(HTTPTestCase):
         response = requests.post("http://127.0.0.1:4040/", json.dumps(range(50)), timeout=0.5)
         data = json.loads(response.text)
         self.assertListEqual(data, range(49, -1, -1))
+
+@unittest.skipIf(requests is None, "requests library not installed")
+class SendFileCacheTest(HTTPTestCase):
+    def request_handler(self, request):
+        request.send_file(__file__)
+
+    def setUp(self):
+        engine = Engine.instance()
+        self.server = HTTPServer(self.request_handler, engine=engine,
+                                 file_cache_size=8)
+        self.server.listen(('127.0.0.1', 4040))
+        PantsTestCase.setUp(self, engine)
+
+    def test_send_file_cached(self):
+        with open(__file__, 'rb') as f:
+            expected = f.read()
+
+        for i in xrange(3):
+            response = requests.get("http://127.0.0.1:4040/", timeout=0.5)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, expected)
+
+        self.assertEqual(self.server.file_cache.misses, 1)
+        self.assertEqual(self.server.file_cache.hits, 2)
+
+class SendFileRangeTest(HTTPTestCase):
+    def request_handler(self, request):
+        request.send_file(__file__)
+
+    def get(self, ranges):
+        response = raw_response("GET / HTTP/1.1\r\nRange: bytes=%s\r\n"
+                                "Connection: close\r\n\r\n" % ranges)
+        head, _, body = response.partition('\r\n\r\n')
+        lines = head.split('\r\n')
+        headers = dict(line.split(': ', 1) for line in lines[1:])
+        return lines[0], headers, body
+
+    def setUp(self):
+        HTTPTestCase.setUp(self)
+        with open(__file__, 'rb') as f:
+            self.data = f.read()
+
+    def test_single_range(self):
+        status, headers, body = self.get('10-19')
+        self.assertEqual(status, 'HTTP/1.1 206 Partial Content')
+        self.assertEqual(headers['Content-Range'],
+                         'bytes 10-19/%d' % len(self.data))
+        self.assertEqual(body, self.data[10:20])
+
+    def test_suffix_range(self):
+        status, headers, body = self.get('-%d' % (len(self.data) + 100))
+        self.assertEqual(status, 'HTTP/1.1 206 Partial Content')
+        self.assertEqual(body, self.data)
+
+    def test_coalesced_ranges(self):
+        status, headers, body = self.get('20-29, 0-9,10-19,25-39')
+        self.assertEqual(headers['Content-Range'],
+                         'bytes 0-39/%d' % len(self.data))
+        self.assertEqual(body, self.data[:40])
+
+    def test_multiple_ranges(self):
+        status, headers, body = self.get('0-4,100-109,-5')
+        self.assertEqual(status, 'HTTP/1.1 206 Partial Content')
+        self.assertTrue(headers['Content-Type'].startswith(
+            'multipart/byteranges; boundary='))
+        self.assertEqual(int(headers['Content-Length']), len(body))
+
+        boundary = headers['Content-Type'].split('boundary=')[1]
+        parts = body.split('\r\n--%s' % boundary)
+        self.assertEqual(parts[0], '')
+        self.assertEqual(parts[-1], '--\r\n')
+
+        length = len(self.data)
+        expected = [(0, 4), (100, 109), (length - 5, length - 1)]
+        for part, (start, end) in zip(parts[1:-1], expected):
+            head, _, data = part.partition('\r\n\r\n')
+            self.assertTrue('Content-Range: bytes %d-%d/%d' % (start, end,
+                                                               length) in head)
+            self.assertEqual(data, self.data[start:end + 1])
+
+    def test_unsatisfiable(self):
+        status, headers, body = self.get('%d-' % len(self.data))
+        self.assertEqual(status, 'HTTP/1.1 416 Requested Range Not Satisfiable')
+
+class PipelineTest(HTTPTestCase):
+    def request_handler(self, request):
+        # Answer the first request last, to make sure the responses are
+        # still written in order.
+        def respond():
+            request.send_response(request.path)
+
+        if request.path == '/first':
+            self._engine.defer(0.1, respond)
+        else:
+            respond()
+
+    def test_pipelined_responses_in_order(self):
+        bodies = raw_request("GET /first HTTP/1.1\r\n\r\n"
+                             "GET /second HTTP/1.1\r\n\r\n"
+                             "GET /third HTTP/1.1\r\nConnection: close\r\n\r\n")
+        self.assertEqual(bodies, ['/first', '/second', '/third'])
+
+class RequestVariablesTest(HTTPTestCase):
+    def request_handler(self, request):
+        request.send_response(json.dumps([request.get, request.post,
+                                          request.hostname,
+                                          request.remote_ip]))
+
+    def test_request_variables(self):
+        body = 'c=3&c=4'
+        bodies = raw_request("POST /?a=1&b=2&a=3 HTTP/1.1\r\n"
+                             "Host: Example.com:4040\r\n"
+                             "Content-Type: application/x-www-form-urlencoded\r\n"
+                             "Content-Length: %d\r\n"
+                             "Connection: close\r\n\r\n%s" % (len(body), body))
+        self.assertEqual(json.loads(bodies[0]),
+                         [{'a': ['1', '3'], 'b': '2'}, {'c': ['3', '4']},
+                          'example.com', '127.0.0.1'])
+
+class TimeoutTest(HTTPTestCase):
+    def request_handler(self, request):
+        request.send_response(request.path)
+
+    def setUp(self):
+        engine = Engine.instance()
+        self.server = HTTPServer(self.request_handler, engine=engine,
+                                 keep_alive_timeout=1, header_timeout=1,
+                                 max_requests_per_connection=2)
+        self.server.listen(('127.0.0.1', 4040))
+        PantsTestCase.setUp(self, engine)
+
+    def wait_for_close(self, data):
+        sock = socket.create_connection(('127.0.0.1', 4040))
+        sock.settimeout(5.0)
+        sock.sendall(data)
+
+        data = ''
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+        sock.close()
+        return data
+
+    def test_keep_alive_timeout(self):
+        data = self.wait_for_close("GET /idle HTTP/1.1\r\n\r\n")
+        self.assertTrue(data.startswith('HTTP/1.1 200 OK'))
+        self.assertTrue(data.endswith('/idle'))
+
+    def test_header_timeout(self):
+        data = self.wait_for_close("GET / HTTP/1.1\r\nHost: 127.0.0.1\r\n")
+        self.assertTrue(data.startswith('HTTP/1.1 408 Request Timeout'))
+
+    def test_max_requests_per_connection(self):
+        data = self.wait_for_close("GET /first HTTP/1.1\r\n\r\n"
+                                   "GET /second HTTP/1.1\r\n\r\n"
+                                   "GET /third HTTP/1.1\r\n\r\n")
+        responses = data.split('HTTP/1.1 ')[1:]
+        self.assertEqual(len(responses), 2)
+        self.assertTrue(responses[1].endswith('/second'))
+        self.assertTrue('\r\nConnection: close\r\n' in responses[1])
+
+CHUNKED_REQUEST = ("POST / HTTP/1.1\r\n"
+                   "Transfer-Encoding: chunked\r\n\r\n"
+                   "5\r\nHello\r\n"
+                   "8;ext=1\r\n, World!\r\n"
+                   "0\r\nX-Trailer: 1\r\n\r\n"
+                   "GET / HTTP/1.1\r\nConnection: close\r\n\r\n")
+
+class ChunkedBodyTest(HTTPTestCase):
+    def request_handler(self, request):
+        request.send_response(request.body)
+
+    def test_chunked_body(self):
+        bodies = raw_request(CHUNKED_REQUEST)
+        self.assertEqual(bodies, ['Hello, World!', ''])
+
+    def test_unsupported_coding(self):
+        # The body can't be decoded, so it mustn't be passed on as it is.
+        response = raw_response("POST / HTTP/1.1\r\n"
+                                "Transfer-Encoding: gzip, chunked\r\n\r\n"
+                                "5\r\nHello\r\n0\r\n\r\n")
+        self.assertTrue(response.startswith('HTTP/1.1 501 '))
+
+class MultipartBodyTest(HTTPTestCase):
+    def request_handler(self, request):
+        upload = request.files['upload'][0]
+        request.send_response('%s %d %d' % (request.post['field'][0],
+            len(upload['body']), len(request.body_file.read())))
+
+    def setUp(self):
+        engine = Engine.instance()
+        self.server = HTTPServer(self.request_handler, engine=engine,
+                                 max_request=2000, spool_size=1024)
+        self.server.listen(('127.0.0.1', 4040))
+        PantsTestCase.setUp(self, engine)
+
+    def post(self, size):
+        boundary, out = encode_multipart({'field': 'value'},
+                                         {'upload': ('a.bin', 'x' * size)})
+        body = ''.join(out)
+        return body, raw_response('POST / HTTP/1.1\r\nConnection: close\r\n'
+            'Content-Type: multipart/form-data; boundary=%s\r\n'
+            'Content-Length: %d\r\n\r\n%s' % (boundary, len(body), body))
+
+    def test_parts_limited(self):
+        # The body is larger than max_request, but each of its parts isn't.
+        body, response = self.post(1800)
+        self.assertTrue(len(body) > 2000)
+        self.assertTrue(response.endswith('value 1800 %d' % len(body)))
+
+        body, response = self.post(2500)
+        self.assertTrue(response.startswith('HTTP/1.1 413 '))
+
+class StreamBodyTest(HTTPTestCase):
+    def request_handler(self, request):
+        if request.body is not None:
+            request.send_response('no body')
+            return
+
+        chunks = []
+        def on_body_chunk(data):
+            chunks.append(data)
+            # Exercise backpressure.
+            request.pause_body()
+            self._engine.callback(request.resume_body)
+
+        def on_body_end():
+            request.send_response(''.join(chunks))
+
+        request.on_body_chunk = on_body_chunk
+        request.on_body_end = on_body_end
+
+    def setUp(self):
+        engine = Engine.instance()
+        self.server = HTTPServer(self.request_handler, engine=engine,
+                                 stream_body=True)
+        self.server.listen(('127.0.0.1', 4040))
+        PantsTestCase.setUp(self, engine)
+
+    def test_stream_chunked_body(self):
+        bodies = raw_request(CHUNKED_REQUEST)
+        self.assertEqual(bodies, ['Hello, World!', 'no body'])
+
+    def test_stream_body(self):
+        bodies = raw_request("POST / HTTP/1.1\r\nContent-Length: 13\r\n\r\n"
+                             "Hello, World!"
+                             "GET / HTTP/1.1\r\nConnection: close\r\n\r\n")
+        self.assertEqual(bodies, ['Hello, World!', 'no body'])
+
+class CompressionTest(HTTPTestCase):
+    body = json.dumps(range(1000))
+
+    def request_handler(self, request):
+        if request.path == '/chunked':
+            request.send_status(200)
+            request.send_headers({'Content-Type': 'text/plain',
+                                  'Transfer-Encoding': 'chunked'})
+            request.send_chunk(self.body[:1000])
+            request.send_chunk(self.body[1000:])
+            request.send_chunk('')
+            request.finish()
+        else:
+            request.send_response(self.body, content_type='application/json')
+
+    def setUp(self):
+        engine = Engine.instance()
+        self.server = HTTPServer(self.request_handler, engine=engine,
+                                 compression=True)
+        self.server.listen(('127.0.0.1', 4040))
+        PantsTestCase.setUp(self, engine)
+
+    def get(self, path, accept=None):
+        request = 'GET %s HTTP/1.1\r\nConnection: close\r\n' % path
+        if accept:
+            request += 'Accept-Encoding: %s\r\n' % accept
+        head, _, body = raw_response(request + '\r\n').partition('\r\n\r\n')
+        headers = dict(line.split(': ', 1) for line in head.split('\r\n')[1:])
+        return headers, body
+
+    def test_gzip(self):
+        headers, body = self.get('/', 'gzip, deflate')
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(int(headers['Content-Length']), len(body))
+        self.assertEqual(zlib.decompress(body, 16 + zlib.MAX_WBITS), self.body)
+
+    def test_not_accepted(self):
+        headers, body = self.get('/', 'identity')
+        self.assertFalse('Content-Encoding' in headers)
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(body, self.body)
+
+    def test_chunked(self):
+        headers, body = self.get('/chunked', 'deflate')
+        self.assertEqual(headers['Content-Encoding'], 'deflate')
+
+        data = ''
+        while True:
+            size, _, body = body.partition('\r\n')
+            size = int(size, 16)
+            if not size:
+                break
+            data += body[:size]
+            body = body[size + 2:]
+
+        self.assertEqual(zlib.decompress(data), self.body)
+
+class LoadSheddingTest(HTTPTestCase):
+    def setUp(self):
+        self.held = []
+        app = Application()
+
+        @app.route('/slow')
+        def slow(request):
+            request.auto_finish = False
+            self.held.append(request)
+
+        @app.route('/block')
+        def block(request):
+            time.sleep(0.3)
+            return 'blocked'
+
+        @app.route('/ws')
+        def ws(request):
+            WebSocket(request)
+
+        @app.route('/health', priority=10)
+        def health(request):
+            return 'healthy'
+
+        @app.route('/')
+        def index(request):
+            return 'index'
+
+        engine = Engine.instance()
+        self.server = HTTPServer(app, engine=engine, max_in_flight=1,
+                                 max_loop_lag=0.05, retry_after=5)
+        self.server.listen(('127.0.0.1', 4040))
+        PantsTestCase.setUp(self, engine)
+
+    def get(self, path):
+        return raw_response('GET %s HTTP/1.1\r\nConnection: close\r\n\r\n'
+                            % path)
+
+    def test_in_flight(self):
+        sock = socket.create_connection(('127.0.0.1', 4040))
+        sock.sendall('GET /slow HTTP/1.1\r\n\r\n')
+        for i in xrange(100):
+            if self.held:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.server.in_flight, 1)
+
+        response = self.get('/')
+        self.assertTrue(response.startswith('HTTP/1.1 503 '))
+        self.assertTrue('\r\nRetry-After: 5\r\n' in response)
+        self.assertEqual(self.server.requests_shed, 1)
+
+        # The health check has a higher priority, so it isn't shed yet.
+        self.assertTrue(self.get('/health').endswith('healthy'))
+
+        sock.close()
+        for i in xrange(100):
+            if not self.server.in_flight:
+                break
+            time.sleep(0.01)
+        self.assertTrue(self.get('/').endswith('index'))
+        self.assertEqual(self.server.requests_shed, 1)
+
+    def test_websocket(self):
+        # WebSockets aren't requests in flight, once they've connected.
+        for i in xrange(2):
+            sock = socket.create_connection(('127.0.0.1', 4040))
+            sock.settimeout(1.0)
+            sock.sendall('GET /ws HTTP/1.1\r\nConnection: Upgrade\r\n'
+                         'Upgrade: websocket\r\nSec-WebSocket-Version: 13\r\n'
+                         'Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n\r\n')
+            self.assertTrue(sock.recv(4096).startswith('HTTP/1.1 101 '))
+            sock.close()
+
+        for i in xrange(100):
+            if not self.server.in_flight:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.server.in_flight, 0)
+        self.assertTrue(self.get('/').endswith('index'))
+
+    def test_loop_lag(self):
+        # Let the server start measuring the engine's loop lag.
+        time.sleep(0.15)
+
+        self.assertTrue(self.get('/block').endswith('blocked'))
+        self.assertTrue(self.get('/').startswith('HTTP/1.1 503 '))
+        self.assertTrue(self.get('/health').endswith('healthy'))
+
+        time.sleep(0.5)
+        self.assertTrue(self.get('/').endswith('index'))
+
+class RemoteIPTest(HTTPTestCase):
+    def request_handler(self, request):
+        # Looked at once the client has gone away.
+        request.connection.engine.defer(0.1, self.late, request)
+
+    def late(self, request):
+        self.remote_ip = request.remote_ip
+
+    def test_remote_ip_after_close(self):
+        self.remote_ip = None
+        sock = socket.socket()
+        sock.connect(('127.0.0.1', 4040))
+        sock.sendall('GET / HTTP/1.1\r\n\r\n')
+        sock.close()
+
+        for i in xrange(100):
+            if self.remote_ip is not None:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.remote_ip, '127.0.0.1')
+
+class AccessLogTest(HTTPTestCase):
+    def request_handler(self, request):
+        if request.path == '/missing':
+            request.send_response('Not Found', 404)
+        else:
+            request.send_response('x' * 100)
+
+    def setUp(self):
+        engine = Engine.instance()
+        self.output = StringIO()
+        self.access_log = AccessLog(self.output, flush_interval=0.05,
+                                    engine=engine)
+        self.server = HTTPServer(self.request_handler, engine=engine,
+                                 access_log=self.access_log)
+        self.server.listen(('127.0.0.1', 4040))
+        PantsTestCase.setUp(self, engine)
+
+    def test_access_log(self):
+        raw_response('GET /?a=1 HTTP/1.1\r\n\r\n'
+                     'GET /missing HTTP/1.1\r\nConnection: close\r\n\r\n')
+
+        for i in xrange(100):
+            if self.output.getvalue().count('\n') == 2:
+                break
+            time.sleep(0.01)
+        lines = [json.loads(line) for line in
+                 self.output.getvalue().splitlines()]
+
+        self.assertEqual([line['url'] for line in lines], ['/?a=1', '/missing'])
+        self.assertEqual([line['status'] for line in lines], [200, 404])
+        self.assertEqual(lines[0]['remote_ip'], '127.0.0.1')
+        self.assertTrue(lines[0]['bytes'] > 100)
+        self.assertTrue(0 <= lines[0]['first_byte'] <= lines[0]['duration'])
+
+        log = self.access_log
+        self.assertEqual(log.requests, 2)
+        self.assertEqual(log.bytes_sent, sum(line['bytes'] for line in lines))
+        self.assertEqual(log.by_route[None].count, 2)
+        self.assertEqual(log.by_status[404].count, 1)
+        self.assertEqual(log.first_byte.count, 2)
+        self.assertEqual(json.loads(json.dumps(log.stats()))['requests'], 2)
+
+    def test_sampling(self):
+        self.access_log.sample = 0
+        raw_response('GET / HTTP/1.1\r\n\r\n'
+                     'GET /missing HTTP/1.1\r\nConnection: close\r\n\r\n')
+        time.sleep(0.2)
+
+        self.assertEqual(self.output.getvalue(), '')
+        self.assertEqual(self.access_log.requests, 2)
+
+class HistogramTest(unittest.TestCase):
+    def test_histogram(self):
+        histogram = Histogram((1, 2, 4))
+        for value in (0.5, 1, 1.5, 3, 3, 10):
+            histogram.add(value)
+
+        self.assertEqual(histogram.counts, [2, 1, 2, 1])
+        self.assertEqual(histogram.mean, 19.0 / 6)
+        self.assertEqual(histogram.quantile(0.5), 2)
+        self.assertEqual(histogram.quantile(0.8), 4)
+        self.assertEqual(histogram.quantile(1), None)
+
+class RawCookieTest(HTTPTestCase):
+    def request_handler(self, request):
+        if request.path == '/set':
+            request.set_secure_cookie('user', {'id': 1})
+            request.set_secure_cookie('name', u'caf\xe9')
+            request.cookies_out['plain'] = 'a "quoted"; value'
+            request.send_response('set')
+        else:
+            request.cookies_out
+            request.send_response(json.dumps([
+                request.get_secure_cookie('user'),
+                request.get_secure_cookie('name'),
+                request.cookies['plain'].value if 'plain' in request.cookies
+                else None]))
+
+    def get(self, path, cookies=None):
+        data = 'GET %s HTTP/1.1\r\nConnection: close\r\n' % path
+        if cookies:
+            data += 'Cookie: %s\r\n' % '; '.join(cookies)
+        head, _, body = raw_response(data + '\r\n').partition('\r\n\r\n')
+        cookies = [line[12:].split('; ')[0] for line in head.split('\r\n')
+                   if line.startswith('Set-Cookie: ')]
+        return cookies, body
+
+    def test_round_trip(self):
+        cookies, body = self.get('/set')
+        self.assertEqual(len(cookies), 3)
+
+        for i in xrange(2):
+            self.assertEqual(json.loads(self.get('/', cookies)[1]),
+                             [{'id': 1}, u'caf\xe9', 'a "quoted"; value'])
+        self.assertEqual(len(self.server._cookie_cache), 2)
+
+    def test_tampered(self):
+        cookies, body = self.get('/set')
+        # Change the first character of each signature.
+        for i, cookie in enumerate(cookies):
+            if '|' in cookie:
+                pos = cookie.rindex('|') + 1
+                cookies[i] = '%s%s%s' % (cookie[:pos],
+                    '1' if cookie[pos] == '0' else '0', cookie[pos + 1:])
+        self.assertEqual(json.loads(self.get('/', cookies)[1])[:2],
+                         [None, None])
+        self.assertEqual(len(self.server._cookie_cache), 0)
@@ -20,6 +20,7 @@
 # Imports
 ###############################################################################
 
+import Cookie
 import os
 import unittest
 
@@ -42,6 +43,188 @@ class HTTPHeadersTest(unittest.TestCase):
         self.assertFalse('Content-Type' in data)
         self.assertTrue(data.get('Content-Type') is None)
 
+class HeaderBlockTest(unittest.TestCase):
+    def test_block(self):
+        block = HeaderBlock({"x-frame-options": "DENY", "Vary": ["A", "B"]})
+        self.assertEqual(sorted(block.data.split(CRLF)),
+                         ["", "Vary: A", "Vary: B", "X-Frame-Options: DENY"])
+        self.assertFalse(block.body_headers)
+
+    def test_conflicts(self):
+        block = HeaderBlock({"Cache-Control": "no-cache"})
+        self.assertFalse(block.conflicts({"Content-Length": 5}))
+        self.assertTrue(block.conflicts({"cache-control": "public"}))
+        self.assertTrue(block.conflicts([("Cache-Control", "public")]))
+        self.assertTrue(block.conflicts(HTTPHeaders({"CACHE-CONTROL": "x"})))
+
+        block = HeaderBlock({"Content-Type": "text/plain"})
+        self.assertTrue(block.conflicts({}))
+
+    def test_copy(self):
+        copy = HeaderBlock({"A": "1"}).copy()
+        self.assertFalse(isinstance(copy, HeaderBlock))
+        copy["B"] = "2"
+        self.assertEqual(len(copy), 2)
+
+class RequestParserTest(unittest.TestCase):
+    request = CRLF.join([
+        "POST /upload?x=1 HTTP/1.1",
+        "Host: example.com",
+        "Content-Length: 5",
+        "Set-Cookie: a=1",
+        "Set-Cookie: b=2",
+        "X-Long: one",
+        "  two",
+        "", "hello"])
+
+    def test_parse_whole(self):
+        parser = RequestParser()
+        rest = parser.feed(self.request)
+        self.assertEqual(rest, "hello")
+        self.assertEqual(parser.method, "POST")
+        self.assertEqual(parser.url, "/upload?x=1")
+        self.assertEqual(parser.protocol, "HTTP/1.1")
+        self.assertEqual(parser.headers["Host"], "example.com")
+        self.assertEqual(parser.headers["Content-Length"], "5")
+        self.assertEqual(parser.headers.get_int("Content-Length"), 5)
+        self.assertEqual(parser.headers["Set-Cookie"], ["a=1", "b=2"])
+        self.assertEqual(parser.headers["X-Long"], "one two")
+
+    def test_parse_byte_by_byte(self):
+        parser = RequestParser()
+        for i, char in enumerate(self.request):
+            rest = parser.feed(char)
+            if rest is not None:
+                break
+
+        self.assertEqual(rest, "")
+        self.assertEqual(self.request[i + 1:], "hello")
+        self.assertEqual(parser.headers.get_int("Content-Length"), 5)
+
+    def test_reset(self):
+        parser = RequestParser()
+        parser.feed(self.request)
+        parser.reset()
+        self.assertIsNone(parser.feed("GET / HTTP/1.1\r\n"))
+        self.assertEqual(parser.feed("\r\n"), "")
+        self.assertEqual(parser.method, "GET")
+        self.assertEqual(len(parser.headers), 0)
+
+    def test_header_values(self):
+        parser = RequestParser()
+        parser.feed(CRLF.join(["GET / HTTP/1.1",
+                               "Accept: text/html",
+                               "Accept: */*",
+                               "X-Number: 42",
+                               "Content-Length: 0",
+                               "Content-Length: 0", "", ""]))
+        headers = parser.headers
+        self.assertEqual(headers["Accept"], "text/html, */*")
+        self.assertEqual(headers["X-Number"], "42")
+        self.assertEqual(headers.get_int("X-Number"), 42)
+        self.assertEqual(headers.get_int("Accept"), None)
+        self.assertEqual(headers.get_int("Missing", 7), 7)
+
+        for lengths in (["Content-Length: x"],
+                        ["Content-Length: 1", "Content-Length: 2"]):
+            parser = RequestParser()
+            with self.assertRaises(BadRequest):
+                parser.feed(CRLF.join(["GET / HTTP/1.1"] + lengths + ["", ""]))
+
+    def test_limits(self):
+        parser = RequestParser(max_line=16)
+        with self.assertRaises(BadRequest) as cm:
+            parser.feed("GET /" + "x" * 32)
+        self.assertTrue(cm.exception.code.startswith("414"))
+
+        parser = RequestParser(max_headers=2)
+        with self.assertRaises(BadRequest) as cm:
+            parser.feed("GET / HTTP/1.1\r\nA: 1\r\nB: 2\r\nC: 3\r\n")
+        self.assertTrue(cm.exception.code.startswith("431"))
+
+        parser = RequestParser(max_size=32)
+        with self.assertRaises(BadRequest) as cm:
+            parser.feed("GET / HTTP/1.1\r\nA: 1\r\nB: 2\r\nC: 3\r\n")
+        self.assertTrue(cm.exception.code.startswith("431"))
+
+    def test_bad_request(self):
+        with self.assertRaises(BadRequest):
+            RequestParser().feed("GET /\r\n")
+
+        with self.assertRaises(BadRequest) as cm:
+            RequestParser().feed("GET / FOO/1.0\r\n")
+        self.assertTrue(cm.exception.code.startswith("505"))
+
+        with self.assertRaises(BadRequest):
+            RequestParser().feed("GET / HTTP/1.1\r\nNo colon\r\n")
+
+        # A folded Content-Length could hide a body as the next request.
+        with self.assertRaises(BadRequest):
+            RequestParser().feed("GET / HTTP/1.1\r\nContent-Length: 10\r\n"
+                                 " 5\r\n\r\n")
+
+class FakeRequest(object):
+    def __init__(self):
+        self.post = {}
+        self.files = {}
+
+class MultipartParserTest(unittest.TestCase):
+    def setUp(self):
+        self.upload = "".join(chr(i % 256) for i in xrange(5000))
+        boundary, out = encode_multipart({"field": "value"},
+                                         {"upload": ("test.bin", self.upload)})
+        self.boundary = boundary
+        self.body = "".join(out)
+
+    def check(self, request):
+        self.assertEqual(request.post, {"field": ["value"]})
+        upload = request.files["upload"][0]
+        self.assertEqual(upload["filename"], "test.bin")
+        self.assertEqual(upload["file"].read(), self.upload)
+        self.assertEqual(upload["body"], self.upload)
+        self.assertTrue("body" in upload)
+        self.assertEqual(upload.get("body"), self.upload)
+
+    def test_parse_whole(self):
+        request = FakeRequest()
+        parse_multipart(request, self.boundary, self.body)
+        self.check(request)
+
+    def test_parse_in_pieces(self):
+        for size in (1, 7, 100):
+            request = FakeRequest()
+            parser = MultipartParser(request, self.boundary)
+            for i in xrange(0, len(self.body), size):
+                parser.feed(self.body[i:i + size])
+            parser.close()
+            self.check(request)
+
+    def test_spooling(self):
+        request = FakeRequest()
+        parser = MultipartParser(request, self.boundary, spool_size=1024)
+        parser.feed(self.body)
+        parser.close()
+        self.assertTrue(request.files["upload"][0]["file"]._rolled)
+        self.check(request)
+
+    def test_max_part(self):
+        parser = MultipartParser(FakeRequest(), self.boundary, max_part=4096)
+        with self.assertRaises(BadRequest) as cm:
+            parser.feed(self.body)
+        self.assertTrue(cm.exception.code.startswith("413"))
+
+        request = FakeRequest()
+        parser = MultipartParser(request, self.boundary, max_part=5000)
+        parser.feed(self.body)
+        parser.close()
+        self.check(request)
+
+    def test_incomplete(self):
+        parser = MultipartParser(FakeRequest(), self.boundary)
+        parser.feed(self.body[:-10])
+        with self.assertRaises(BadRequest):
+            parser.close()
+
 class FunctionTests(unittest.TestCase):
     def test_get_filename(self):
         with open(__file__) as f:
@@ -54,6 +237,42 @@ class FunctionTests(unittest.TestCase):
             "7d767d29a065e3445184b6d8369bcea03a50fdd8"
         )
 
+    def test_compare_digest(self):
+        self.assertTrue(compare_digest("abc", "abc"))
+        self.assertFalse(compare_digest("abc", "abd"))
+        self.assertFalse(compare_digest("abc", "ab"))
+
+    def test_parse_cookies(self):
+        self.assertEqual(parse_cookies('a=1; b="x\\054 \\"y\\""; $Path=/; c'),
+                         {'a': '1', 'b': 'x, "y"'})
+        self.assertEqual(parse_cookies(['a=1', 'b=2; a=3']),
+                         {'a': '3', 'b': '2'})
+
+    def test_cookie_header(self):
+        cookies = Cookie.SimpleCookie()
+        cookies['a'] = 'one; two'
+        cookies['a']['path'] = '/'
+        cookies['a']['max-age'] = 60
+        cookies['a']['httponly'] = True
+        self.assertEqual(cookie_header(cookies['a']), cookies['a'].output())
+
+    def test_http_date(self):
+        self.assertEqual(http_date(784111777.5),
+                         "Sun, 06 Nov 1994 08:49:37 GMT")
+        self.assertEqual(http_date(784111777.9),
+                         "Sun, 06 Nov 1994 08:49:37 GMT")
+        self.assertEqual(http_date(784111778),
+                         "Sun, 06 Nov 1994 08:49:38 GMT")
+
+    def test_negotiate_encoding(self):
+        self.assertEqual(negotiate_encoding("gzip, deflate"), "gzip")
+        self.assertEqual(negotiate_encoding("deflate"), "deflate")
+        self.assertEqual(negotiate_encoding("gzip;q=0.5, deflate"), "deflate")
+        self.assertEqual(negotiate_encoding("*;q=0.1"), "gzip")
+        self.assertEqual(negotiate_encoding("gzip;q=0, *"), "deflate")
+        self.assertEqual(negotiate_encoding("identity"), None)
+        self.assertEqual(negotiate_encoding(""), None)
+
     def test_content_type(self):
         self.assertEqual(content_type("test.txt"), "text/plain")
 
@@ -76,3 +295,6 @@ Set-Cookie: pie=blah""".splitlines()))
             read_headers(CRLF.join("""Test: fish
 
 Cake: free""".splitlines()))
+
+        with self.assertRaises(BadRequest):
+            read_headers("Content-Length: 10\r\n 5")
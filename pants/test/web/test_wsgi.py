@@ -29,8 +29,10 @@ except ImportError:
     requests = None
 
 import pprint
+import socket
 
 from pants.http import HTTPServer
+from pants.http.utils import encode_multipart
 from pants.web import WSGIConnector
 
 from pants.test._pants_util import *
@@ -54,6 +56,42 @@ class WSGITestCase(PantsTestCase):
         PantsTestCase.tearDown(self)
         self.server.close()
 
+class WSGIMultipartTest(PantsTestCase):
+    def application(self, env, start_response):
+        body = env['wsgi.input'].read()
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return ['%s %d' % (env['CONTENT_LENGTH'], len(body))]
+
+    def setUp(self):
+        engine = Engine.instance()
+        self.server = HTTPServer(WSGIConnector(self.application), engine=engine)
+        self.server.listen(('127.0.0.1', 4040))
+        PantsTestCase.setUp(self, engine)
+
+    def tearDown(self):
+        PantsTestCase.tearDown(self)
+        self.server.close()
+
+    def test_multipart_input(self):
+        boundary, out = encode_multipart({'field': 'value'},
+                                         {'upload': ('a.txt', 'x' * 50)})
+        body = ''.join(out)
+
+        sock = socket.create_connection(('127.0.0.1', 4040))
+        sock.settimeout(1.0)
+        sock.sendall('POST / HTTP/1.1\r\nConnection: close\r\n'
+            'Content-Type: multipart/form-data; boundary=%s\r\n'
+            'Content-Length: %d\r\n\r\n%s' % (boundary, len(body), body))
+        data = ''
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+        sock.close()
+
+        self.assertTrue('\r\n%d %d\r\n' % (len(body), len(body)) in data)
+
 class WSGIBodyTest(WSGITestCase):
     body = None
     headers = None
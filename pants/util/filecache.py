@@ -0,0 +1,146 @@
+###############################################################################
+#
+# Copyright 2011-2012 Pants Developers (see AUTHORS.txt)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+"""
+A cache of open files, so that frequently sent files don't have to be
+looked up and opened again for every request.
+"""
+
+###############################################################################
+# Imports
+###############################################################################
+
+import os
+
+from collections import OrderedDict
+
+from pants.engine import Engine
+
+
+###############################################################################
+# FileCache Class
+###############################################################################
+
+class FileCache(object):
+    """
+    A least-recently-used cache of open files, keyed by path.
+
+    A cached file is reused until ``ttl`` seconds after it was last
+    checked. After that, the next lookup runs ``stat()`` on the path, and
+    the file is reopened if its inode, device, size or modification time
+    has changed.
+
+    Cached files are shared between everyone that opens the same path,
+    so they should be read at explicit offsets, as
+    :meth:`~pants.stream.Stream.write_file` does, rather than from their
+    current position. Files dropped from the cache are not closed
+    explicitly. They are closed once the last send using them has
+    finished and the file object is released.
+
+    ==========  ========  ============
+    Argument    Default   Description
+    ==========  ========  ============
+    size        128       *Optional.* The maximum number of files to keep open.
+    ttl         1.0       *Optional.* The number of seconds to trust a cached file before checking it again.
+    engine      None      *Optional.* The :class:`~pants.engine.Engine` whose poll time is used to tell when ``ttl`` has passed. Defaults to the global engine.
+    ==========  ========  ============
+    """
+    def __init__(self, size=128, ttl=1.0, engine=None):
+        self.engine = engine or Engine.instance()
+        self.size = size
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+
+        # path -> [file, stat, time checked]
+        self._files = OrderedDict()
+
+    def __contains__(self, path):
+        """
+        Whether or not a file is cached for the given path and still
+        within its ``ttl``.
+        """
+        entry = self._files.get(path)
+        return (entry is not None and
+                self.engine.latest_poll_time - entry[2] < self.ttl)
+
+    def __len__(self):
+        return len(self._files)
+
+    def open(self, path):
+        """
+        Return an open file object for the given path and the result of
+        ``stat()`` on it, as a 2-tuple. A cached file is returned where
+        possible.
+
+        Raises :exc:`OSError` if the path can't be found and
+        :exc:`IOError` if the file can't be opened.
+
+        =========  ============
+        Argument   Description
+        =========  ============
+        path       The path of the file to open.
+        =========  ============
+        """
+        now = self.engine.latest_poll_time
+        entry = self._files.pop(path, None)
+
+        if entry is not None:
+            if now - entry[2] < self.ttl:
+                self._files[path] = entry
+                self.hits += 1
+                return entry[0], entry[1]
+
+            stat = os.stat(path)
+            old = entry[1]
+            if (stat.st_ino == old.st_ino and stat.st_dev == old.st_dev and
+                    stat.st_size == old.st_size and
+                    stat.st_mtime == old.st_mtime):
+                entry[2] = now
+                self._files[path] = entry
+                self.hits += 1
+                return entry[0], entry[1]
+
+        else:
+            stat = os.stat(path)
+
+        self.misses += 1
+
+        f = open(path, 'rb')
+        self._files[path] = [f, stat, now]
+
+        while len(self._files) > self.size:
+            self._files.popitem(last=False)
+
+        return f, stat
+
+    def invalidate(self, path=None):
+        """
+        Drop the file for the given path from the cache, so that the next
+        lookup opens it again. If no path is given, drop every file.
+
+        =========  ============
+        Argument   Description
+        =========  ============
+        path       *Optional.* The path of the file to drop.
+        =========  ============
+        """
+        if path is None:
+            self._files.clear()
+        else:
+            self._files.pop(path, None)
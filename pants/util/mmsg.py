@@ -0,0 +1,359 @@
+###############################################################################
+#
+# Copyright 2011-2012 Pants Developers (see AUTHORS.txt)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+"""
+Batched datagram I/O using the Linux ``recvmmsg()`` and ``sendmmsg()``
+system calls, which move many datagrams per call, and support for the
+Linux UDP segmentation offloads.
+"""
+
+###############################################################################
+# Imports
+###############################################################################
+
+import os
+import socket
+import struct
+import sys
+
+import ctypes
+import ctypes.util
+
+
+###############################################################################
+# Constants
+###############################################################################
+
+MMSG_PLATFORMS = ("linux2", "linux")
+
+MSG_DONTWAIT = 0x40
+
+# Large enough for any socket address (struct sockaddr_storage).
+SOCKADDR_SIZE = 128
+
+# UDP segmentation offload, from the Linux headers. UDP_SEGMENT tells the
+# kernel to split one large send into datagrams of the given size, and
+# UDP_GRO has it deliver coalesced datagrams with their size attached as
+# a control message.
+HAS_UDP_OFFLOAD = sys.platform in MMSG_PLATFORMS
+SOL_UDP = 17
+UDP_SEGMENT = 103
+UDP_GRO = 104
+UDP_MAX_SEGMENTS = 64
+
+# The largest buffer the kernel will coalesce, and enough control space
+# for a UDP_GRO message.
+GRO_BUFFER_SIZE = 65535
+CONTROL_SIZE = 64
+
+_cmsghdr = struct.Struct("@Lii")
+_CMSG_ALIGN = ctypes.sizeof(ctypes.c_size_t)
+
+
+###############################################################################
+# Structures
+###############################################################################
+
+class _iovec(ctypes.Structure):
+    _fields_ = [
+        ("iov_base", ctypes.c_void_p),
+        ("iov_len", ctypes.c_size_t),
+        ]
+
+class _msghdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_iovec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+        ]
+
+class _mmsghdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_hdr", _msghdr),
+        ("msg_len", ctypes.c_uint),
+        ]
+
+
+###############################################################################
+# MMsgBuffers Class
+###############################################################################
+
+class MMsgBuffers(object):
+    """
+    Preallocated message headers and buffers for batched datagram I/O.
+
+    Each channel keeps its instances and reuses them for every call, so
+    moving a batch of datagrams doesn't allocate any ctypes objects
+    beyond the data itself.
+
+    =========  ============
+    Argument   Description
+    =========  ============
+    count      The maximum number of datagrams in a batch.
+    size       *Optional.* The maximum size, in bytes, of a received
+               datagram. If 0, no receive buffers are allocated and the
+               instance may only be used for sending.
+    control    *Optional.* The size, in bytes, of the buffer for each
+               datagram's control messages. If 0, control messages are
+               not received.
+    =========  ============
+    """
+    def __init__(self, count, size=0, control=0):
+        self.count = count
+        self.size = size
+        self.control_size = control
+
+        self.headers = (_mmsghdr * count)()
+        self.iovecs = (_iovec * count)()
+        self.names = [ctypes.create_string_buffer(SOCKADDR_SIZE)
+                      for i in xrange(count)]
+        self.data = [ctypes.create_string_buffer(size)
+                     for i in xrange(count if size else 0)]
+        self.control = [ctypes.create_string_buffer(control)
+                        for i in xrange(count if control else 0)]
+
+        for i in xrange(count):
+            hdr = self.headers[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(self.names[i])
+            hdr.msg_namelen = SOCKADDR_SIZE
+            hdr.msg_iov = ctypes.pointer(self.iovecs[i])
+            hdr.msg_iovlen = 1
+
+            if size:
+                self.iovecs[i].iov_base = ctypes.addressof(self.data[i])
+                self.iovecs[i].iov_len = size
+
+            if control:
+                hdr.msg_control = ctypes.addressof(self.control[i])
+                hdr.msg_controllen = control
+
+    def prepare_recv(self):
+        """
+        Reset the fields the kernel overwrites when receiving.
+        """
+        for i in xrange(self.count):
+            hdr = self.headers[i].msg_hdr
+            hdr.msg_namelen = SOCKADDR_SIZE
+            hdr.msg_controllen = self.control_size
+            hdr.msg_flags = 0
+
+
+###############################################################################
+# Address Conversion
+###############################################################################
+
+def sockaddr_to_address(buf, length):
+    """
+    Convert a raw ``struct sockaddr`` to a Python socket address.
+    """
+    raw = ctypes.string_at(buf, length)
+    family = struct.unpack("=H", raw[:2])[0]
+
+    if family == socket.AF_INET:
+        port = struct.unpack("!H", raw[2:4])[0]
+        return socket.inet_ntop(socket.AF_INET, raw[4:8]), port
+
+    elif family == socket.AF_INET6:
+        port, flowinfo = struct.unpack("!HI", raw[2:8])
+        scope_id = struct.unpack("=I", raw[24:28])[0]
+        return (socket.inet_ntop(socket.AF_INET6, raw[8:24]), port,
+                flowinfo, scope_id)
+
+    return None
+
+def address_to_sockaddr(address):
+    """
+    Convert a numeric Python socket address to a raw ``struct sockaddr``.
+
+    Raises :exc:`ValueError` if the address isn't a numeric IPv4 or IPv6
+    address.
+    """
+    try:
+        if len(address) == 2:
+            return (struct.pack("=H", socket.AF_INET) +
+                    struct.pack("!H", address[1]) +
+                    socket.inet_pton(socket.AF_INET, address[0]) +
+                    "\x00" * 8)
+
+        elif len(address) == 4:
+            return (struct.pack("=H", socket.AF_INET6) +
+                    struct.pack("!HI", address[1], address[2]) +
+                    socket.inet_pton(socket.AF_INET6, address[0]) +
+                    struct.pack("=I", address[3]))
+
+    except (socket.error, struct.error, TypeError):
+        pass
+
+    raise ValueError("Not a numeric socket address: %r" % (address,))
+
+def gro_segment_size(buf, length):
+    """
+    Find the segment size in a received ``UDP_GRO`` control message.
+
+    Returns 0 if there is no such message.
+    """
+    raw = ctypes.string_at(buf, length)
+    offset = 0
+
+    while offset + _cmsghdr.size <= length:
+        cmsg_len, level, cmsg_type = _cmsghdr.unpack_from(raw, offset)
+        if cmsg_len < _cmsghdr.size:
+            break
+
+        if level == SOL_UDP and cmsg_type == UDP_GRO:
+            data = offset + _cmsg_align(_cmsghdr.size)
+            return struct.unpack_from("@i", raw, data)[0]
+
+        offset += _cmsg_align(cmsg_len)
+
+    return 0
+
+def _cmsg_align(length):
+    return (length + _CMSG_ALIGN - 1) & ~(_CMSG_ALIGN - 1)
+
+
+###############################################################################
+# Implementations
+###############################################################################
+
+def _raise_errno():
+    e = ctypes.get_errno()
+    raise socket.error(e, os.strerror(e))
+
+def recvmmsg_linux(fileno, buffers):
+    """
+    Receive up to ``buffers.count`` datagrams from the socket in a
+    single system call.
+
+    Returns a list of ``(data, address)`` 2-tuples. Datagrams that the
+    kernel coalesced with ``UDP_GRO`` are split back into the datagrams
+    that were sent.
+
+    =========  ============
+    Argument   Description
+    =========  ============
+    fileno     The socket's file descriptor.
+    buffers    An :class:`MMsgBuffers` instance.
+    =========  ============
+    """
+    buffers.prepare_recv()
+
+    result = _recvmmsg(fileno, buffers.headers, buffers.count, MSG_DONTWAIT,
+                       None)
+    if result == -1:
+        _raise_errno()
+
+    packets = []
+    for i in xrange(result):
+        msg = buffers.headers[i]
+        data = ctypes.string_at(buffers.data[i], msg.msg_len)
+        addr = sockaddr_to_address(buffers.names[i], msg.msg_hdr.msg_namelen)
+
+        segment = 0
+        if buffers.control_size:
+            segment = gro_segment_size(buffers.control[i],
+                                       msg.msg_hdr.msg_controllen)
+
+        if segment and len(data) > segment:
+            for j in xrange(0, len(data), segment):
+                packets.append((data[j:j + segment], addr))
+        else:
+            packets.append((data, addr))
+
+    return packets
+
+def sendmmsg_linux(fileno, buffers, packets):
+    """
+    Send up to ``buffers.count`` datagrams to the socket in a single
+    system call.
+
+    Returns the number of datagrams that were sent. Raises
+    :exc:`ValueError` if the first datagram's address isn't numeric.
+
+    =========  ============
+    Argument   Description
+    =========  ============
+    fileno     The socket's file descriptor.
+    buffers    An :class:`MMsgBuffers` instance.
+    packets    A sequence of ``(data, address)`` 2-tuples.
+    =========  ============
+    """
+    count = min(len(packets), buffers.count)
+
+    # Keep references to the data until the call returns.
+    keep = []
+
+    for i in xrange(count):
+        data, address = packets[i]
+        try:
+            name = address_to_sockaddr(address)
+        except ValueError:
+            if i == 0:
+                raise
+            # Send what we have; the caller deals with this one next.
+            count = i
+            break
+        keep.append(data)
+
+        iov = buffers.iovecs[i]
+        iov.iov_base = ctypes.cast(ctypes.c_char_p(data), ctypes.c_void_p)
+        iov.iov_len = len(data)
+
+        ctypes.memmove(buffers.names[i], name, len(name))
+        buffers.headers[i].msg_hdr.msg_namelen = len(name)
+
+    result = _sendmmsg(fileno, buffers.headers, count, MSG_DONTWAIT)
+    if result == -1:
+        _raise_errno()
+
+    return result
+
+
+###############################################################################
+# Recvmmsg/Sendmmsg
+###############################################################################
+
+_recvmmsg = None
+_sendmmsg = None
+if sys.platform in MMSG_PLATFORMS:
+    _libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    if hasattr(_libc, "recvmmsg") and hasattr(_libc, "sendmmsg"):
+        _recvmmsg = _libc.recvmmsg
+        _recvmmsg.argtypes = (
+                ctypes.c_int,  # socket
+                ctypes.POINTER(_mmsghdr),  # messages
+                ctypes.c_uint,  # count
+                ctypes.c_int,  # flags
+                ctypes.c_void_p  # timeout
+                )
+
+        _sendmmsg = _libc.sendmmsg
+        _sendmmsg.argtypes = (
+                ctypes.c_int,  # socket
+                ctypes.POINTER(_mmsghdr),  # messages
+                ctypes.c_uint,  # count
+                ctypes.c_int  # flags
+                )
+
+HAS_MMSG = _recvmmsg is not None
+
+recvmmsg = recvmmsg_linux if HAS_MMSG else None
+sendmmsg = sendmmsg_linux if HAS_MMSG else None
@@ -37,9 +37,40 @@ import ctypes.util
 ###############################################################################
 
 SENDFILE_PLATFORMS = ("linux2", "darwin", "freebsd", "dragonfly")
+
+# The smallest amount the fallback implementation reads at once. It
+# reads up to the size of the socket's send buffer when that's larger.
 SENDFILE_AMOUNT = 2 ** 16
 
 
+###############################################################################
+# Helpers
+###############################################################################
+
+def _remaining(sfile, offset, nbytes):
+    """
+    Return the number of bytes to send, where an ``nbytes`` of 0 means
+    the rest of the file.
+    """
+    if nbytes:
+        return nbytes
+
+    return max(os.fstat(sfile.fileno()).st_size - offset, 0)
+
+def _chunk_size(channel):
+    """
+    Return the number of bytes to read from a file at once when sending
+    it to the channel without a native ``sendfile()``.
+    """
+    try:
+        size = channel._socket.getsockopt(socket.SOL_SOCKET,
+                                          socket.SO_SNDBUF)
+    except (socket.error, AttributeError):
+        return SENDFILE_AMOUNT
+
+    return max(size, SENDFILE_AMOUNT)
+
+
 ###############################################################################
 # Implementations
 ###############################################################################
@@ -63,11 +94,9 @@ def sendfile_fallback(sfile, channel, offset, nbytes, fallback):
     fallback   If True, the pure-Python sendfile function will be used.
     =========  ============
     """
-    # TODO Implement a better solution for the "send all bytes" argument.
-    if nbytes == 0:
-        to_read = SENDFILE_AMOUNT
-    else:
-        to_read = min(nbytes, SENDFILE_AMOUNT)
+    to_read = min(_remaining(sfile, offset, nbytes), _chunk_size(channel))
+    if to_read == 0:
+        return 0
 
     sfile.seek(offset)
     data = sfile.read(to_read)
@@ -94,10 +123,11 @@ def sendfile_linux(sfile, channel, offset, nbytes, fallback):
     if fallback:
         return sendfile_fallback(sfile, channel, offset, nbytes, fallback)
 
-    # TODO Linux doesn't support an argument of 0 for nbytes. Implement
-    #      a better solution.
+    # Linux doesn't support an argument of 0 for nbytes. Ask for the
+    # rest of the file; the kernel sends as much as the socket accepts.
+    nbytes = _remaining(sfile, offset, nbytes)
     if nbytes == 0:
-        nbytes = SENDFILE_AMOUNT
+        return 0
 
     _offset = ctypes.c_uint64(offset)
 
@@ -111,6 +141,35 @@ def sendfile_linux(sfile, channel, offset, nbytes, fallback):
 
     return result
 
+def sendfile_native(sfile, channel, offset, nbytes, fallback):
+    """
+    Implementation of ``sendfile()`` using :func:`os.sendfile`, where
+    Python provides it.
+
+    =========  ============
+    Argument   Description
+    =========  ============
+    sfile      The file to send.
+    channel    The channel to write to.
+    offset     The number of bytes to offset writing by.
+    nbytes     The number of bytes of the file to write. If 0, all bytes will be written.
+    fallback   If True, the pure-Python sendfile function will be used.
+    =========  ============
+    """
+    if fallback:
+        return sendfile_fallback(sfile, channel, offset, nbytes, fallback)
+
+    nbytes = _remaining(sfile, offset, nbytes)
+    if nbytes == 0:
+        return 0
+
+    try:
+        return os.sendfile(channel.fileno, sfile.fileno(), offset, nbytes)
+    except OSError as e:
+        err = socket.error(e.errno, e.strerror)
+        err.nbytes = 0 # See issue #43
+        raise err
+
 def sendfile_darwin(sfile, channel, offset, nbytes, fallback):
     """
     Darwin implementation of ``sendfile()``.
@@ -183,7 +242,10 @@ if sys.version_info >= (2, 6) and sys.platform in SENDFILE_PLATFORMS:
         _sendfile = _libc.sendfile
 
 sendfile = None
-if _sendfile is None:
+if hasattr(os, "sendfile"):
+    sendfile = sendfile_native
+
+elif _sendfile is None:
     sendfile = sendfile_fallback
 
 elif sys.platform == "linux2":
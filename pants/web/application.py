@@ -435,7 +435,7 @@ import urllib
 from datetime import datetime
 
 from pants.http.server import HTTPServer
-from pants.http.utils import HTTP, HTTPHeaders
+from pants.http.utils import HeaderBlock, HTTP, HTTPHeaders
 
 from pants.web.utils import decode, ERROR_PAGE, HAIKUS, HTTP_MESSAGES, \
     HTTPException, HTTPTransparentRedirect, log, NO_BODY_CODES, CONSOLE_JS
@@ -942,7 +942,7 @@ class Module(object):
     ##### Route Management Decorators #########################################
 
     def basic_route(self, rule, name=None, methods=('GET', 'HEAD'),
-                    headers=None, content_type=None, func=None):
+                    headers=None, content_type=None, priority=0, func=None):
         """
         The basic_route decorator registers a route with the Module without
         holding your hand about it.
@@ -978,6 +978,7 @@ class Module(object):
         methods        *Optional.* A list of HTTP methods to allow for this request handler. By default, only ``GET`` and ``HEAD`` requests are allowed, and all others will result in a ``405 Method Not Allowed`` error.
         headers        *Optional.* A dictionary of HTTP headers to always send with the response from this request handler. Any headers set within the request handler will override these headers.
         content_type   *Optional.* The HTTP Content-Type header to send with the response from this request handler. A Content-Type header set within the request handler will override this.
+        priority       *Optional.* How reluctant an overloaded :class:`~pants.http.server.HTTPServer` is to shed requests for this route. See :meth:`Application.request_priority`.
         func           *Optional.* The function for this view. Specifying the function bypasses the usual decorator-like behavior of this function.
         =============  ============
         """
@@ -1004,10 +1005,13 @@ class Module(object):
             if isinstance(rule_table, Module):
                 raise ValueError("The rule %r is claimed by a Module." % rule)
 
+            # Serialize the headers once, rather than for every response.
+            block = HeaderBlock(headers) if headers else None
+
             # Now, for each method, store the data.
             for method in methods:
-                rule_table[method] = (func, _name, False, False, headers,
-                                      content_type)
+                rule_table[method] = (func, _name, False, False, block,
+                                      content_type, priority)
 
             # Recalculate routes and return.
             self._recalculate_routes()
@@ -1018,7 +1022,7 @@ class Module(object):
         return decorator
 
     def route(self, rule, name=None, methods=('GET','HEAD'), auto404=False,
-              headers=None, content_type=None, func=None):
+              headers=None, content_type=None, priority=0, func=None):
         """
         The route decorator is used to register a new route with the Module
         instance. Example::
@@ -1040,6 +1044,7 @@ class Module(object):
         auto404        *Optional.* If this is set to True, all response handler arguments will be checked for truthiness (True, non-empty strings, etc.) and, if any fail, a ``404 Not Found`` page will be rendered automatically.
         headers        *Optional.* A dictionary of HTTP headers to always send with the response from this request handler. Any headers set within the request handler will override these headers.
         content_type   *Optional.* The HTTP Content-Type header to send with the response from this request handler. A Content-Type header set within the request handler will override this.
+        priority       *Optional.* How reluctant an overloaded :class:`~pants.http.server.HTTPServer` is to shed requests for this route. See :meth:`Application.request_priority`.
         func           *Optional.* The function for this view. Specifying the function bypasses the usual decorator-like behavior of this function.
         =============  ============
         """
@@ -1066,9 +1071,13 @@ class Module(object):
             if isinstance(rule_table, Module):
                 raise ValueError("The rule %r is claimed by a Module." % rule)
 
+            # Serialize the headers once, rather than for every response.
+            block = HeaderBlock(headers) if headers else None
+
             # Now, for each method, store the data.
             for method in methods:
-                rule_table[method] = (func, _name, True, auto404, headers, content_type)
+                rule_table[method] = (func, _name, True, auto404, block,
+                                      content_type, priority)
 
             # Recalculate and return.
             self._recalculate_routes()
@@ -1269,8 +1278,8 @@ class Application(Module):
             method_table = rl[4]
 
             # Iterate through all the methods this rule provides.
-            for method, (func, name, advanced, auto404, headers, content_type) \
-                    in table.iteritems():
+            for method, (func, name, advanced, auto404, headers, content_type,
+                         priority) in table.iteritems():
                 method = method.upper()
                 if method == 'GET' or rl[3] is None:
                     if nameprefix:
@@ -1286,9 +1295,11 @@ class Application(Module):
                     else:
                         method_table[method] = _get_runner(func, converters,
                                                             auto404), headers, \
-                                                            content_type, hooks
+                                                            content_type, hooks, \
+                                                            priority
                 else:
-                    method_table[method] = func, headers, content_type, hooks
+                    method_table[method] = func, headers, content_type, hooks, \
+                                           priority
 
             # Update the name table.
             self._name_table[rl[3]] = rl
@@ -1366,19 +1377,43 @@ class Application(Module):
             Application.current_app = None
             self.request = None
 
-    def route_request(self, request):
+    def request_priority(self, request):
         """
-        Determine which request handler to use for the given request, execute
-        that handler, and return its output.
+        Return the priority of the route that the given request would be
+        sent to, for an overloaded :class:`~pants.http.server.HTTPServer`
+        deciding whether to shed it. A request with priority *n* is only
+        shed once the server's load is *n* + 1 times its limits, so a route
+        with a high priority, such as a health check, keeps working while
+        other requests are being shed. Requests that match no route have a
+        priority of 0.
+        """
+        name, match, handler, available_methods = self._match_route(request)
+        if handler is None:
+            return 0
+        return handler[4]
+
+    def _match_route(self, request):
+        """
+        Find the route that the given request is sent to.
+
+        Returns a ``(name, match, handler, available_methods)`` tuple, where
+        ``handler`` is the route's entry for the request method. If no route
+        matches, ``name``, ``match`` and ``handler`` are None and
+        ``available_methods`` is the set of methods that routes matching the
+        path do allow. The result is kept on the request, so a request that
+        was looked at by :meth:`request_priority` isn't matched again when
+        it's routed.
         """
+        route = getattr(request, '_route', None)
+        if route is not None and route[0] is self:
+            return route[1]
+
         domain = request.hostname
         path = urllib.unquote_plus(request.path)
         matcher = domain + path
         method = request.method.upper()
         available_methods = set()
-
-        request._rule_headers = None
-        request._rule_content_type = None
+        result = None
 
         for dmn, dkey, rules in self._route_list:
             # Do basic domain matching.
@@ -1402,63 +1437,89 @@ class Application(Module):
                     available_methods.update(method_table.keys())
                     continue
 
-                # It's a match. Run the method and return the result.
-                request.route_name = name
-                request.match = match
+                result = (name, match, method_table[method], available_methods)
+                break
 
-                try:
-                    func, headers, content_type, hooks = method_table[method]
-                    request._rule_headers = headers
-                    request._rule_content_type = content_type
-                    request._hooks = hooks
+            if result is not None:
+                break
+
+        if result is None:
+            result = (None, None, None, available_methods)
+
+        request._route = (self, result)
+        return result
+
+    def route_request(self, request):
+        """
+        Determine which request handler to use for the given request, execute
+        that handler, and return its output.
+        """
+        path = urllib.unquote_plus(request.path)
+        method = request.method.upper()
 
-                    hks = hooks.get('request_started')
+        request._rule_headers = None
+        request._rule_content_type = None
+
+        name, match, handler, available_methods = self._match_route(request)
+        if handler is not None:
+            # It's a match. Run the method and return the result.
+            request.route_name = name
+            request.match = match
+
+            try:
+                func, headers, content_type, hooks, priority = handler
+                request._rule_headers = headers
+                request._rule_content_type = content_type
+                request._hooks = hooks
+
+                hks = hooks.get('request_started')
+                if hks:
+                    for hf in hks:
+                        hf(request)
+
+                output = func(request)
+
+                if request.auto_finish:
+                    hks = hooks.get('request_finished')
                     if hks:
+                        # Make sure the request_finished handler always gets
+                        # an instance of Response. This way, it's always
+                        # possible for it to be changed without taking
+                        # return values.
+                        if not isinstance(output, Response):
+                            if isinstance(output, tuple):
+                                out = Response(*output)
+                            else:
+                                out = Response(output)
+
                         for hf in hks:
-                            hf(request)
+                            hf(request, output)
 
-                    output = func(request)
-
-                    if request.auto_finish:
-                        hks = hooks.get('request_finished')
-                        if hks:
-                            # Make sure the request_finished handler always gets
-                            # an instance of Response. This way, it's always
-                            # possible for it to be changed without taking
-                            # return values.
-                            if not isinstance(output, Response):
-                                if isinstance(output, tuple):
-                                    out = Response(*output)
-                                else:
-                                    out = Response(output)
-
-                            for hf in hks:
-                                hf(request, output)
-
-                    return output
-
-                except HTTPException as err:
-                    request._rule_headers = None
-                    request._rule_content_type = None
-
-                    err_handler = getattr(self, "handle_%d" % err.status, None)
-                    if err_handler:
-                        return err_handler(request, err)
-                    else:
-                        return error(err.message, err.status, err.headers,
-                                     request=request)
-                except HTTPTransparentRedirect as err:
-                    request._rule_headers = None
-                    request._rule_content_type = None
-
-                    request.url = err.url
-                    request._parse_url()
-                    return self.route_request(request)
-                except Exception as err:
-                    request._rule_headers = None
-                    request._rule_content_type = None
+                return output
 
-                    return self.handle_500(request, err)
+            except HTTPException as err:
+                request._rule_headers = None
+                request._rule_content_type = None
+
+                err_handler = getattr(self, "handle_%d" % err.status, None)
+                if err_handler:
+                    return err_handler(request, err)
+                else:
+                    return error(err.message, err.status, err.headers,
+                                 request=request)
+            except HTTPTransparentRedirect as err:
+                request._rule_headers = None
+                request._rule_content_type = None
+
+                request.url = err.url
+                request._parse_url()
+                request._route = None
+                return self.route_request(request)
+            except Exception as err:
+                request._rule_headers = None
+                request._rule_content_type = None
+
+                return self.handle_500(request, err)
 
         if available_methods:
             if request.method == 'OPTIONS':
@@ -1473,8 +1534,9 @@ class Application(Module):
             # If there are no matching routes, and the path doesn't end with a
             # slash, try adding the slash.
             if not path[-1] == "/":
+                domain = request.hostname
                 path += "/"
-                matcher += "/"
+                matcher = domain + path
                 for dmn, dkey, rules in self._route_list:
                     if ':' in dmn:
                         if not request.host.lower().endswith(dmn):
@@ -1527,19 +1589,27 @@ class Application(Module):
             else:
                 status = 200
 
-        # Use the rule headers stuff.
-        if request._rule_headers:
-            if isinstance(request._rule_headers, HTTPHeaders):
-                rule_headers = request._rule_headers.copy()
-            else:
-                rule_headers = HTTPHeaders(request._rule_headers)
+        # Use the rule headers stuff. If the response doesn't replace any of
+        # them, they're sent pre-serialized.
+        block = None
+        rule_headers = request._rule_headers
+        if rule_headers:
+            if isinstance(rule_headers, HeaderBlock) and \
+                    not rule_headers.conflicts(headers):
+                block = rule_headers
 
-            if isinstance(headers, HTTPHeaders):
-                rule_headers._data.update(headers._data)
             else:
-                rule_headers.update(headers)
+                if isinstance(rule_headers, HTTPHeaders):
+                    rule_headers = rule_headers.copy()
+                else:
+                    rule_headers = HTTPHeaders(rule_headers)
+
+                if isinstance(headers, HTTPHeaders):
+                    rule_headers._data.update(headers._data)
+                else:
+                    rule_headers.update(headers)
 
-            headers = rule_headers
+                headers = rule_headers
 
         # Determine if we're sending a body.
         send_body = request.method.upper() != 'HEAD' and status not in NO_BODY_CODES
@@ -1611,7 +1681,7 @@ class Application(Module):
 
         # Send the response.
         request.send_status(status)
-        request.send_headers(headers)
+        request.send_headers(headers, block=block)
 
         if send_body:
             request.write(body)
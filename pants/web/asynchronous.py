@@ -272,7 +272,7 @@ def _stream_output(request, output):
         if not output or output is Finished:
             # We're finished.
             if request._chunked:
-                request.write("0\r\n\r\n\r\n")
+                request.send_chunk("")
 
             request.finish()
             _cleanup(request)
@@ -291,7 +291,7 @@ def _stream_output(request, output):
             return
 
         if request._chunked:
-            request.write("%x\r\n%s\r\n" % (len(output), output))
+            request.send_chunk(output)
 
         return Again
 
@@ -373,7 +373,7 @@ def _stream_output(request, output):
 
     if output is not None:
         if request._chunked:
-            request.write("%x\r\n%s\r\n" % (len(output), output))
+            request.send_chunk(output)
         else:
             request.write(output)
 
@@ -887,8 +887,14 @@ def _do(request, input, as_exception=False):
             errored = False
 
             with request._context as app:
-                # Make sure we're connected.
-                if not request.connection.connected:
+                # Make sure we're connected, and that the connection
+                # hasn't been recycled for another client.
+                try:
+                    connected = request.connection.connected
+                except RuntimeError:
+                    connected = False
+
+                if not connected:
                     try:
                         # Bubble up an error so the user's code can do something
                         # about this.
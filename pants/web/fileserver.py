@@ -203,9 +203,16 @@ class FileServer(object):
         # Normalize the path.
         full_path = os.path.normpath(os.path.join(self.path, path))
 
-        # Validate the request.
+        # Validate the request. A file that's in the server's file cache
+        # is known to exist, so the checks can be skipped.
+        cache = getattr(request.connection.server, 'file_cache', None)
         if not full_path.startswith(self.path):
             abort(403)
+        elif cache is not None and full_path in cache:
+            self.check_blacklist(full_path)
+            request.auto_finish = False
+            request.send_file(full_path)
+            return
         elif not os.path.exists(full_path):
             abort()
         elif not os.access(full_path, os.R_OK):
@@ -137,7 +137,9 @@ class WSGIConnector(object):
                 request.send_headers(request._headers)
 
             if request._chunk_it:
-                request.write("%x\r\n%s\r\n" % (len(data), data))
+                # An empty chunk would end the response.
+                if data:
+                    request.send_chunk(data)
             else:
                 request.write(data)
 
@@ -179,6 +181,12 @@ class WSGIConnector(object):
             else:
                 routing_args = None
 
+        # A multipart/form-data body is spooled to a file rather than kept
+        # in the request's body.
+        body_file = request.body_file
+        if body_file is None:
+            body_file = cStringIO.StringIO(request.body)
+
         # Build an environment for the WSGI application.
         environ = {
             'REQUEST_METHOD'    : request.method,
@@ -192,7 +200,7 @@ class WSGIConnector(object):
             'GATEWAY_INTERFACE' : 'WSGI/1.0',
             'wsgi.version'      : (1,0),
             'wsgi.url_scheme'   : request.scheme,
-            'wsgi.input'        : cStringIO.StringIO(request.body),
+            'wsgi.input'        : body_file,
             'wsgi.errors'       : sys.stderr,
             'wsgi.multithread'  : False,
             'wsgi.multiprocess' : False,
@@ -243,7 +251,7 @@ class WSGIConnector(object):
             if request._started:
                 # We can't recover, so close the connection.
                 if request._chunk_it:
-                    request.write("0\r\n\r\n\r\n")
+                    request.send_chunk("")
                 request.connection.close(True)
                 return
 
@@ -274,6 +282,6 @@ class WSGIConnector(object):
         if not request._started:
             write('')
         if request._chunk_it:
-            request.write("0\r\n\r\n\r\n")
+            request.send_chunk("")
 
         request.finish()